@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark the churn log parser against the original line-splitting parser.
+
+Generates a synthetic `git log --numstat --pretty=` output, as text and as
+NUL-separated `-z` output, and reports wall time, peak traced memory and
+the allocations held at the peak per numstat line for the original text
+parser and the bytes parsers:
+
+    poetry run python benchmarks/benchmark_churn_parser.py --lines 10000000
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from git_outlier.git_outlier import parse_churn_from_log
+
+
+def legacy_parse_churn_from_log(log: str) -> Tuple[Dict[str, int], List[str]]:
+    churn: Dict[str, int] = {}
+    file_names: List[str] = []
+    for line in log.splitlines():
+        parts = line.split()
+        file_name = parts[2] if len(parts) >= 3 else ""
+        if file_name != "":
+            if file_name in churn:
+                churn[file_name] += 1
+            else:
+                churn[file_name] = 1
+                file_names.append(file_name)
+    return churn, file_names
+
+
+def generate_logs(
+    lines: int, paths: int, seed: int, localized: float
+) -> Tuple[bytes, bytes]:
+    """The same log as text lines and as -z records"""
+    rng = random.Random(seed)
+    names = [
+        f"src/module{index % 97}/package{index % 13}/"
+        + ("größe datei" if rng.random() < localized else "file")
+        + f"{index}.py"
+        for index in range(paths)
+    ]
+    text = []
+    nul_separated = []
+    for _ in range(lines):
+        name = names[min(int(rng.paretovariate(1.1)) - 1, paths - 1)]
+        added, deleted = rng.randrange(200), rng.randrange(200)
+        text.append(f"{added}\t{deleted}\t{name}\n")
+        nul_separated.append(f"{added}\t{deleted}\t{name}\0")
+    return "".join(text).encode(), "".join(nul_separated).encode()
+
+
+def count_peak_blocks(parse: Callable, log) -> int:
+    """Most memory blocks allocated at once while parsing, above those before it.
+
+    CPython only counts the blocks currently allocated, so another thread
+    samples the count while the parser runs.
+    """
+    baseline = sys.getallocatedblocks()
+    peak = 0
+    done = threading.Event()
+
+    def sample() -> None:
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, sys.getallocatedblocks() - baseline)
+            time.sleep(0)
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-4)
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    try:
+        result = parse(log)
+        peak = max(peak, sys.getallocatedblocks() - baseline)
+    finally:
+        done.set()
+        sampler.join()
+        sys.setswitchinterval(switch_interval)
+    del result
+    return peak
+
+
+def measure(parse: Callable, log) -> Tuple[float, int, int]:
+    # Time and memory are measured in separate runs, tracing distorts timing
+    started = time.perf_counter()
+    parse(log)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    parse(log)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, count_peak_blocks(parse, log)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--paths", type=int, default=50_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--localized",
+        type=float,
+        default=0.0,
+        help="Share of paths with spaces and non-ASCII characters",
+    )
+    args = parser.parse_args()
+
+    raw_log, nul_log = generate_logs(args.lines, args.paths, args.seed, args.localized)
+    text_log = raw_log.decode()
+    exact, _ = parse_churn_from_log(nul_log)
+    legacy, _ = legacy_parse_churn_from_log(text_log)
+    miscounted = sum(1 for name, count in exact.items() if legacy.get(name) != count)
+
+    print(f"{args.lines} lines, {args.paths} paths, {len(raw_log) >> 20} MiB log")
+    results = [
+        ("legacy text", *measure(legacy_parse_churn_from_log, text_log)),
+        ("bytes lines", *measure(parse_churn_from_log, raw_log)),
+        ("bytes -z", *measure(parse_churn_from_log, nul_log)),
+    ]
+    legacy_time, legacy_peak = results[0][1], results[0][2]
+    for name, elapsed, peak, blocks in results:
+        print(
+            f"{name:12} {elapsed:7.2f} s  peak {peak >> 20:6} MiB  "
+            f"{blocks / args.lines:6.2f} allocations/line  "
+            f"speedup {legacy_time / elapsed:4.1f}x  "
+            f"memory {legacy_peak / max(peak, 1):6.1f}x less"
+        )
+    print(f"paths miscounted by the legacy parser: {miscounted} of {len(exact)}")
+
+
+if __name__ == "__main__":
+    main()
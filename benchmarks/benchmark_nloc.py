@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Benchmark the NLOC scanner against lizard's parser.
+
+Counts the lines of code of the given files, or of the package's own sources,
+with both and reports the best of several runs and the difference in counts:
+
+    poetry run python benchmarks/benchmark_nloc.py --repeat 5 src/*.c
+"""
+
+import argparse
+import glob
+import time
+from typing import Callable, List
+
+import lizard
+
+from git_outlier.nloc import count_nloc
+
+
+def lizard_nloc(file_name: str, content: bytes) -> int:
+    code = content.decode("utf-8-sig", "ignore")
+    return lizard.analyze_file.analyze_source_code(file_name, code).nloc
+
+
+def best_time(function: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    file_names: List[str] = args.files or glob.glob("git_outlier/*.py")
+    contents = []
+    for file_name in file_names:
+        with open(file_name, "rb") as source:
+            contents.append((file_name, source.read()))
+
+    ours = sum(count_nloc(name, content) for name, content in contents)
+    theirs = sum(lizard_nloc(name, content) for name, content in contents)
+    scanner_time = best_time(
+        lambda: [count_nloc(name, content) for name, content in contents],
+        args.repeat,
+    )
+    lizard_time = best_time(
+        lambda: [lizard_nloc(name, content) for name, content in contents],
+        args.repeat,
+    )
+
+    size = sum(len(content) for _, content in contents)
+    print(f"{len(contents)} files, {size >> 10} KiB")
+    print(f"scanner {scanner_time:7.3f} s  {ours} lines of code")
+    print(f"lizard  {lizard_time:7.3f} s  {theirs} lines of code")
+    print(
+        f"speedup {lizard_time / scanner_time:.1f}x, "
+        f"difference {(ours - theirs) / max(theirs, 1):+.2%}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 #!/bin/bash
 # Run coverage on unit tests only (exclude integration tests)
-coverage run --source git_outlier -m pytest test/test_outlier.py test/test_date_parameters.py test/test_error_handling.py test/test_output_functions.py test/test_main_integration.py test/test_plot_generation.py
+coverage run --source git_outlier -m pytest test/test_outlier.py test/test_date_parameters.py test/test_error_handling.py test/test_output_functions.py test/test_main_integration.py test/test_plot_generation.py test/test_sketches.py test/test_ledger.py test/test_progress.py test/test_rollup.py test/test_spill.py test/test_shard.py test/test_whitespace.py test/test_nloc.py test/test_blame.py
 coverage html
 firefox htmlcov/index.html
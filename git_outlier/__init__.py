@@ -0,0 +1,25 @@
+from git_outlier.git_outlier import (
+    AnalysisCoverage,
+    AnalysisResult,
+    Analyzer,
+    AnalyzerPlugin,
+    FileMetrics,
+    GitCommandError,
+    GitOutlierError,
+    InvalidArgumentError,
+    NotAGitRepositoryError,
+    RepositoryPathError,
+)
+
+__all__ = [
+    "AnalysisCoverage",
+    "AnalysisResult",
+    "Analyzer",
+    "AnalyzerPlugin",
+    "FileMetrics",
+    "GitCommandError",
+    "GitOutlierError",
+    "InvalidArgumentError",
+    "NotAGitRepositoryError",
+    "RepositoryPathError",
+]
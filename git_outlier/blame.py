@@ -0,0 +1,61 @@
+"""Age of the lines of a file, from the output of git blame --porcelain."""
+
+import re
+from typing import Dict, List, NamedTuple, Tuple
+
+# The first line of each group of lines from one commit ends with the group's
+# line count, and the first group of a commit is followed by its headers.
+# Lines of content start with a tab, so neither pattern matches them.
+PORCELAIN_PATTERN = re.compile(
+    rb"^(?:([0-9a-f]{40,64}) \d+ \d+ (\d+)|committer-time (\d+))$", re.MULTILINE
+)
+
+SECONDS_PER_DAY = 86400
+
+# How many lines of a file are as old as each commit time, oldest first
+LineTimes = List[Tuple[int, int]]
+
+
+class CodeAge(NamedTuple):
+    lines: int
+    # Age of the median line at the reference time
+    median_days: float
+    # Share of the lines committed before the cutoff time
+    old_share: float
+
+
+def parse_blame_porcelain(output: bytes) -> LineTimes:
+    """Lines per commit time, taken from the commits that last changed them"""
+    line_counts: Dict[bytes, int] = {}
+    commit_times: Dict[bytes, int] = {}
+    commit = b""
+    for group_commit, count, committer_time in PORCELAIN_PATTERN.findall(output):
+        if group_commit:
+            commit = group_commit
+            line_counts[commit] = line_counts.get(commit, 0) + int(count)
+        else:
+            commit_times[commit] = int(committer_time)
+
+    lines_by_time: Dict[int, int] = {}
+    for commit, count in line_counts.items():
+        time = commit_times[commit]
+        lines_by_time[time] = lines_by_time.get(time, 0) + count
+    return sorted(lines_by_time.items())
+
+
+def get_code_age(line_times: LineTimes, reference: int, cutoff: int) -> CodeAge:
+    """Median line age at the reference time and the share of lines before cutoff"""
+    lines = sum(count for _, count in line_times)
+    if not lines:
+        return CodeAge(0, 0.0, 0.0)
+    old_lines = sum(count for time, count in line_times if time < cutoff)
+
+    # The lower median, counting lines from the oldest
+    median_index = (lines - 1) // 2
+    seen = 0
+    for time, count in line_times:
+        seen += count
+        if seen > median_index:
+            break
+    median_days = max(0, reference - time) / SECONDS_PER_DAY
+    return CodeAge(lines, median_days, old_lines / lines)
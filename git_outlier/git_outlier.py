@@ -1,68 +1,174 @@
 #!/usr/bin/env python3
 
 import logging
+import re
 import subprocess
 import os
 import argparse
 import sys
-from datetime import date
+import json
+import threading
+import bisect
+import math
+import random
+import time
+import heapq
+import abc
+import codecs
+import mmap
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from array import array
+from collections import Counter
+from datetime import date, datetime
+from functools import lru_cache
+from importlib.metadata import entry_points
 from dateutil.relativedelta import relativedelta
 from dateutil.parser import parse as parse_date
 from typing import Dict, List, Tuple, Union, Any, Optional, Sequence
+from typing import Iterable, Iterator, NamedTuple, IO, Set, Callable, Container, Type
 import lizard
 
+from git_outlier.blame import CodeAge, LineTimes, get_code_age, parse_blame_porcelain
+from git_outlier.ledger import CommitLedger, CommitRecord, FileChange
+from git_outlier.progress import ProgressReporter
+from git_outlier.shard import ChurnRecord, Shard, SliceCoverage, get_path_part
+from git_outlier.shard import load_shard, merge_shards, parse_slice, save_shard
+from git_outlier.rollup import DirectoryNode, build_directory_tree, find_directory
+from git_outlier.rollup import choose_rollup_depth, get_rollup_units
+from git_outlier.sketches import SpaceSaving
+from git_outlier.spill import SpillingCounter
+from git_outlier.nloc import count_nloc
+from git_outlier.whitespace import get_indentation_complexity
 
-def get_git_log_in_current_directory(
-    start_date: str, end_date: Optional[str] = None
-) -> str:
-    pipe = subprocess.PIPE
 
+class GitOutlierError(Exception):
+    """Raised instead of exiting, exit_code is what the command line exits with"""
+
+    exit_code = 1
+
+
+class GitCommandError(GitOutlierError):
+    """A git command could not be run or failed"""
+
+
+class NotAGitRepositoryError(GitCommandError):
+    exit_code = 128  # Git's standard exit code for "not a git repository"
+
+
+class InvalidArgumentError(GitOutlierError, ValueError):
+    """An unknown metric, language, date or threshold policy"""
+
+
+class RepositoryPathError(GitOutlierError):
+    """The directory of the repository cannot be entered or left"""
+
+
+COMMIT_MARKER = b"\x01"
+
+
+def get_git_log_command(
+    start_date: Optional[str],
+    end_date: Optional[str] = None,
+    paths: Optional[List[str]] = None,
+    revisions: Optional[str] = None,
+) -> List[str]:
     git_command = [
         "git",
         "log",
         "--numstat",
+        "-z",
         "--no-merges",
-        f"--since={start_date}",
-        "--pretty=",
     ]
 
+    # A missing start date means the whole history of the revisions
+    if start_date:
+        git_command.append(f"--since={start_date}")
     # Add --until parameter if end_date is provided
     if end_date:
-        git_command.insert(-1, f"--until={end_date}")
+        git_command.append(f"--until={end_date}")
+    # One marker byte per commit, so a progress reporter can count commits
+    git_command.append(f"--pretty=format:{COMMIT_MARKER.decode()}")
+    if revisions:
+        git_command.append(revisions)
+    # Restrict the log to exactly these paths, without glob expansion
+    if paths:
+        git_command.append("--")
+        git_command.extend(f":(literal){path}" for path in paths)
+    return git_command
+
+
+def get_git_log_in_current_directory(
+    start_date: Optional[str],
+    end_date: Optional[str] = None,
+    paths: Optional[List[str]] = None,
+    revisions: Optional[str] = None,
+    cwd: Optional[str] = None,
+) -> bytes:
+    pipe = subprocess.PIPE
+
+    git_command = get_git_log_command(start_date, end_date, paths, revisions)
     logging.info(f"Git command: {git_command}")
     try:
         process = subprocess.Popen(
             git_command,
+            cwd=cwd,
             stdout=pipe,
             stderr=pipe,
-            universal_newlines=True,
-        )
-        stdoutput, stderroutput = process.communicate()
-
-        # Check if git command failed (e.g., not in a git repository)
-        if process.returncode != 0:
-            if "not a git repository" in stderroutput.lower():
-                logging.error("fatal: not a git repository")
-                sys.exit(128)  # Git's standard exit code for "not a git repository"
-            elif "does not have any commits yet" in stderroutput.lower():
-                # Empty repository with no commits - return empty string instead of exiting
-                logging.info("Repository has no commits yet")
-                return ""
-            else:
-                logging.error(f"Git command failed: {stderroutput}")
-                sys.exit(1)
+        )
     except OSError as err:
-        logging.error(f"OS error: {err}")
-        sys.exit(1)
-    except Exception as err:
-        logging.error("Unexpected error: %s", err)
-        logging.error("Trying to execute the following subprocess: %s", git_command)
-        logging.error("Git problem, exiting...")
-        sys.exit(1)
+        raise GitCommandError(f"OS error: {err}") from err
+    stdoutput, stderroutput = process.communicate()
 
+    # Check if git command failed (e.g., not in a git repository)
+    if process.returncode != 0:
+        check_git_log_error(stderroutput)
+        # Empty repository with no commits - return empty log instead of exiting
+        return b""
     return stdoutput
 
 
+def check_git_log_error(stderroutput: bytes) -> None:
+    """Raise on a failed git log, unless the repository just has no commits yet"""
+    message = stderroutput.decode("utf-8", "replace")
+    if "not a git repository" in message.lower():
+        raise NotAGitRepositoryError("fatal: not a git repository")
+    elif "does not have any commits yet" in message.lower():
+        logging.info("Repository has no commits yet")
+    else:
+        raise GitCommandError(f"Git command failed: {message}")
+
+
+STREAM_READ_SIZE = 1 << 16
+
+
+def stream_git_log_in_current_directory(
+    start_date: str, end_date: Optional[str] = None, cwd: Optional[str] = None
+) -> Iterator[bytes]:
+    """Yield the git log in chunks as it is produced, without buffering all of it"""
+    git_command = get_git_log_command(start_date, end_date)
+    logging.info(f"Git command: {git_command}")
+    try:
+        process = subprocess.Popen(
+            git_command,
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    except OSError as err:
+        raise GitCommandError(f"OS error: {err}") from err
+    assert process.stdout is not None and process.stderr is not None
+    while True:
+        chunk = process.stdout.read1(STREAM_READ_SIZE)  # type: ignore
+        if not chunk:
+            break
+        yield chunk
+    stderroutput = process.stderr.read()
+    process.wait()
+    if process.returncode != 0:
+        check_git_log_error(stderroutput)
+
+
 def parse_filename_from_log(line: str) -> str:
     parts = line.split()
     if len(parts) >= 3:
@@ -70,18 +176,683 @@ def parse_filename_from_log(line: str) -> str:
     return ""
 
 
-def parse_churn_from_log(log: str) -> Tuple[Dict[str, int], List[str]]:
-    churn: Dict[str, int] = {}
-    file_names: List[str] = []
-    for line in log.splitlines():
-        file_name = parse_filename_from_log(line)
-        if file_name != "":
-            if file_name in churn:
-                churn[file_name] += 1
-            else:
-                churn[file_name] = 1
-                file_names.append(file_name)
-    return churn, file_names
+# The third whitespace-separated field of a numstat line is the path
+NUMSTAT_PATH_PATTERN = re.compile(rb"^[ \t]*\S+[ \t]+\S+[ \t]+(\S+)", re.MULTILINE)
+# With -z a numstat record is "added\tdeleted\tpath\0", or for a rename
+# "added\tdeleted\t\0old path\0new path\0". Paths are not quoted.
+NUMSTAT_Z_PATTERN = re.compile(rb"[-\d]+\t[-\d]+\t(?:\0[^\0]*\0)?([^\0]*)\0")
+NUMSTAT_Z_HEADER = re.compile(rb"[-\d]+\t[-\d]+\t")
+PARSE_CHUNK_SIZE = 1 << 20
+
+
+def decode_path(raw_path: bytes) -> str:
+    # Undecodable bytes survive and encode back to the same path
+    return raw_path.decode("utf-8", "surrogateescape")
+
+
+class PathTable:
+    """Interns paths to small integer ids and keeps their counters in an array.
+
+    Raw paths are decoded once, when first seen, so the parser never builds a
+    string per log line.
+    """
+
+    def __init__(self) -> None:
+        self.ids: Dict[bytes, int] = {}
+        self.names: List[str] = []
+        self.counts = array("L")
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, raw_path: bytes, count: int = 1) -> int:
+        path_id = self.ids.get(raw_path)
+        if path_id is None:
+            path_id = len(self.names)
+            self.ids[raw_path] = path_id
+            self.names.append(decode_path(raw_path))
+            self.counts.append(count)
+        else:
+            self.counts[path_id] += count
+        return path_id
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(zip(self.names, self.counts))
+
+
+def iterate_log_chunks(
+    log: bytes, chunk_size: int = PARSE_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Split a log into chunks of roughly chunk_size bytes at line boundaries"""
+    start = 0
+    while start < len(log):
+        end = log.find(b"\n", start + chunk_size)
+        if end == -1:
+            end = len(log)
+        yield log[start : end + 1]
+        start = end + 1
+
+
+def find_record_boundary(log: bytes) -> int:
+    """Offset where the last -z numstat record in the log starts, 0 if none does"""
+    position = log.rfind(b"\0")
+    while position != -1:
+        if NUMSTAT_Z_HEADER.match(log, position + 1):
+            return position + 1
+        position = log.rfind(b"\0", 0, position)
+    return 0
+
+
+def iterate_numstat_paths(chunks: Iterable[bytes]) -> Iterator[List[bytes]]:
+    """Raw new paths of the -z numstat records in a stream of arbitrary chunks"""
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        # Records cut off by the end of the chunk wait for the next one
+        boundary = find_record_boundary(pending)
+        if boundary:
+            yield NUMSTAT_Z_PATTERN.findall(pending, 0, boundary)
+            pending = pending[boundary:]
+    if pending:
+        yield NUMSTAT_Z_PATTERN.findall(pending)
+
+
+def parse_churn_table_from_log(log: Union[str, bytes]) -> PathTable:
+    if isinstance(log, str):
+        log = log.encode("utf-8", "surrogateescape")
+    table = PathTable()
+    if b"\0" in log:
+        path_lists = iterate_numstat_paths(
+            log[start : start + PARSE_CHUNK_SIZE]
+            for start in range(0, len(log), PARSE_CHUNK_SIZE)
+        )
+    else:
+        # Plain numstat lines, as written without -z
+        path_lists = (
+            NUMSTAT_PATH_PATTERN.findall(chunk) for chunk in iterate_log_chunks(log)
+        )
+    add_path_counts(table, path_lists)
+    return table
+
+
+def add_path_counts(table: PathTable, path_lists: Iterable[List[bytes]]) -> None:
+    for raw_paths in path_lists:
+        # Counting a chunk at a time keeps the matched paths short-lived
+        for raw_path, count in Counter(raw_paths).items():
+            table.add(raw_path, count)
+
+
+def parse_churn_from_log(log: Union[str, bytes]) -> Tuple[Dict[str, int], List[str]]:
+    table = parse_churn_table_from_log(log)
+    return table.as_dict(), table.names
+
+
+def parse_churn_from_chunks(
+    chunks: Iterable[bytes],
+) -> Tuple[Dict[str, int], List[str]]:
+    """Churn from a -z log streamed in chunks of any size"""
+    table = PathTable()
+    add_path_counts(table, iterate_numstat_paths(chunks))
+    return table.as_dict(), table.names
+
+
+# Saved logs are parsed in chunks of at most this size, several per worker.
+# Standard input cannot be mapped, it is read in chunks of this size.
+LOG_FILE_CHUNK_SIZE = 1 << 24
+# How much of the start of a saved log tells its format
+LOG_FORMAT_PROBE_SIZE = 1 << 16
+# Without -z a numstat line holds the path as is, unless git quoted it or
+# wrote a rename as "old => new" or "dir/{old => new}/file"
+NUMSTAT_LINE_PATTERN = re.compile(rb"^[-\d]+\t[-\d]+\t([^\r\n]*)", re.MULTILINE)
+RENAME_PATTERN = re.compile(rb"^(.*)\{(.*) => (.*)\}(.*)$")
+
+# What separates the commits of a log, and the offset in it where the next
+# commit starts
+CommitSeparator = Tuple[bytes, int]
+
+
+def get_commit_separator(head: bytes) -> Optional[CommitSeparator]:
+    """How the commits of a log are told apart, by the first commit of the log
+
+    Our own logs start every commit with the marker and git's default format
+    with "commit <hash>". Other plain logs can be split at any line, each
+    numstat line stands on its own. None for -z logs of other formats, which
+    are parsed in one piece.
+    """
+    if head.startswith(COMMIT_MARKER):
+        return COMMIT_MARKER, 0
+    zero_separated = b"\0" in head
+    if head.startswith(b"commit "):
+        return (b"\0commit ", 1) if zero_separated else (b"\ncommit ", 1)
+    return None if zero_separated else (b"\n", 1)
+
+
+def split_log(
+    log: Union[bytes, mmap.mmap],
+    chunk_size: int,
+    separator: Optional[CommitSeparator],
+) -> Iterator[Tuple[int, int]]:
+    """Ranges of at least chunk_size bytes of the log, each starting at a commit"""
+    start = 0
+    while start < len(log):
+        end = len(log)
+        if separator is not None:
+            found = log.find(separator[0], start + chunk_size)
+            if found != -1:
+                end = found + separator[1]
+        yield start, end
+        start = end
+
+
+def resolve_numstat_path(raw_path: bytes) -> bytes:
+    """The new path of a numstat line without -z, unquoted"""
+    match = RENAME_PATTERN.match(raw_path)
+    if match:
+        prefix, _, new, suffix = match.groups()
+        # A rename from or to the directory itself leaves an empty part
+        raw_path = (prefix + new + suffix).replace(b"//", b"/")
+    elif b" => " in raw_path:
+        raw_path = raw_path.split(b" => ", 1)[1]
+    if raw_path.startswith(b'"') and raw_path.endswith(b'"'):
+        raw_path = codecs.escape_decode(raw_path[1:-1])[0]
+    return raw_path
+
+
+def count_log_paths(
+    log: Union[bytes, mmap.mmap],
+    zero_separated: bool,
+    start: int = 0,
+    end: Optional[int] = None,
+) -> Counter:
+    """Changes per raw path in a range of a saved log"""
+    end = len(log) if end is None else end
+    if zero_separated:
+        return Counter(NUMSTAT_Z_PATTERN.findall(log, start, end))
+    counts = Counter(NUMSTAT_LINE_PATTERN.findall(log, start, end))
+    # Only renamed and quoted paths need work, checking the distinct paths
+    for raw_path in [path for path in counts if path[:1] == b'"' or b" => " in path]:
+        counts[resolve_numstat_path(raw_path)] += counts.pop(raw_path)
+    return counts
+
+
+def count_log_file_paths(
+    path: str, zero_separated: bool, start: int, end: int
+) -> Counter:
+    """count_log_paths for a range of a file, for a worker process to map it"""
+    with open(path, "rb") as log_file:
+        with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+            return count_log_paths(log, zero_separated, start, end)
+
+
+def iterate_stream_chunks(
+    stream: IO[bytes], first: bytes, separator: Optional[CommitSeparator]
+) -> Iterator[bytes]:
+    """Chunks of a stream starting at a commit, the first read is passed in"""
+    if separator is None:
+        # One chunk, joined once rather than grown block by block
+        blocks = [first, *iter(lambda: stream.read(LOG_FILE_CHUNK_SIZE), b"")]
+        pending = b"".join(blocks)
+        if pending:
+            yield pending
+        return
+    pending = first
+    while True:
+        block = stream.read(LOG_FILE_CHUNK_SIZE)
+        if not block:
+            break
+        pending += block
+        boundary = pending.rfind(separator[0])
+        if boundary > 0:
+            end = boundary + separator[1]
+            yield pending[:end]
+            pending = pending[end:]
+    if pending:
+        yield pending
+
+
+def map_in_order(
+    executor: Optional[Executor],
+    function: Callable[..., Counter],
+    argument_lists: Iterable[Tuple[Any, ...]],
+    limit: int,
+) -> Iterator[Counter]:
+    """function over the argument lists, with at most limit calls in flight"""
+    if executor is None:
+        for arguments in argument_lists:
+            yield function(*arguments)
+        return
+    pending: List[Future] = []
+    for arguments in argument_lists:
+        pending.append(executor.submit(function, *arguments))
+        if len(pending) > limit:
+            yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+
+def parse_churn_from_log_file(
+    path: str, jobs: int = 1, chunk_size: Optional[int] = None
+) -> Tuple[Dict[str, int], List[str]]:
+    """Churn from a saved git log --numstat, with or without -z, or - for stdin
+
+    A file is memory-mapped and split at commit boundaries, and up to jobs
+    processes parse the chunks, each mapping the file itself. The counters
+    of the chunks are merged in log order, like a sequential parse.
+    """
+    table = PathTable()
+    executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        if path == "-":
+            first = sys.stdin.buffer.read(LOG_FILE_CHUNK_SIZE)
+            head = first[:LOG_FORMAT_PROBE_SIZE]
+            chunks = iterate_stream_chunks(
+                sys.stdin.buffer, first, get_commit_separator(head)
+            )
+            results = map_in_order(
+                executor,
+                count_log_paths,
+                ((chunk, b"\0" in head) for chunk in chunks),
+                2 * jobs,
+            )
+        else:
+            head = b""
+            ranges: List[Tuple[int, int]] = []
+            size = os.path.getsize(path)
+            # An empty file cannot be mapped, and holds no commits anyway
+            if size:
+                with open(path, "rb") as log_file:
+                    log = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+                with log:
+                    head = log[:LOG_FORMAT_PROBE_SIZE]
+                    if chunk_size is None:
+                        chunk_size = max(PARSE_CHUNK_SIZE, size // (4 * jobs))
+                        chunk_size = min(LOG_FILE_CHUNK_SIZE, chunk_size)
+                    separator = get_commit_separator(head)
+                    ranges = list(split_log(log, chunk_size, separator))
+            results = map_in_order(
+                executor,
+                count_log_file_paths,
+                ((path, b"\0" in head, start, end) for start, end in ranges),
+                2 * jobs,
+            )
+        for counts in results:
+            for raw_path, count in counts.items():
+                table.add(raw_path, count)
+    except OSError as err:
+        raise GitOutlierError(f"Cannot read log file {path}: {err}") from err
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return table.as_dict(), table.names
+
+
+# Share of --max-memory for the churn counters. Sorting them for a spill
+# briefly takes as much again, the rest is left for the interpreter, the
+# index snapshot and the log chunks. The budget only holds while counting.
+COUNTER_MEMORY_SHARE = 0.25
+MEMORY_UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_memory_size(size: str) -> int:
+    """Bytes in a size like 512M or 2G"""
+    unit = MEMORY_UNITS.get(size[-1:].upper())
+    number = size[:-1] if unit else size
+    try:
+        value = int(float(number) * (unit or 1))
+    except ValueError:
+        raise ValueError(f"expected a size like 512M or 2G, got '{size}'")
+    if value <= 0:
+        raise ValueError("the size must be positive")
+    return value
+
+
+def parse_churn_within_memory(
+    chunks: Iterable[bytes],
+    endings: List[str],
+    tracked: Container[str],
+    top: int,
+    memory_budget: int,
+) -> Tuple[Dict[str, int], List[str]]:
+    """Exact churn of the files with matching endings, counted in bounded memory
+
+    Counters that outgrow their share of the budget are spilled to sorted run
+    files and merged at the end. Of the files that are no longer tracked only
+    the top churners are kept, as no other report can show them. The churn
+    returned, of every tracked file, is held in memory.
+    """
+    raw_endings = {ending.encode() for ending in endings}
+    kept: List[Tuple[int, str, int]] = []
+    untracked: List[Tuple[int, str, int]] = []
+    with SpillingCounter(int(memory_budget * COUNTER_MEMORY_SHARE)) as counter:
+        for raw_paths in iterate_numstat_paths(chunks):
+            counter.update(
+                (raw_path, count)
+                for raw_path, count in Counter(raw_paths).items()
+                if os.path.splitext(raw_path)[1] in raw_endings
+            )
+        for raw_path, first, count in counter.merged():
+            file_name = decode_path(raw_path)
+            if file_name in tracked:
+                kept.append((first, file_name, count))
+            elif len(untracked) < top:
+                heapq.heappush(untracked, (count, file_name, first))
+            elif top:
+                heapq.heappushpop(untracked, (count, file_name, first))
+    kept.extend((first, file_name, count) for count, file_name, first in untracked)
+    # Back in the order the files first appeared in the log
+    kept.sort()
+    return (
+        {file_name: count for _, file_name, count in kept},
+        [file_name for _, file_name, _ in kept],
+    )
+
+
+def get_approximate_churn(
+    chunks: Iterable[bytes], endings: List[str], capacity: int
+) -> SpaceSaving:
+    """Track the heaviest churners among files with matching endings in fixed memory"""
+    raw_endings = {ending.encode() for ending in endings}
+    counter = SpaceSaving(capacity)
+    for raw_paths in iterate_numstat_paths(chunks):
+        for raw_path in raw_paths:
+            if os.path.splitext(raw_path)[1] in raw_endings:
+                counter.add(raw_path)
+    return counter
+
+
+def recount_churn_exactly(
+    file_names: List[str], start_date: str, end_date: Optional[str] = None
+) -> Dict[str, int]:
+    """Count churn exactly, walking the log only for the given paths"""
+    churn: Dict[str, int] = dict.fromkeys(file_names, 0)
+    if not file_names:
+        return churn
+    log = get_git_log_in_current_directory(start_date, end_date, file_names)
+    counted, _ = parse_churn_from_log(log)
+    for file_name in file_names:
+        churn[file_name] = counted.get(file_name, 0)
+    return churn
+
+
+def get_approximate_churn_data(
+    endings: List[str],
+    start_date: str,
+    end_date: Optional[str],
+    capacity: int,
+    top_churners: int,
+    exact_recount: bool = False,
+) -> Tuple[Dict[str, int], Optional[Dict[str, int]]]:
+    print("Retrieving git log (approximate churn)...")
+    counter = get_approximate_churn(
+        stream_git_log_in_current_directory(start_date, end_date), endings, capacity
+    )
+    candidates = [
+        (decode_path(raw_path), count, error)  # type: ignore
+        for raw_path, count, error in counter.top(top_churners)
+    ]
+    churn = {file_name: count for file_name, count, _ in candidates}
+    if exact_recount:
+        print("Recounting churn for the reported candidates...")
+        return recount_churn_exactly(list(churn), start_date, end_date), None
+    errors = {file_name: error for file_name, _, error in candidates}
+    return churn, errors
+
+
+LEDGER_LOG_FORMAT = "--format=%x01%H %ct %an"
+NUMSTAT_Z_CHANGE_PATTERN = re.compile(rb"([-\d]+)\t([-\d]+)\t(?:\0[^\0]*\0)?([^\0]*)\0")
+
+
+def parse_line_count(count: bytes) -> Optional[int]:
+    return None if count == b"-" else int(count)
+
+
+def parse_commit_records(log: bytes) -> Iterator[CommitRecord]:
+    """Commits from git log -z --numstat output written with LEDGER_LOG_FORMAT"""
+    for block in log.split(b"\x01")[1:]:
+        header, _, body = block.partition(b"\0")
+        fields = header.decode("utf-8", "replace").split(" ", 2)
+        author = fields[2] if len(fields) == 3 else ""
+        changes = [
+            FileChange(path, parse_line_count(added), parse_line_count(deleted))
+            for added, deleted, path in NUMSTAT_Z_CHANGE_PATTERN.findall(body)
+        ]
+        yield CommitRecord(fields[0], int(fields[1]), author, changes)
+
+
+def get_head_commit(cwd: Optional[str] = None) -> Optional[str]:
+    process = subprocess.run(
+        ["git", "rev-parse", "--verify", "--quiet", "HEAD^{commit}"],
+        cwd=cwd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    if process.returncode != 0:
+        return None
+    return process.stdout.decode().strip()
+
+
+def is_ancestor(commit: str, descendant: str) -> bool:
+    # Also false when the commit no longer exists in the repository
+    process = subprocess.run(
+        ["git", "merge-base", "--is-ancestor", commit, descendant],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    return process.returncode == 0
+
+
+def get_ledger_path() -> str:
+    output = run_git_command(
+        ["git", "rev-parse", "--git-path", "git-outlier/ledger.sqlite3"]
+    )
+    return output.decode().strip()
+
+
+def update_ledger(ledger: CommitLedger) -> int:
+    """Record the commits reachable from HEAD that the ledger does not have yet
+
+    When the recorded tip is no longer an ancestor of HEAD the history was
+    rewritten or another branch is checked out, and the ledger is rebuilt.
+    """
+    head = get_head_commit()
+    if head is None or head == ledger.tip:
+        return 0
+    tip = ledger.tip
+    if tip is not None and is_ancestor(tip, head):
+        revisions = f"{tip}..{head}"
+    else:
+        if tip is not None:
+            logging.info(f"Ledger tip {tip} is not an ancestor of HEAD, rebuilding")
+        ledger.reset()
+        revisions = head
+    log = run_git_command(
+        ["git", "log", "--numstat", "-z", "--no-merges", LEDGER_LOG_FORMAT, revisions]
+    )
+    return ledger.append(parse_commit_records(log), head)
+
+
+def get_window_timestamps(
+    start_date: str, end_date: Optional[str] = None
+) -> Tuple[int, Optional[int]]:
+    """The window of git log --since and --until as since <= timestamp < until
+
+    Git reads a bare date as that day at the current time of day, not at
+    midnight, so the bounds are taken from git itself.
+    """
+    git_command = ["git", "rev-parse", f"--since={start_date}"]
+    if end_date:
+        git_command.append(f"--until={end_date}")
+    ages = dict(
+        option.split("=", 1) for option in run_git_command(git_command).decode().split()
+    )
+    # --until keeps commits at the bound itself
+    until = int(ages["--min-age"]) + 1 if end_date else None
+    return int(ages["--max-age"]), until
+
+
+def get_ledger_churn_data(
+    endings: List[str],
+    start_date: str,
+    end_date: Optional[str] = None,
+    path_prefix: str = "",
+) -> Tuple[Dict[str, int], List[str]]:
+    """Churn of the commits git log shows for the window, below path_prefix if set"""
+    print("Updating commit ledger...")
+    directory = path_prefix.strip("/")
+    ledger = CommitLedger(get_ledger_path())
+    try:
+        added = update_ledger(ledger)
+        logging.info(f"{added} commits added, {ledger.commit_count} in the ledger")
+        raw_churn = ledger.churn(
+            *get_window_timestamps(start_date, end_date),
+            [ending.encode() for ending in endings],
+            f"{directory}/".encode() if directory else None,
+        )
+    finally:
+        ledger.close()
+    churn = {decode_path(raw_path): count for raw_path, count in raw_churn.items()}
+    return churn, list(churn)
+
+
+# Reports of a saved log cannot name the start of its window
+LOG_FILE_START = "the start of the log"
+
+
+def get_log_file_churn_data(
+    path: str, endings: List[str], jobs: int = 1
+) -> Tuple[Dict[str, int], List[str]]:
+    """Churn from a saved log instead of the repository, and the files to analyze"""
+    print(f"Reading git log from {'standard input' if path == '-' else path}...")
+    started = time.perf_counter()
+    churn, file_names = parse_churn_from_log_file(path, jobs)
+    logging.info(f"Log parsed in {time.perf_counter() - started:.2f} s")
+    filtered_file_names = [
+        file_name
+        for file_name in file_names
+        if os.path.splitext(file_name)[1] in endings
+    ]
+    return churn, filtered_file_names
+
+
+# Two-sided 95% confidence for the sampled churn estimates
+SAMPLE_CONFIDENCE_Z = 1.96
+
+
+def parse_sample_size(sample_size: str) -> Union[float, int]:
+    """A fraction of the commits when written with a decimal point, else a count"""
+    if "." in sample_size:
+        fraction = float(sample_size)
+        if not 0 < fraction <= 1:
+            raise ValueError("a fraction of the commits must be in (0, 1]")
+        return fraction
+    count = int(sample_size)
+    if count < 1:
+        raise ValueError("the number of commits must be at least 1")
+    return count
+
+
+def get_sample_count(sample_size: Union[float, int], total: int) -> int:
+    if isinstance(sample_size, float):
+        return min(total, max(1, round(total * sample_size)))
+    return min(total, sample_size)
+
+
+def count_commits_in_window(
+    start_date: str, end_date: Optional[str], cwd: Optional[str] = None
+) -> int:
+    if get_head_commit(cwd) is None:
+        return 0
+    git_command = ["git", "rev-list", "--count", "--no-merges"]
+    git_command.append(f"--since={start_date}")
+    if end_date:
+        git_command.append(f"--until={end_date}")
+    return int(run_git_command(git_command + ["HEAD"], cwd=cwd))
+
+
+def list_commits_in_window(start_date: str, end_date: Optional[str]) -> List[str]:
+    if get_head_commit() is None:
+        return []
+    git_command = ["git", "rev-list", "--no-merges", f"--since={start_date}"]
+    if end_date:
+        git_command.append(f"--until={end_date}")
+    return run_git_command(git_command + ["HEAD"]).decode().split()
+
+
+def sample_commits(commits: List[str], count: int, seed: int) -> List[str]:
+    """A seeded random subset of the commits, in their original order"""
+    picked = sorted(random.Random(seed).sample(range(len(commits)), count))
+    return [commits[position] for position in picked]
+
+
+def get_churn_interval(count: int, sampled: int, total: int) -> Tuple[float, float]:
+    """Confidence interval of the true churn of a file changed by count of the
+    sampled commits, as a Wilson score interval with finite population correction
+    """
+    correction = (total - sampled) / (total - 1) if total > 1 else 0.0
+    z_squared = SAMPLE_CONFIDENCE_Z**2 * correction
+    share = count / sampled
+    denominator = 1 + z_squared / sampled
+    centre = (share + z_squared / (2 * sampled)) / denominator
+    half_width = (
+        math.sqrt(
+            z_squared * share * (1 - share) / sampled + z_squared**2 / (4 * sampled**2)
+        )
+        / denominator
+    )
+    # Commits outside the sample can only add between none and all of them
+    least, most = float(count), float(count + total - sampled)
+    lower = min(most, max(least, (centre - half_width) * total))
+    upper = max(least, min(most, (centre + half_width) * total))
+    return lower, upper
+
+
+def get_rank_intervals(
+    intervals: Dict[str, Tuple[float, float]],
+) -> Dict[str, Tuple[int, int]]:
+    """Best and worst possible rank of each file given the churn intervals"""
+    lowers = sorted(lower for lower, _ in intervals.values())
+    uppers = sorted(upper for _, upper in intervals.values())
+    ranks = {}
+    for file_name, (lower, upper) in intervals.items():
+        surely_above = len(lowers) - bisect.bisect_right(lowers, upper)
+        possibly_above = len(uppers) - bisect.bisect_left(uppers, lower)
+        ranks[file_name] = (surely_above + 1, possibly_above)
+    return ranks
+
+
+def get_sampled_churn_data(
+    endings: List[str],
+    start_date: str,
+    end_date: Optional[str],
+    sample_size: Union[float, int],
+    seed: int = 0,
+) -> Tuple[Dict[str, int], Dict[str, Tuple[int, int]]]:
+    """Churn estimated from a seeded sample of the commits in the window
+
+    Only the sampled commits are diffed. Counts are scaled up to the whole
+    window and returned with the confidence interval of each file's rank.
+    """
+    commits = list_commits_in_window(start_date, end_date)
+    count = get_sample_count(sample_size, len(commits))
+    sampled = sample_commits(commits, count, seed)
+    print(f"Retrieving git log for {count} of {len(commits)} commits...")
+    if not sampled:
+        return {}, {}
+    log = run_git_command(
+        ["git", "log", "--stdin", "--no-walk", "--numstat", "-z", "--pretty="],
+        "".join(f"{commit}\n" for commit in sampled).encode(),
+    )
+    sampled_churn, file_names = parse_churn_from_log(log)
+    intervals = {
+        file_name: get_churn_interval(sampled_churn[file_name], count, len(commits))
+        for file_name in file_names
+        if os.path.splitext(file_name)[1] in endings
+    }
+    churn = {
+        file_name: round(sampled_churn[file_name] * len(commits) / count)
+        for file_name in intervals
+    }
+    return churn, get_rank_intervals(intervals)
 
 
 def sort_by_occurrence(
@@ -101,11 +872,18 @@ def get_diagram_output(
     max_yval: int,
     x_axis: str,
     y_axis: str,
+    x_threshold: Optional[int] = None,
+    y_threshold: Optional[int] = None,
 ) -> str:
+    draw_thresholds = x_threshold is not None and y_threshold is not None
     lines = [y_axis]
     for y_val in range(max_yval, -1, -1):
         line = "|"
-        if points_to_plot[y_val] is not None or outliers_to_plot[y_val] is not None:
+        if (
+            points_to_plot[y_val] is not None
+            or outliers_to_plot[y_val] is not None
+            or draw_thresholds
+        ):
             for x_val in range(0, max_xval + 1, 1):
                 outlier_list = outliers_to_plot[y_val]
                 point_list = points_to_plot[y_val]
@@ -113,6 +891,12 @@ def get_diagram_output(
                     line += "o"
                 elif point_list is not None and x_val in point_list:
                     line += "."
+                elif draw_thresholds and (x_val, y_val) == (x_threshold, y_threshold):
+                    line += "+"
+                elif draw_thresholds and y_val == y_threshold:
+                    line += "-"
+                elif draw_thresholds and x_val == x_threshold:
+                    line += ":"
                 else:
                     line += " "
         lines.append(line)
@@ -126,6 +910,8 @@ def convert_analysis_to_plot_data(
     y_label: str,
     max_x_output: int,
     max_y_output: int,
+    x_threshold: Optional[float] = None,
+    y_threshold: Optional[float] = None,
 ) -> Tuple[
     Dict[int, Optional[List[int]]],
     Dict[int, Optional[List[int]]],
@@ -139,6 +925,10 @@ def convert_analysis_to_plot_data(
         if value[x_label] > x_max:
             x_max = value[x_label]
 
+    # Avoid dividing by zero when every value on an axis is zero
+    y_max = y_max or 1
+    x_max = x_max or 1
+
     points_to_plot: Dict[int, Optional[List[int]]] = dict()
     outliers_to_plot: Dict[int, Optional[List[int]]] = dict()
     outliers: Dict[str, Dict[str, int]] = dict()
@@ -148,9 +938,13 @@ def convert_analysis_to_plot_data(
     for file_name, value in data.items():
         discretized_yval = round(value[y_label] / y_max * max_y_output)
         discretized_xval = round(value[x_label] / x_max * max_x_output)
-        outlier = (
-            discretized_xval > max_x_output / 2 and discretized_yval > max_y_output / 2
-        )
+        if x_threshold is None or y_threshold is None:
+            outlier = (
+                discretized_xval > max_x_output / 2
+                and discretized_yval > max_y_output / 2
+            )
+        else:
+            outlier = value[x_label] > x_threshold and value[y_label] > y_threshold
         if outlier:
             outliers[file_name] = value
             if outliers_to_plot[discretized_yval] is None:
@@ -170,6 +964,84 @@ def convert_analysis_to_plot_data(
     return points_to_plot, outliers_to_plot, outliers
 
 
+# Parameter of each --threshold policy when none is given
+THRESHOLD_DEFAULTS = {"half-max": 0.0, "percentile": 90.0, "iqr": 1.5, "mad": 3.5}
+
+
+def parse_threshold_policy(policy: str) -> Tuple[str, float]:
+    name, _, parameter = policy.partition(":")
+    if name not in THRESHOLD_DEFAULTS:
+        raise ValueError(
+            f"Unknown threshold policy '{policy}'. "
+            f"Please choose from: {', '.join(THRESHOLD_DEFAULTS)}"
+        )
+    try:
+        value = float(parameter) if parameter else THRESHOLD_DEFAULTS[name]
+    except ValueError:
+        raise ValueError(f"Invalid threshold parameter in '{policy}'")
+    if name == "percentile" and not 0 < value < 100:
+        raise ValueError("The threshold percentile must be between 0 and 100")
+    return name, value
+
+
+def get_quantile(ordered: List[float], fraction: float) -> float:
+    """Smallest value with at least ``fraction`` of the sorted values at or below it"""
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def get_axis_threshold(values: List[float], policy: str) -> Optional[float]:
+    """Value an axis must exceed for a file to be an outlier, None for half-max"""
+    name, parameter = parse_threshold_policy(policy)
+    if name == "half-max" or not values:
+        return None
+    ordered = sorted(values)
+    if name == "percentile":
+        return get_quantile(ordered, parameter / 100)
+    if name == "iqr":
+        lower_quartile = get_quantile(ordered, 0.25)
+        upper_quartile = get_quantile(ordered, 0.75)
+        return upper_quartile + parameter * (upper_quartile - lower_quartile)
+    # Robust z-score: 0.6745 * (value - median) / MAD exceeds the parameter
+    median = get_quantile(ordered, 0.5)
+    deviations = sorted(abs(value - median) for value in values)
+    median_deviation = get_quantile(deviations, 0.5)
+    if median_deviation:
+        return median + parameter * median_deviation / 0.6745
+    # More than half the values equal the median, so the MAD is 0 and would
+    # make every other value an outlier. Scale by the mean absolute deviation
+    # instead, which is 0 only if all values are equal and then marks nothing.
+    mean_deviation = sum(deviations) / len(deviations)
+    return median + parameter * 1.253314 * mean_deviation
+
+
+def get_thresholds(
+    data: Dict[str, Dict[str, Any]], x_label: str, y_label: str, policy: str
+) -> Tuple[Optional[float], Optional[float]]:
+    x_values = [value[x_label] for value in data.values()]
+    y_values = [value[y_label] for value in data.values()]
+    return get_axis_threshold(x_values, policy), get_axis_threshold(y_values, policy)
+
+
+def get_threshold_positions(
+    data: Dict[str, Dict[str, Any]],
+    x_label: str,
+    y_label: str,
+    max_x_output: int,
+    max_y_output: int,
+    x_threshold: Optional[float],
+    y_threshold: Optional[float],
+) -> Tuple[int, int]:
+    """Plot column and row of the threshold lines"""
+    if x_threshold is None or y_threshold is None:
+        return max_x_output // 2, max_y_output // 2
+    x_max = max([value[x_label] for value in data.values()], default=0) or 1
+    y_max = max([value[y_label] for value in data.values()], default=0) or 1
+    return (
+        min(max_x_output, round(x_threshold / x_max * max_x_output)),
+        min(max_y_output, round(y_threshold / y_max * max_y_output)),
+    )
+
+
 def filter_files_by_extension(
     file_list: Sequence[Union[str, Tuple[str, int]]], endings: List[str]
 ) -> List[Union[str, Tuple[str, int]]]:
@@ -184,81 +1056,835 @@ def filter_files_by_extension(
     return output_list
 
 
-def get_complexity_for_file_list(
-    file_list: List[str], complexity_metric: str
-) -> Dict[str, int]:
-    complexity = {}
+class FileMetrics(NamedTuple):
+    """All complexity metrics of one file.
+
+    The whitespace engine only measures the indentation, the lizard fields
+    are 0 in its records. The lizard engine fills in every field.
+    """
+
+    ccn: int
+    nloc: int
+    token_count: int
+    function_count: int
+    max_ccn: int
+    average_ccn: float
+    # Logical indentation levels summed over the lines that are not blank
+    whitespace: float = 0.0
+    text_lines: int = 0
+
+    @property
+    def whitespace_mean(self) -> float:
+        return round(self.whitespace / self.text_lines, 2) if self.text_lines else 0.0
+
+
+# Metric names accepted by --metric, mapped to their FileMetrics field
+METRIC_FIELDS = {
+    "CCN": "ccn",
+    "NLOC": "nloc",
+    "TOKENS": "token_count",
+    "FUNCTIONS": "function_count",
+    "MAX_CCN": "max_ccn",
+    "AVG_CCN": "average_ccn",
+    "WHITESPACE": "whitespace",
+    "WHITESPACE_MEAN": "whitespace_mean",
+}
+
+# The built-in analyzer plugins, see AnalyzerPlugin. Lizard parses the
+# supported languages. The whitespace engine only measures indentation, which
+# works on any text file and is much faster. The NLOC engine adds lines of
+# code, counted by a scanner for comments and strings.
+LIZARD_ENGINE = "lizard"
+WHITESPACE_ENGINE = "whitespace"
+NLOC_ENGINE = "nloc"
+WHITESPACE_METRICS = ["WHITESPACE", "WHITESPACE_MEAN"]
+
+
+def get_engine_for_metrics(metrics: Sequence[str]) -> str:
+    """The fastest built-in engine computing every metric, lizard if only it can"""
+    for engine in [WHITESPACE_ENGINE, NLOC_ENGINE]:
+        if all(metric in BUILTIN_ANALYZERS[engine].metrics for metric in metrics):
+            return engine
+    return LIZARD_ENGINE
+
+
+def get_file_metrics(result: Any) -> FileMetrics:
+    return FileMetrics(
+        ccn=result.CCN,
+        nloc=result.nloc,
+        token_count=result.token_count,
+        function_count=len(result.function_list),
+        max_ccn=max(
+            (function.cyclomatic_complexity for function in result.function_list),
+            default=0,
+        ),
+        average_ccn=result.average_cyclomatic_complexity,
+    )
+
+
+def get_metrics_for_file_list(
+    file_list: List[str], engine: str = LIZARD_ENGINE
+) -> Dict[str, FileMetrics]:
+    metrics = {}
     for file_name in file_list:
         if os.path.isfile(file_name):
             logging.info(f"Analyzing {file_name}")
-            result = run_analyzer_on_file(file_name)
-            if complexity_metric == "CCN":
-                complexity[file_name] = result.CCN
-            elif complexity_metric == "NLOC":
-                complexity[file_name] = result.nloc
+            if engine == LIZARD_ENGINE:
+                metrics[file_name] = get_file_metrics(run_analyzer_on_file(file_name))
             else:
-                logging.error("Internal error: Unknown complexity metric specified")
-                sys.exit(1)
-    return complexity
+                metrics[file_name] = analyze_file(file_name, engine=engine)
+    return metrics
 
 
-def run_analyzer_on_file(file_name: str) -> Any:
-    return lizard.analyze_file(file_name)
+def get_metric_field(complexity_metric: str) -> str:
+    if complexity_metric not in METRIC_FIELDS:
+        raise InvalidArgumentError(f"Unknown complexity metric: {complexity_metric}")
+    return METRIC_FIELDS[complexity_metric]
 
 
-def combine_churn_and_complexity(
-    churn: Dict[str, int], complexity: Dict[str, int], filtered_file_names: List[str]
-) -> Dict[str, Dict[str, int]]:
-    result = {}
-    for file_name in filtered_file_names:
-        if file_name in churn and file_name in complexity:
-            result[file_name] = {
-                "Churn": churn[file_name],
-                "Complexity": complexity[file_name],
-            }
-    return result
+def select_complexity_metric(
+    metrics: Dict[str, FileMetrics], complexity_metric: str
+) -> Dict[str, Any]:
+    field = get_metric_field(complexity_metric)
+    return {file_name: getattr(record, field) for file_name, record in metrics.items()}
 
 
-def get_outliers_output(outliers: Dict[str, Any]) -> str:
-    if len(outliers) == 0:
-        return "No outliers were found.\n"
-    else:
-        return "\n".join(outliers) + "\n"
+def get_complexity_for_file_list(
+    file_list: List[str], complexity_metric: str
+) -> Dict[str, Any]:
+    return select_complexity_metric(
+        get_metrics_for_file_list(
+            file_list, get_engine_for_metrics([complexity_metric])
+        ),
+        complexity_metric,
+    )
 
 
-def big_separator() -> str:
-    return "=" * 99
+def run_analyzer_on_file(file_name: str, content: Optional[bytes] = None) -> Any:
+    if content is None:
+        return lizard.analyze_file(file_name)
+    # Same fallback as lizard's own reader for files that are not valid UTF-8
+    code = content.decode("utf-8-sig", "ignore")
+    return lizard.analyze_file.analyze_source_code(file_name, code)
 
 
-def print_headline(headline: str) -> None:
-    print(f"\n{big_separator()}")
-    print(f"=  {headline}")
-    print(f"{big_separator()}\n")
+def get_repository_file_path(file_name: str, cwd: Optional[str] = None) -> str:
+    """Path of a file relative to the repository directory cwd, None for here"""
+    return os.path.join(cwd, file_name) if cwd else file_name
 
 
-def print_subsection(subsection: str) -> None:
-    print(f"\n-= {subsection} =-")
+def read_file(file_name: str) -> bytes:
+    # Also in worker processes, whose errors reach the caller of collect
+    try:
+        with open(file_name, "rb") as source:
+            return source.read()
+    except OSError as err:
+        raise GitOutlierError(f"Cannot read {file_name}: {err}") from err
 
 
-def print_big_separator() -> None:
-    print(f"\n{big_separator()}")
+def analyze_files(
+    files: Sequence[Tuple[str, bytes]], engine: str = LIZARD_ENGINE
+) -> List[FileMetrics]:
+    """Metrics of (path, content) pairs from one call of the engine's plugin"""
+    if not files:
+        return []
+    records = [
+        FileMetrics(*record)
+        for record in get_analyzer_plugin(engine).analyze_batch(files)
+    ]
+    if len(records) != len(files):
+        raise GitOutlierError(
+            f"Analyzer {engine} returned {len(records)} results for {len(files)} files"
+        )
+    return records
 
 
-def print_small_separator() -> None:
-    print("\n============================================================\n")
+def analyze_file(
+    file_name: str, content: Optional[bytes] = None, engine: str = LIZARD_ENGINE
+) -> FileMetrics:
+    """Metrics of a file, or of its content at some revision, from one engine"""
+    if content is None:
+        content = read_file(file_name)
+    return analyze_files([(file_name, content)], engine)[0]
 
 
-def print_churn_and_complexity_outliers(
-    complexity: Dict[str, int],
+def run_git_command(
+    git_command: List[str], stdin: Optional[bytes] = None, cwd: Optional[str] = None
+) -> bytes:
+    logging.info(f"Git command: {git_command}")
+    try:
+        process = subprocess.run(
+            git_command,
+            input=stdin,
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    except OSError as err:
+        raise GitCommandError(f"OS error: {err}") from err
+    if process.returncode != 0:
+        stderroutput = process.stderr.decode("utf-8", "replace")
+        if "not a git repository" in stderroutput.lower():
+            raise NotAGitRepositoryError("fatal: not a git repository")
+        raise GitCommandError(f"Git command failed: {stderroutput}")
+    return process.stdout
+
+
+def list_tree_blobs(revision: str) -> Dict[str, str]:
+    """Map every file path in the tree of a revision to its blob ID"""
+    output = run_git_command(["git", "ls-tree", "-r", "-z", revision])
+    blobs = {}
+    for entry in output.split(b"\0"):
+        if not entry:
+            continue
+        info, _, raw_path = entry.partition(b"\t")
+        _, object_type, blob_id = info.split(b" ")
+        if object_type == b"blob":
+            blobs[decode_path(raw_path)] = blob_id.decode()
+    return blobs
+
+
+class IndexEntry(NamedTuple):
+    """A tracked file as recorded in the index"""
+
+    blob_id: str
+    size: int
+    # The working tree file still has the content of the blob
+    clean: bool
+
+
+GITLINK_MODE = b"160000"
+SYMLINK_MODE = b"120000"
+
+
+def read_blob_sizes(
+    blob_ids: Iterable[str], cwd: Optional[str] = None
+) -> Dict[str, int]:
+    """Sizes of the given blobs from one git cat-file process"""
+    request = "".join(f"{blob_id}\n" for blob_id in blob_ids).encode()
+    output = run_git_command(["git", "cat-file", "--batch-check"], request, cwd)
+    sizes = {}
+    for line in output.splitlines():
+        fields = line.split()
+        if len(fields) == 3:
+            sizes[fields[0].decode()] = int(fields[2])
+    return sizes
+
+
+def read_index_snapshot(cwd: Optional[str] = None) -> Dict[str, IndexEntry]:
+    """Every tracked file with its blob ID and size, read once from the index
+
+    Replaces a filesystem check per path: deleted, untracked and ignored paths
+    are simply missing from the snapshot.
+    """
+    output = run_git_command(["git", "ls-files", "-s", "-z"], cwd=cwd)
+    blob_ids = {}
+    symlinks = set()
+    for entry in output.split(b"\0"):
+        if not entry:
+            continue
+        info, _, raw_path = entry.partition(b"\t")
+        mode, blob_id, _ = info.split(b" ")
+        if mode == GITLINK_MODE:
+            continue
+        file_name = decode_path(raw_path)
+        blob_ids[file_name] = blob_id.decode()
+        if mode == SYMLINK_MODE:
+            symlinks.add(file_name)
+    sizes = read_blob_sizes(set(blob_ids.values()), cwd)
+    output = run_git_command(["git", "diff-files", "--name-only", "-z"], cwd=cwd)
+    modified = {decode_path(raw_path) for raw_path in output.split(b"\0") if raw_path}
+    return {
+        file_name: IndexEntry(
+            blob_id,
+            sizes.get(blob_id, 0),
+            file_name not in modified and file_name not in symlinks,
+        )
+        for file_name, blob_id in blob_ids.items()
+    }
+
+
+def write_object_names(stream: IO[bytes], object_names: List[str]) -> None:
+    try:
+        for object_name in object_names:
+            stream.write(object_name.encode() + b"\n")
+    finally:
+        stream.close()
+
+
+def read_blobs(blob_ids: List[str]) -> Iterator[Tuple[str, bytes]]:
+    """Stream blob contents from the object store with one git cat-file process"""
+    git_command = ["git", "cat-file", "--batch"]
+    logging.info(f"Git command: {git_command}")
+    try:
+        process = subprocess.Popen(
+            git_command, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+    except OSError as err:
+        raise GitCommandError(f"OS error: {err}") from err
+    assert process.stdin is not None and process.stdout is not None
+    # Feed the requests from a thread so a full output pipe cannot block us
+    writer = threading.Thread(
+        target=write_object_names, args=(process.stdin, blob_ids), daemon=True
+    )
+    writer.start()
+    for _ in blob_ids:
+        header = process.stdout.readline().split()
+        if len(header) != 3:
+            logging.info(f"Object not available: {header}")
+            continue
+        content = process.stdout.read(int(header[2]))
+        process.stdout.read(1)
+        yield header[0].decode(), content
+    writer.join()
+    process.stdout.close()
+    process.wait()
+
+
+BLOB_CACHE_VERSION = 2
+
+
+def get_analyzer_version() -> str:
+    return f"lizard {lizard.version}"
+
+
+def get_blob_cache_key(
+    file_name: str, blob_id: str, engine: str = LIZARD_ENGINE
+) -> str:
+    if engine == WHITESPACE_ENGINE:
+        return f"{blob_id}:{engine}"
+    # Lizard and the NLOC scanner pick their language rules from the extension
+    key = f"{blob_id}{os.path.splitext(file_name)[1]}"
+    return key if engine == LIZARD_ENGINE else f"{key}:{get_engine_cache_tag(engine)}"
+
+
+def get_engine_cache_tag(engine: str) -> str:
+    """The engine in cache keys, with the version of plugins of other packages"""
+    if engine in BUILTIN_ANALYZERS:
+        return engine
+    version = get_analyzer_plugin_version(engine)
+    return f"{engine}@{version}" if version else engine
+
+
+# Built-in engines whose metrics lizard also computes, the same way. The NLOC
+# scanner is not among them, its counts differ from lizard's in a few files
+# and must not depend on which engine analyzed a blob first.
+LIZARD_COMPATIBLE_ENGINES = {WHITESPACE_ENGINE}
+
+
+def get_cached_metrics(
+    cache: Dict[str, FileMetrics],
+    file_name: str,
+    blob_id: str,
+    engine: str = LIZARD_ENGINE,
+) -> Optional[FileMetrics]:
+    """Metrics of the blob from the engine, or from lizard if it computes them alike
+
+    Plugins of other packages always get their own results, lizard's may
+    differ from theirs.
+    """
+    metrics = cache.get(get_blob_cache_key(file_name, blob_id, engine))
+    if metrics is None and engine in LIZARD_COMPATIBLE_ENGINES:
+        metrics = cache.get(get_blob_cache_key(file_name, blob_id))
+    return metrics
+
+
+def get_blob_cache_path(cwd: Optional[str] = None) -> str:
+    output = run_git_command(
+        ["git", "rev-parse", "--git-path", "git-outlier/blob-cache.json"], cwd=cwd
+    )
+    return get_repository_file_path(output.decode().strip(), cwd)
+
+
+def load_blob_cache(path: str) -> Dict[str, FileMetrics]:
+    try:
+        with open(path, encoding="utf-8") as cache_file:
+            stored = json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+    if (
+        stored.get("version") != BLOB_CACHE_VERSION
+        or stored.get("analyzer") != get_analyzer_version()
+    ):
+        logging.info("Discarding blob cache written by another version")
+        return {}
+    return {key: FileMetrics(*values) for key, values in stored["metrics"].items()}
+
+
+def save_blob_cache(path: str, cache: Dict[str, FileMetrics]) -> None:
+    stored = {
+        "version": BLOB_CACHE_VERSION,
+        "analyzer": get_analyzer_version(),
+        "metrics": {key: list(record) for key, record in cache.items()},
+    }
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as cache_file:
+            json.dump(stored, cache_file, separators=(",", ":"))
+        os.replace(temporary_path, path)
+    except OSError as err:
+        logging.warning(f"Could not write blob cache {path}: {err}")
+
+
+# Blob cache entries shared through the repository, one note per blob, so
+# machines that start without a cache can fetch the results of others
+NOTES_REF = "refs/notes/git-outlier"
+NOTES_COMMITTER = "git-outlier <git-outlier@localhost>"
+OBJECT_ID_PATTERN = re.compile(r"[0-9a-f]+")
+
+
+def get_notes_commit() -> Optional[str]:
+    try:
+        output = run_git_command(
+            ["git", "rev-parse", "--verify", "--quiet", f"{NOTES_REF}^{{commit}}"]
+        )
+    except GitCommandError:
+        return None
+    return output.decode().strip()
+
+
+def list_notes(commit: str) -> Dict[str, Tuple[str, str]]:
+    """Map every annotated object ID to the path and blob ID of its note"""
+    output = run_git_command(["git", "ls-tree", "-r", "-z", commit])
+    notes = {}
+    for entry in output.split(b"\0"):
+        if not entry:
+            continue
+        info, _, raw_path = entry.partition(b"\t")
+        path = raw_path.decode()
+        # Git splits the object ID into directories once there are many notes
+        object_id = path.replace("/", "")
+        if OBJECT_ID_PATTERN.fullmatch(object_id):
+            notes[object_id] = (path, info.split(b" ")[2].decode())
+    return notes
+
+
+def read_notes(
+    notes: Dict[str, Tuple[str, str]], object_ids: Iterable[str]
+) -> Dict[str, bytes]:
+    """Contents of the notes on the objects, read with one git cat-file process"""
+    annotated: Dict[str, List[str]] = {}
+    for object_id in object_ids:
+        if object_id in notes:
+            # Notes with the same content are the same blob
+            annotated.setdefault(notes[object_id][1], []).append(object_id)
+    contents = {}
+    for note_id, content in read_blobs(list(annotated)):
+        for object_id in annotated[note_id]:
+            contents[object_id] = content
+    return contents
+
+
+def write_notes(parent: Optional[str], notes: Dict[str, bytes]) -> None:
+    """Commit the notes, by path, on top of the notes ref with one git fast-import"""
+    message = b"Update the git-outlier blob cache"
+    stream = [
+        f"commit {NOTES_REF}\n".encode(),
+        f"committer {NOTES_COMMITTER} {int(time.time())} +0000\n".encode(),
+        b"data %d\n%s\n" % (len(message), message),
+    ]
+    if parent is not None:
+        stream.append(f"from {parent}\n".encode())
+    for path, content in notes.items():
+        stream.append(f"M 100644 inline {path}\n".encode())
+        stream.append(b"data %d\n%s\n" % (len(content), content))
+    run_git_command(["git", "fast-import", "--quiet"], stdin=b"".join(stream))
+
+
+def parse_note(blob_id: str, content: bytes) -> Dict[str, FileMetrics]:
+    """The blob cache entries in a note, none if another version wrote it"""
+    try:
+        stored = json.loads(content)
+        if (
+            stored.get("version") != BLOB_CACHE_VERSION
+            or stored.get("analyzer") != get_analyzer_version()
+        ):
+            return {}
+        return {
+            blob_id + suffix: FileMetrics(*values)
+            for suffix, values in stored["metrics"].items()
+        }
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return {}
+
+
+def format_note(blob_id: str, entries: Dict[str, FileMetrics]) -> bytes:
+    stored = {
+        "version": BLOB_CACHE_VERSION,
+        "analyzer": get_analyzer_version(),
+        "metrics": {
+            key[len(blob_id) :]: list(record) for key, record in entries.items()
+        },
+    }
+    return json.dumps(stored, separators=(",", ":"), sort_keys=True).encode()
+
+
+def get_blob_id_of_key(key: str) -> str:
+    # Blob cache keys start with the blob ID, followed by the extension or engine
+    match = OBJECT_ID_PATTERN.match(key)
+    return match.group() if match else ""
+
+
+def import_notes_cache(blob_ids: Set[str]) -> int:
+    """Add the entries in the notes on the blobs to the blob cache, returns how many"""
+    commit = get_notes_commit()
+    if commit is None:
+        return 0
+    notes = read_notes(list_notes(commit), blob_ids)
+    cache_path = get_blob_cache_path()
+    cache = load_blob_cache(cache_path)
+    imported = 0
+    for blob_id, content in notes.items():
+        for key, record in parse_note(blob_id, content).items():
+            if key not in cache:
+                cache[key] = record
+                imported += 1
+    if imported:
+        save_blob_cache(cache_path, cache)
+    logging.info(f"{imported} blob cache entries read from {NOTES_REF}")
+    return imported
+
+
+def export_notes_cache(blob_ids: Set[str]) -> int:
+    """Store the blob cache entries of the blobs in notes, returns the notes written
+
+    Entries already in a note are kept, so runs with different metrics add up.
+    """
+    commit = get_notes_commit()
+    notes = list_notes(commit) if commit is not None else {}
+    entries: Dict[str, Dict[str, FileMetrics]] = {}
+    for key, record in load_blob_cache(get_blob_cache_path()).items():
+        blob_id = get_blob_id_of_key(key)
+        if blob_id in blob_ids:
+            entries.setdefault(blob_id, {})[key] = record
+    stored_notes = read_notes(notes, entries)
+    updates = {}
+    for blob_id, records in entries.items():
+        stored = parse_note(blob_id, stored_notes.get(blob_id, b""))
+        if records.items() <= stored.items():
+            continue
+        if blob_id in notes:
+            path = notes[blob_id][0]
+        else:
+            path = f"{blob_id[:2]}/{blob_id[2:]}"
+        updates[path] = format_note(blob_id, {**stored, **records})
+    if updates:
+        write_notes(commit, updates)
+    logging.info(f"{len(updates)} notes written to {NOTES_REF}")
+    return len(updates)
+
+
+def analyze_missing_blobs(
+    blobs: Iterable[Tuple[str, str]],
+    cache: Dict[str, FileMetrics],
+    engine: str = LIZARD_ENGINE,
+) -> int:
+    """Analyze each (path, blob ID) pair not in the cache, reading each blob once"""
+    pending: Dict[str, List[str]] = {}
+    for file_name, blob_id in blobs:
+        if get_cached_metrics(cache, file_name, blob_id, engine) is None:
+            pending.setdefault(blob_id, []).append(file_name)
+    logging.info(f"{len(pending)} blobs to analyze")
+    batch_size = get_analyzer_plugin_class(engine).batch_size
+    analyzed = 0
+    # The (path, content) pairs of the next batch, by cache key
+    batch: Dict[str, Tuple[str, bytes]] = {}
+    for blob_id, content in read_blobs(list(pending)):
+        for file_name in pending[blob_id]:
+            key = get_blob_cache_key(file_name, blob_id, engine)
+            cached = get_cached_metrics(cache, file_name, blob_id, engine)
+            if key in batch or cached is not None:
+                continue
+            logging.info(f"Analyzing {file_name} ({blob_id})")
+            batch[key] = (file_name, content)
+            if len(batch) >= batch_size:
+                cache.update(zip(batch, analyze_files(list(batch.values()), engine)))
+                analyzed += len(batch)
+                batch = {}
+    cache.update(zip(batch, analyze_files(list(batch.values()), engine)))
+    return analyzed + len(batch)
+
+
+def get_metrics_for_blobs(
+    blobs: Dict[str, str], cache: Dict[str, FileMetrics], engine: str = LIZARD_ENGINE
+) -> Dict[str, FileMetrics]:
+    """Metrics for each path from its blob, analyzing only blobs missing in the cache"""
+    analyze_missing_blobs(blobs.items(), cache, engine)
+    metrics = {}
+    for file_name, blob_id in blobs.items():
+        cached = get_cached_metrics(cache, file_name, blob_id, engine)
+        if cached is not None:
+            metrics[file_name] = cached
+    return metrics
+
+
+def get_metrics_for_tracked_files(
+    file_list: List[str],
+    index: Dict[str, IndexEntry],
+    cache: Dict[str, FileMetrics],
+    progress: Optional[ProgressReporter] = None,
+    deadline: Optional[float] = None,
+    engine: str = LIZARD_ENGINE,
+    cwd: Optional[str] = None,
+) -> Dict[str, FileMetrics]:
+    """Metrics for the files in the index snapshot, using the blob cache for clean files
+
+    Past the deadline, a time.monotonic() value, only files in the cache get
+    metrics. With a deadline the files are analyzed one at a time, so none
+    is started after it. Files are read from the repository directory cwd.
+    """
+    progress = progress or ProgressReporter(enabled=False)
+    tracked = [index[file_name] for file_name in file_list if file_name in index]
+    progress.start(
+        "complexity", "files", len(tracked), sum(entry.size for entry in tracked)
+    )
+    batch_size = get_analyzer_plugin_class(engine).batch_size if deadline is None else 1
+    metrics: Dict[str, FileMetrics] = {}
+    batch: List[str] = []
+    for file_name in file_list:
+        entry = index.get(file_name)
+        if entry is None:
+            continue
+        cached = get_cached_metrics(cache, file_name, entry.blob_id, engine)
+        if entry.clean and cached is not None:
+            metrics[file_name] = cached
+            progress.update(1, entry.size)
+            continue
+        in_time = deadline is None or time.monotonic() < deadline
+        # A file changed in the working tree is analyzed there, unless deleted
+        if in_time and (
+            entry.clean or os.path.isfile(get_repository_file_path(file_name, cwd))
+        ):
+            logging.info(f"Analyzing {file_name} ({entry.size} bytes)")
+            batch.append(file_name)
+        else:
+            progress.update(1, entry.size)
+        if len(batch) >= batch_size:
+            analyze_tracked_files(batch, index, cache, metrics, engine, cwd)
+            progress.update(len(batch), sum(index[name].size for name in batch))
+            batch = []
+    analyze_tracked_files(batch, index, cache, metrics, engine, cwd)
+    progress.update(len(batch), sum(index[name].size for name in batch))
+    progress.finish()
+    return metrics
+
+
+def analyze_tracked_files(
+    file_names: List[str],
+    index: Dict[str, IndexEntry],
+    cache: Dict[str, FileMetrics],
+    metrics: Dict[str, FileMetrics],
+    engine: str = LIZARD_ENGINE,
+    cwd: Optional[str] = None,
+) -> None:
+    """Analyze the files as one batch, caching those that match their blob"""
+    records = analyze_files(
+        [
+            (file_name, read_file(get_repository_file_path(file_name, cwd)))
+            for file_name in file_names
+        ],
+        engine,
+    )
+    for file_name, record in zip(file_names, records):
+        metrics[file_name] = record
+        entry = index[file_name]
+        if entry.clean:
+            cache[get_blob_cache_key(file_name, entry.blob_id, engine)] = record
+
+
+def get_metrics_for_files_in_index(
+    file_list: List[str],
+    progress: Optional[ProgressReporter] = None,
+    engine: str = LIZARD_ENGINE,
+) -> Dict[str, FileMetrics]:
+    cache_path = get_blob_cache_path()
+    cache = load_blob_cache(cache_path)
+    index = read_index_snapshot()
+    metrics = get_metrics_for_tracked_files(
+        file_list, index, cache, progress, engine=engine
+    )
+    save_blob_cache(cache_path, cache)
+    return metrics
+
+
+def combine_churn_and_complexity(
+    churn: Dict[str, int], complexity: Dict[str, int], filtered_file_names: List[str]
+) -> Dict[str, Dict[str, int]]:
+    result = {}
+    for file_name in filtered_file_names:
+        if file_name in churn and file_name in complexity:
+            result[file_name] = {
+                "Churn": churn[file_name],
+                "Complexity": complexity[file_name],
+            }
+    return result
+
+
+# Size of the churn vs complexity plot, which also decides the outlier quadrant
+PLOT_WIDTH = 70
+PLOT_HEIGHT = 30
+
+
+def get_outliers_output(outliers: Dict[str, Any]) -> str:
+    if len(outliers) == 0:
+        return "No outliers were found.\n"
+    else:
+        return "\n".join(outliers) + "\n"
+
+
+def big_separator() -> str:
+    return "=" * 99
+
+
+def print_headline(headline: str) -> None:
+    print(f"\n{big_separator()}")
+    print(f"=  {headline}")
+    print(f"{big_separator()}\n")
+
+
+def print_subsection(subsection: str) -> None:
+    print(f"\n-= {subsection} =-")
+
+
+def print_big_separator() -> None:
+    print(f"\n{big_separator()}")
+
+
+def print_small_separator() -> None:
+    print("\n============================================================\n")
+
+
+def print_churn_and_complexity_outliers(
+    complexity: Dict[str, int],
     churn: Dict[str, int],
     filtered_file_names: List[str],
     complexity_metric: str,
     start_date: str,
+    threshold: str = "half-max",
 ) -> None:
     outlier_output, plot_output = prepare_outlier_analysis(
-        complexity, complexity_metric, churn, filtered_file_names
+        complexity, complexity_metric, churn, filtered_file_names, threshold
     )
-    print_plot_and_outliers(plot_output, outlier_output, start_date)
+    print_plot_and_outliers(plot_output, outlier_output, start_date, threshold)
+
+
+def find_churn_and_complexity_outliers(
+    complexity: Dict[str, Any],
+    churn: Dict[str, int],
+    file_names: List[str],
+    threshold: str = "half-max",
+) -> Set[str]:
+    analysis_result = combine_churn_and_complexity(churn, complexity, file_names)
+    x_threshold, y_threshold = get_thresholds(
+        analysis_result, "Complexity", "Churn", threshold
+    )
+    _, _, outliers = convert_analysis_to_plot_data(
+        analysis_result,
+        "Complexity",
+        "Churn",
+        PLOT_WIDTH,
+        PLOT_HEIGHT,
+        x_threshold,
+        y_threshold,
+    )
+    return set(outliers)
+
+
+def get_analyzable_files(
+    file_names: List[str], index: Dict[str, IndexEntry], cwd: Optional[str] = None
+) -> List[str]:
+    """Files that get metrics: tracked, and clean or still in the working tree"""
+    return [
+        file_name
+        for file_name in file_names
+        if file_name in index
+        and (
+            index[file_name].clean
+            or os.path.isfile(get_repository_file_path(file_name, cwd))
+        )
+    ]
+
+
+def order_by_churn(file_names: List[str], churn: Dict[str, int]) -> List[str]:
+    """Highest churn first, files with the same churn in their original order"""
+    return sorted(file_names, key=lambda file_name: -churn.get(file_name, 0))
+
+
+def order_by_size(file_names: List[str], index: Dict[str, IndexEntry]) -> List[str]:
+    """Largest blobs first, so the workers do not end waiting on one big file"""
+    return sorted(
+        file_names,
+        key=lambda file_name: -index[file_name].size if file_name in index else 0,
+    )
+
+
+class AnalysisCoverage(NamedTuple):
+    """How much of the files to analyze a time budgeted run analyzed"""
+
+    files: int
+    total_files: int
+    churn: int
+    total_churn: int
+
+    @property
+    def complete(self) -> bool:
+        return self.files == self.total_files
+
+    @property
+    def churn_share(self) -> float:
+        return self.churn / self.total_churn if self.total_churn else 1.0
+
+
+def get_analysis_coverage(
+    file_names: List[str],
+    index: Dict[str, IndexEntry],
+    churn: Dict[str, int],
+    metrics: Dict[str, FileMetrics],
+    cwd: Optional[str] = None,
+) -> AnalysisCoverage:
+    analyzable = get_analyzable_files(file_names, index, cwd)
+    analyzed = [file_name for file_name in analyzable if file_name in metrics]
+    return AnalysisCoverage(
+        files=len(analyzed),
+        total_files=len(analyzable),
+        churn=sum(churn.get(file_name, 0) for file_name in analyzed),
+        total_churn=sum(churn.get(file_name, 0) for file_name in analyzable),
+    )
+
+
+def get_outlier_candidates(
+    churn: Dict[str, int],
+    file_names: List[str],
+    index: Dict[str, IndexEntry],
+    threshold: str = "half-max",
+    cwd: Optional[str] = None,
+) -> Tuple[List[str], int]:
+    """Files above the churn threshold of the outlier plot, and how many are not
+
+    Only these files can end up in the outlier area, whatever their
+    complexity, so the others need not be analyzed. The threshold is taken
+    over the files that would get metrics, like in the plot.
+    """
+    analyzable = [
+        file_name
+        for file_name in get_analyzable_files(file_names, index, cwd)
+        if file_name in churn
+    ]
+    values: List[float] = [churn[file_name] for file_name in analyzable]
+    churn_threshold = get_axis_threshold(values, threshold)
+    if churn_threshold is None:
+        churn_max = max(values, default=0) or 1
+        candidates = [
+            file_name
+            for file_name in analyzable
+            if round(churn[file_name] / churn_max * PLOT_HEIGHT) > PLOT_HEIGHT / 2
+        ]
+    else:
+        candidates = [
+            file_name for file_name in analyzable if churn[file_name] > churn_threshold
+        ]
+    return candidates, len(analyzable) - len(candidates)
 
 
 def prepare_outlier_analysis(
@@ -266,16 +1892,35 @@ def prepare_outlier_analysis(
     complexity_metric: str,
     churn: Dict[str, int],
     filtered_file_names: List[str],
+    threshold: str = "half-max",
 ) -> Tuple[str, str]:
     analysis_result = combine_churn_and_complexity(
         churn, complexity, filtered_file_names
     )
     x_label = "Complexity"
     y_label = "Churn"
-    max_x_output = 70
-    max_y_output = 30
+    max_x_output = PLOT_WIDTH
+    max_y_output = PLOT_HEIGHT
+    x_threshold, y_threshold = get_thresholds(
+        analysis_result, x_label, y_label, threshold
+    )
     points_to_plot, outliers_to_plot, outliers = convert_analysis_to_plot_data(
-        analysis_result, x_label, y_label, max_x_output, max_y_output
+        analysis_result,
+        x_label,
+        y_label,
+        max_x_output,
+        max_y_output,
+        x_threshold,
+        y_threshold,
+    )
+    x_line, y_line = get_threshold_positions(
+        analysis_result,
+        x_label,
+        y_label,
+        max_x_output,
+        max_y_output,
+        x_threshold,
+        y_threshold,
     )
     x_label_to_print = f"{x_label}({complexity_metric})"
     y_label_to_print = y_label
@@ -286,13 +1931,18 @@ def prepare_outlier_analysis(
         max_y_output,
         x_label_to_print,
         y_label_to_print,
+        x_line,
+        y_line,
     )
     outlier_output = get_outliers_output(outliers)
     return outlier_output, plot_output
 
 
 def print_plot_and_outliers(
-    diagram_output: str, outlier_output: str, start_date: str
+    diagram_output: str,
+    outlier_output: str,
+    start_date: str,
+    threshold: str = "half-max",
 ) -> None:
     print_headline("Churn vs complexity outliers")
     print_subsection(
@@ -300,6 +1950,7 @@ def print_plot_and_outliers(
         + start_date
         + ". Outliers are marked with O"
     )
+    print(f"Outlier threshold ({threshold}) is drawn with dashed lines.")
     print(diagram_output)
     print_subsection("Detected outliers (marked with O in the outlier plot)")
     print(outlier_output)
@@ -331,7 +1982,12 @@ def print_complexity_outliers(
 
 
 def print_churn_outliers(
-    start_date: str, churn: Dict[str, int], endings: List[str], top_churners: int = 10
+    start_date: str,
+    churn: Dict[str, int],
+    endings: List[str],
+    top_churners: int = 10,
+    churn_errors: Optional[Dict[str, int]] = None,
+    rank_intervals: Optional[Dict[str, Tuple[int, int]]] = None,
 ) -> None:
     print_headline("Churn outliers")
     print_subsection(
@@ -344,25 +2000,1295 @@ def print_churn_outliers(
     cleaned_ordered_list_with_files = filter_files_by_extension(
         sort_by_occurrence(churn), endings
     )
-    print("Changes Filenames")
+    if rank_intervals is not None:
+        print("Estimated from a sample of commits, with the 95% interval of the rank.")
+        print("Changes Ranks   Filenames")
+        for items in cleaned_ordered_list_with_files[0:top_churners]:
+            best, worst = rank_intervals[str(items[0])]
+            print(f"{str(items[1]):8}{f'{best}-{worst}':8}{items[0]:10}")
+        return
+    if churn_errors is None:
+        print("Changes Filenames")
+        for items in cleaned_ordered_list_with_files[0:top_churners]:
+            print(f"{str(items[1]):8}{items[0]:10}")
+        return
+    print("Approximate counts: the true churn is between Changes-Error and Changes.")
+    print("Changes Error   Filenames")
     for items in cleaned_ordered_list_with_files[0:top_churners]:
-        print(f"{str(items[1]):8}{items[0]:10}")
+        error = churn_errors.get(str(items[0]), 0)
+        print(f"{str(items[1]):8}{str(error):8}{items[0]:10}")
+
+
+def merge_file_metrics(first: FileMetrics, second: FileMetrics) -> FileMetrics:
+    """Metrics of two files taken together, as for the directory holding both"""
+    function_count = first.function_count + second.function_count
+    average_ccn = 0.0
+    if function_count:
+        average_ccn = (
+            first.average_ccn * first.function_count
+            + second.average_ccn * second.function_count
+        ) / function_count
+    return FileMetrics(
+        ccn=first.ccn + second.ccn,
+        nloc=first.nloc + second.nloc,
+        token_count=first.token_count + second.token_count,
+        function_count=function_count,
+        max_ccn=max(first.max_ccn, second.max_ccn),
+        average_ccn=average_ccn,
+        whitespace=first.whitespace + second.whitespace,
+        text_lines=first.text_lines + second.text_lines,
+    )
+
+
+def combine_rollup_values(
+    first: Tuple[int, FileMetrics], second: Tuple[int, FileMetrics]
+) -> Tuple[int, FileMetrics]:
+    return first[0] + second[0], merge_file_metrics(first[1], second[1])
+
+
+def build_rollup_tree(
+    churn: Dict[str, int],
+    metrics: Dict[str, FileMetrics],
+    filtered_file_names: List[str],
+) -> DirectoryNode:
+    """Directory tree of the files that have both churn and metrics"""
+    return build_directory_tree(
+        {
+            file_name: (churn[file_name], metrics[file_name])
+            for file_name in filtered_file_names
+            if file_name in churn and file_name in metrics
+        },
+        combine_rollup_values,
+    )
+
+
+def parse_rollup_depth(depth: str) -> Union[int, str]:
+    if depth == "auto":
+        return depth
+    try:
+        value = int(depth)
+    except ValueError:
+        raise ValueError(f"expected a depth or auto, got '{depth}'")
+    if value < 1:
+        raise ValueError("the depth must be at least 1")
+    return value
+
+
+def get_rollup_data(
+    tree: DirectoryNode,
+    complexity_metric: str,
+    depth: Union[int, str],
+    path: str = "",
+    top: int = 10,
+) -> Tuple[Dict[str, int], Dict[str, Any], Dict[str, int], int]:
+    """Churn, complexity and file count per directory, and the depth used"""
+    node = find_directory(tree, path)
+    if node is None or node.total is None:
+        raise InvalidArgumentError(f"No analyzed files below '{path}'")
+    if depth == "auto":
+        depth = choose_rollup_depth(node, top)
+    field = get_metric_field(complexity_metric)
+    churn = {}
+    complexity = {}
+    files = {}
+    for label, (unit_churn, unit_metrics), unit_files in get_rollup_units(
+        node, int(depth)
+    ):
+        churn[label] = unit_churn
+        complexity[label] = getattr(unit_metrics, field)
+        files[label] = unit_files
+    return churn, complexity, files, int(depth)
+
+
+def print_rollup_report(
+    tree: DirectoryNode,
+    complexity_metric: str,
+    start_date: str,
+    depth: Union[int, str],
+    path: str = "",
+    top: int = 10,
+    threshold: str = "half-max",
+) -> None:
+    churn, complexity, files, depth = get_rollup_data(
+        tree, complexity_metric, depth, path, top
+    )
+    print_headline("Directory rollup")
+    print_subsection(
+        f"The top {top} directories {depth} level(s) below {path or '.'} "
+        f"by churn, with complexity ({complexity_metric}) since {start_date}:"
+    )
+    print("Churn   Complexity Files  Directories")
+    for label, value in sort_by_occurrence(churn)[0:top]:
+        print(f"{str(value):8}{str(complexity[label]):11}{str(files[label]):7}{label}")
+
+    outlier_output, plot_output = prepare_outlier_analysis(
+        complexity, complexity_metric, churn, list(churn), threshold
+    )
+    print_subsection(
+        "Plot of churn vs complexity for the directories. Outliers are marked with O"
+    )
+    print(f"Outlier threshold ({threshold}) is drawn with dashed lines.")
+    print(plot_output)
+    print_subsection("Detected outlier directories (marked with O in the plot)")
+    print(outlier_output)
+
+
+def start_log_progress(
+    progress: ProgressReporter,
+    start_date: str,
+    end_date: Optional[str],
+    cwd: Optional[str] = None,
+) -> None:
+    # Counting the commits walks the history without diffing, which is cheap
+    total = None
+    if progress.enabled:
+        total = count_commits_in_window(start_date, end_date, cwd)
+    progress.start("git log", "commits", total)
 
 
 def get_git_and_complexity_data(
     endings: List[str],
-    complexity_metric: str,
     start_date: str,
     end_date: Optional[str] = None,
-) -> Tuple[Dict[str, int], Dict[str, int], List[str]]:
-    all_of_it = get_git_log_in_current_directory(start_date, end_date)
+    progress: Optional[ProgressReporter] = None,
+    max_memory: Optional[int] = None,
+    top: int = 10,
+    outliers_only: bool = False,
+    threshold: str = "half-max",
+    time_budget: Optional[float] = None,
+    engine: str = LIZARD_ENGINE,
+) -> Tuple[Dict[str, FileMetrics], Dict[str, int], List[str]]:
     print("Retrieving git log...")
-    churn, file_names = parse_churn_from_log(all_of_it)
-    filtered_file_names = filter_files_by_extension(file_names, endings)
+    with Analyzer(
+        threshold=threshold,
+        top=top,
+        progress=progress,
+        max_memory=max_memory,
+        outliers_only=outliers_only,
+        time_budget=time_budget,
+    ) as analyzer:
+        metrics, churn, filtered_file_names = analyzer.collect(
+            endings,
+            start_date,
+            end_date,
+            on_churn_ready=lambda _: print("Computing complexity..."),
+            engine=engine,
+        )
+    print_analyzed_count(filtered_file_names, analyzer)
+    return metrics, churn, filtered_file_names
+
+
+def print_analyzed_count(filtered_file_names: List[str], analyzer: "Analyzer") -> None:
+    if analyzer.outliers_only:
+        print(
+            f"{len(filtered_file_names)} files changed, {analyzer.skipped_files} "
+            "skipped below the churn threshold of the outlier plot."
+        )
+    elif analyzer.coverage is not None:
+        print(f"{len(filtered_file_names)} files changed.")
+    else:
+        print(f"{len(filtered_file_names)} files analyzed.")
+    if analyzer.coverage is not None:
+        print_coverage(analyzer.coverage, analyzer.time_budget)
+
+
+def print_coverage(coverage: AnalysisCoverage, time_budget: Optional[float]) -> None:
+    print(
+        f"Coverage within the time budget of {time_budget:g}s: "
+        f"{coverage.files}/{coverage.total_files} files analyzed, "
+        f"{coverage.churn_share:.1%} of their churn."
+    )
+    if not coverage.complete:
+        print(
+            "The time budget ran out, the complexity reports only hold the "
+            "analyzed files."
+        )
+
+
+def terminate_workers(executor: Executor) -> None:
+    """Stop the pool now, killing the workers along with the files they analyze
+
+    shutdown() only cancels the batches still waiting, and the interpreter
+    waits for running ones when it exits.
+    """
+    processes = list((getattr(executor, "_processes", None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+
+def analyze_files_in_worker(
+    file_names: List[str], engine: str = LIZARD_ENGINE
+) -> List[FileMetrics]:
+    return analyze_files(
+        [(file_name, read_file(file_name)) for file_name in file_names], engine
+    )
+
+
+class WorkerBatches:
+    """Files handed to the worker pool in batches for the engine's plugin.
+
+    The first batches hold a single file, so every worker starts at once, and
+    later batches grow up to the plugin's batch size as more files arrive.
+    Files added largest first thus go out alone, the small ones in batches.
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        jobs: int,
+        engine: str = LIZARD_ENGINE,
+        cwd: Optional[str] = None,
+    ) -> None:
+        self.executor = executor
+        self.jobs = jobs
+        self.engine = engine
+        # The repository directory the file names are relative to
+        self.cwd = cwd
+        self.batch_size = get_analyzer_plugin_class(engine).batch_size
+        self.pending: List[str] = []
+        self.futures: Dict["Future[List[FileMetrics]]", List[str]] = {}
+
+    def add(self, file_name: str) -> None:
+        self.pending.append(file_name)
+        growing_size = 1 + len(self.futures) // self.jobs
+        if len(self.pending) >= min(self.batch_size, growing_size):
+            self.submit()
+
+    def submit(self) -> None:
+        """Hand the pending files to a worker"""
+        if not self.pending:
+            return
+        # Absolute, as a pool kept by an Analyzer outlives the working directory
+        future = self.executor.submit(
+            analyze_files_in_worker,
+            [
+                os.path.abspath(get_repository_file_path(file_name, self.cwd))
+                for file_name in self.pending
+            ],
+            self.engine,
+        )
+        self.futures[future] = self.pending
+        self.pending = []
+
+
+def schedule_tracked_file(
+    file_name: str,
+    index: Dict[str, IndexEntry],
+    cache: Dict[str, FileMetrics],
+    metrics: Dict[str, FileMetrics],
+    batches: WorkerBatches,
+) -> None:
+    """Take the metrics of a tracked file from the cache or hand it to a worker"""
+    entry = index.get(file_name)
+    if entry is None:
+        return
+    cached = get_cached_metrics(cache, file_name, entry.blob_id, batches.engine)
+    if entry.clean and cached is not None:
+        metrics[file_name] = cached
+    elif entry.clean or os.path.isfile(
+        get_repository_file_path(file_name, batches.cwd)
+    ):
+        batches.add(file_name)
+
+
+def collect_worker_results(
+    batches: WorkerBatches,
+    index: Dict[str, IndexEntry],
+    cache: Dict[str, FileMetrics],
+    metrics: Dict[str, FileMetrics],
+    progress: Optional[ProgressReporter] = None,
+    deadline: Optional[float] = None,
+) -> bool:
+    """Store the results of the workers, False if the deadline cut them short
+
+    Past the deadline, a time.monotonic() value, the batches still waiting for
+    a worker are cancelled.
+    """
+    progress = progress or ProgressReporter(enabled=False)
+    batches.submit()
+    file_names = [name for names in batches.futures.values() for name in names]
+    progress.start(
+        "complexity",
+        "files",
+        len(file_names),
+        sum(index[file_name].size for file_name in file_names),
+    )
+    timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+    try:
+        for future in as_completed(batches.futures, timeout):
+            for file_name, record in zip(batches.futures[future], future.result()):
+                metrics[file_name] = record
+                entry = index[file_name]
+                progress.update(1, entry.size)
+                if entry.clean:
+                    key = get_blob_cache_key(file_name, entry.blob_id, batches.engine)
+                    cache[key] = record
+    except TimeoutError:
+        cancelled = sum(
+            len(names) for future, names in batches.futures.items() if future.cancel()
+        )
+        logging.info(f"Time budget ran out, cancelled {cancelled} files")
+        return False
+    finally:
+        progress.finish()
+    return True
+
+
+def parse_churn_and_schedule_files(
+    chunks: Iterable[bytes],
+    endings: List[str],
+    index: Dict[str, IndexEntry],
+    cache: Dict[str, FileMetrics],
+    metrics: Dict[str, FileMetrics],
+    batches: WorkerBatches,
+) -> Tuple[Dict[str, int], List[str]]:
+    """Churn of a streamed log, scheduling each file when it first appears"""
+    raw_endings = {ending.encode() for ending in endings}
+    table = PathTable()
+    filtered_file_names = []
+    for raw_paths in iterate_numstat_paths(chunks):
+        for raw_path, count in Counter(raw_paths).items():
+            first_seen = raw_path not in table.ids
+            path_id = table.add(raw_path, count)
+            if not first_seen or os.path.splitext(raw_path)[1] not in raw_endings:
+                continue
+            file_name = table.names[path_id]
+            filtered_file_names.append(file_name)
+            schedule_tracked_file(file_name, index, cache, metrics, batches)
+    return table.as_dict(), filtered_file_names
+
+
+def get_git_and_complexity_data_pipelined(
+    endings: List[str],
+    start_date: str,
+    end_date: Optional[str],
+    jobs: int,
+    on_churn_ready: Optional[Callable[[Dict[str, int]], None]] = None,
+    progress: Optional[ProgressReporter] = None,
+    max_memory: Optional[int] = None,
+    top: int = 10,
+    outliers_only: bool = False,
+    threshold: str = "half-max",
+    time_budget: Optional[float] = None,
+    engine: str = LIZARD_ENGINE,
+) -> Tuple[Dict[str, FileMetrics], Dict[str, int], List[str]]:
+    """Analyze complexity in worker processes while the git log is still streaming
+
+    A file is handed to the workers as soon as it first appears in the log, so
+    git and lizard run at the same time. on_churn_ready gets the churn as soon
+    as the log is consumed, before complexity analysis has finished.
+    """
+    print("Retrieving git log and computing complexity...")
+    with Analyzer(
+        jobs=jobs,
+        threshold=threshold,
+        top=top,
+        progress=progress,
+        max_memory=max_memory,
+        outliers_only=outliers_only,
+        time_budget=time_budget,
+    ) as analyzer:
+        metrics, churn, filtered_file_names = analyzer.collect(
+            endings, start_date, end_date, on_churn_ready, engine
+        )
+    print_analyzed_count(filtered_file_names, analyzer)
+    return metrics, churn, filtered_file_names
+
+
+class AnalysisResult(NamedTuple):
+    """What Analyzer.analyze found, with paths relative to the repository"""
+
+    repository: str
+    since: str
+    until: Optional[str]
+    metric: str
+    churn: Dict[str, int]
+    metrics: Dict[str, FileMetrics]
+    # The selected metric of each analyzed file
+    complexity: Dict[str, Any]
+    # Highest first, at most top entries each
+    top_churn: List[Tuple[str, int]]
+    top_complexity: List[Tuple[str, Any]]
+    # Files in the outlier area of the churn vs complexity plot
+    outliers: List[str]
+    # How much was analyzed within the time budget, None without one
+    coverage: Optional[AnalysisCoverage] = None
+
+
+class Analyzer:
+    """Churn and complexity analysis for use as a library.
+
+    Errors are raised as GitOutlierError instead of exiting, and nothing is
+    printed. The blob caches and the worker pool are kept between calls, so a
+    repeated analysis only runs lizard on files that changed. Use it as a
+    context manager, or call close(), to stop the workers.
+
+    It covers the analysis of the git log, with or without max_memory,
+    outliers_only and time_budget. The other churn sources and modes of the
+    command line, like --ledger, --recurse-submodules, --compare and the
+    shard command, are not part of it and run in the repository directory.
+    """
+
+    def __init__(
+        self,
+        jobs: int = 1,
+        threshold: str = "half-max",
+        top: int = 10,
+        progress: Optional[ProgressReporter] = None,
+        max_memory: Optional[int] = None,
+        outliers_only: bool = False,
+        time_budget: Optional[float] = None,
+    ) -> None:
+        try:
+            parse_threshold_policy(threshold)
+        except ValueError as err:
+            raise InvalidArgumentError(str(err)) from err
+        self.jobs = jobs
+        self.threshold = threshold
+        self.top = top
+        self.progress = progress or ProgressReporter(enabled=False)
+        self.max_memory = max_memory
+        self.outliers_only = outliers_only
+        self.time_budget = time_budget
+        # Files the last collect() did not analyze because of outliers_only
+        self.skipped_files = 0
+        # What the last collect() analyzed within the time budget
+        self.coverage: Optional[AnalysisCoverage] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._caches: Dict[str, Dict[str, FileMetrics]] = {}
+
+    def __enter__(self) -> "Analyzer":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.jobs > 1 and self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.jobs)
+        return self._executor
+
+    def _get_cache(
+        self, cwd: Optional[str] = None
+    ) -> Tuple[str, Dict[str, FileMetrics]]:
+        cache_path = os.path.abspath(get_blob_cache_path(cwd))
+        if cache_path not in self._caches:
+            self._caches[cache_path] = load_blob_cache(cache_path)
+        return cache_path, self._caches[cache_path]
+
+    def collect(
+        self,
+        endings: List[str],
+        start_date: str,
+        end_date: Optional[str] = None,
+        on_churn_ready: Optional[Callable[[Dict[str, int]], None]] = None,
+        engine: str = LIZARD_ENGINE,
+        cwd: Optional[str] = None,
+    ) -> Tuple[Dict[str, FileMetrics], Dict[str, int], List[str]]:
+        """Metrics, churn and analyzed files of the repository in the directory cwd
+
+        With worker processes a file is scheduled as soon as it first appears in
+        the log. on_churn_ready gets the churn as soon as the log is consumed.
+        With max_memory the churn is counted within that budget first, and
+        only the files with matching endings are kept in it, of the untracked
+        ones only the top most changed. Only the counting is bounded. With outliers_only
+        only the files above the churn threshold of the outlier plot are
+        analyzed, once the whole log is read. With time_budget, in seconds from
+        the start, the files are analyzed highest churn first, once the whole
+        log is read, until the budget runs out. Files in the blob cache always
+        get their metrics, so later runs cover more of the files.
+        """
+        deadline = None
+        if self.time_budget is not None:
+            deadline = time.monotonic() + self.time_budget
+        index = read_index_snapshot(cwd)
+        cache_path, cache = self._get_cache(cwd)
+        executor = self._get_executor()
+        start_log_progress(self.progress, start_date, end_date, cwd)
+        chunks = self.progress.track_chunks(
+            stream_git_log_in_current_directory(start_date, end_date, cwd),
+            COMMIT_MARKER,
+        )
+        metrics: Dict[str, FileMetrics] = {}
+        batches = None
+        if executor is not None:
+            batches = WorkerBatches(executor, self.jobs, engine, cwd)
+        if self.max_memory is not None:
+            churn, filtered_file_names = parse_churn_within_memory(
+                chunks, endings, index, self.top, self.max_memory
+            )
+        elif batches is not None and not (self.outliers_only or deadline is not None):
+            churn, filtered_file_names = parse_churn_and_schedule_files(
+                chunks, endings, index, cache, metrics, batches
+            )
+        else:
+            churn, file_names = parse_churn_from_chunks(chunks)
+            filtered_file_names = [
+                file_name
+                for file_name in file_names
+                if os.path.splitext(file_name)[1] in endings
+            ]
+        self.progress.finish()
+        if on_churn_ready is not None:
+            on_churn_ready(churn)
+
+        analyzed_file_names = filtered_file_names
+        self.skipped_files = 0
+        if self.outliers_only:
+            analyzed_file_names, self.skipped_files = get_outlier_candidates(
+                churn, filtered_file_names, index, self.threshold, cwd
+            )
+        if deadline is not None:
+            analyzed_file_names = order_by_churn(analyzed_file_names, churn)
+
+        if batches is None:
+            metrics = get_metrics_for_tracked_files(
+                analyzed_file_names, index, cache, self.progress, deadline, engine, cwd
+            )
+        else:
+            if (
+                self.max_memory is not None
+                or self.outliers_only
+                or deadline is not None
+            ):
+                # Within a time budget the highest churn goes first instead
+                scheduled = analyzed_file_names
+                if deadline is None:
+                    scheduled = order_by_size(analyzed_file_names, index)
+                for file_name in scheduled:
+                    schedule_tracked_file(file_name, index, cache, metrics, batches)
+            if not collect_worker_results(
+                batches, index, cache, metrics, self.progress, deadline
+            ):
+                # Do not wait for the files the workers are still analyzing
+                terminate_workers(batches.executor)
+                self._executor = None
+        self.coverage = None
+        if deadline is not None:
+            self.coverage = get_analysis_coverage(
+                analyzed_file_names, index, churn, metrics, cwd
+            )
+        save_blob_cache(cache_path, cache)
+        return metrics, churn, filtered_file_names
+
+    def analyze(
+        self,
+        repo: str = ".",
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        languages: Optional[List[str]] = None,
+        metric: str = "CCN",
+        analyzer: Optional[str] = None,
+    ) -> AnalysisResult:
+        """Analyze a repository like the command line does, see parse_arguments"""
+        field = get_metric_field(metric)
+        if analyzer is not None:
+            if languages is not None:
+                raise InvalidArgumentError(
+                    "The analyzer decides the file endings, languages cannot be given"
+                )
+            endings = get_analyzer_endings(analyzer, [metric])
+            engine = analyzer
+        else:
+            engine = get_engine_for_metrics([metric])
+            supported_languages = get_languages_for_engine(engine)
+            if languages is None:
+                languages = list(supported_languages)
+            unsupported = [
+                name for name in languages if name not in supported_languages
+            ]
+            if unsupported:
+                raise InvalidArgumentError(f"Unsupported languages: {unsupported}")
+            endings = get_file_endings_for_languages(languages)
+        try:
+            start_date, end_date = get_date_range(since, until)
+        except ValueError as err:
+            raise InvalidArgumentError(str(err)) from err
+
+        repository = os.path.expanduser(repo)
+        if not os.path.isdir(repository):
+            raise RepositoryPathError(f"Cannot open repository: {repo}")
+        metrics, churn, file_names = self.collect(
+            endings, start_date, end_date, engine=engine, cwd=repository
+        )
+
+        complexity = {
+            file_name: getattr(record, field) for file_name, record in metrics.items()
+        }
+        outliers = find_churn_and_complexity_outliers(
+            complexity, churn, file_names, self.threshold
+        )
+        return AnalysisResult(
+            repository=repo,
+            since=start_date,
+            until=end_date,
+            metric=metric,
+            churn=churn,
+            metrics=metrics,
+            complexity=complexity,
+            top_churn=[
+                (file_name, count)
+                for file_name, count in sort_by_occurrence(churn)
+                if os.path.splitext(file_name)[1] in endings
+            ][: self.top],
+            top_complexity=sort_by_occurrence(complexity)[: self.top],
+            outliers=sorted(outliers),
+            coverage=self.coverage,
+        )
+
+
+def get_sliced_churn(
+    commits: List[str], commit_slice: SliceCoverage, endings: List[str]
+) -> Dict[str, ChurnRecord]:
+    """Churn of the commits in the slice, with where each file first appears"""
+    positions = {commit: position for position, commit in enumerate(commits)}
+    sliced = [
+        commit
+        for position, commit in enumerate(commits)
+        if position % commit_slice.of in commit_slice.parts
+    ]
+    if not sliced:
+        return {}
+    log = run_git_command(
+        ["git", "log", "--stdin", "--no-walk", "--numstat", "-z", LEDGER_LOG_FORMAT],
+        "".join(f"{commit}\n" for commit in sliced).encode(),
+    )
+    churn: Dict[str, ChurnRecord] = {}
+    for record in parse_commit_records(log):
+        commit_position = positions[record.commit]
+        for position_in_commit, change in enumerate(record.changes):
+            file_name = decode_path(change.path)
+            if os.path.splitext(file_name)[1] not in endings:
+                continue
+            known = churn.get(file_name)
+            first = (commit_position, position_in_commit)
+            if known is not None:
+                first = min(first, (known.commit_position, known.position_in_commit))
+            churn[file_name] = ChurnRecord((known.changes if known else 0) + 1, *first)
+    return churn
+
+
+def list_changed_files(start_date: str, end_date: Optional[str]) -> List[str]:
+    """Files changed in the window, listed without diffing their contents"""
+    if get_head_commit() is None:
+        return []
+    git_command = ["git", "log", "--no-merges", "--name-only", "-z", "--format="]
+    git_command.append(f"--since={start_date}")
+    if end_date:
+        git_command.append(f"--until={end_date}")
+    output = run_git_command(git_command)
+    return list(
+        dict.fromkeys(decode_path(path) for path in output.split(b"\0") if path)
+    )
+
+
+def create_shard(
+    endings: List[str],
+    start_date: str,
+    end_date: Optional[str],
+    commit_slice: SliceCoverage,
+    file_slice: SliceCoverage,
+    progress: Optional[ProgressReporter] = None,
+) -> Shard:
+    """Churn of a slice of the commits and metrics of a slice of the changed files
+
+    Commits are dealt out in turn, so every slice spans the whole window.
+    Files go to a slice by a hash of their path.
+    """
+    commits = list_commits_in_window(start_date, end_date)
+    print(f"Retrieving git log for commit slice {commit_slice}...")
+    churn = get_sliced_churn(commits, commit_slice, endings)
+    file_names = [
+        file_name
+        for file_name in list_changed_files(start_date, end_date)
+        if os.path.splitext(file_name)[1] in endings
+        and get_path_part(file_name, file_slice.of) in file_slice.parts
+    ]
+    print(f"Computing complexity for file slice {file_slice}...")
+    cache_path = get_blob_cache_path()
+    cache = load_blob_cache(cache_path)
+    metrics = get_metrics_for_tracked_files(
+        file_names, read_index_snapshot(), cache, progress
+    )
+    save_blob_cache(cache_path, cache)
+    return Shard(
+        head=get_head_commit(),
+        since=start_date,
+        until=end_date,
+        endings=tuple(endings),
+        commits=commit_slice,
+        files=file_slice,
+        churn=churn,
+        metrics={file_name: tuple(record) for file_name, record in metrics.items()},
+    )
+
+
+def get_shard_data(
+    shard: Shard,
+) -> Tuple[Dict[str, FileMetrics], Dict[str, int], List[str]]:
+    """Metrics, churn and files as a single run finds them, from complete shards"""
+    for kind, coverage in [("commit", shard.commits), ("file", shard.files)]:
+        if not coverage.complete:
+            raise InvalidArgumentError(
+                f"The shards only hold the {kind} slices {coverage}"
+            )
+    churn, file_names = shard.get_ordered_churn()
+    metrics = {
+        file_name: FileMetrics(*shard.metrics[file_name])
+        for file_name in file_names
+        if file_name in shard.metrics
+    }
+    return metrics, churn, file_names
+
+
+def list_submodules(path: str = "") -> List[str]:
+    """Paths of the checked out submodules below path, nested ones included"""
+    output = run_git_command(["git", "ls-files", "-s", "-z"], cwd=path or None)
+    submodules = []
+    for entry in output.split(b"\0"):
+        info, _, raw_path = entry.partition(b"\t")
+        if not info.startswith(GITLINK_MODE):
+            continue
+        submodule = os.path.join(path, decode_path(raw_path))
+        # Submodules that are not initialized are empty directories
+        if os.path.exists(os.path.join(submodule, ".git")):
+            submodules.append(submodule)
+            submodules.extend(list_submodules(submodule))
+    return submodules
+
+
+class RepositoryData(NamedTuple):
+    """Churn and tracked files of one repository, paths relative to the top"""
+
+    path: str
+    churn: Dict[str, int]
+    file_names: List[str]
+    tracked: Dict[str, IndexEntry]
+    seconds: float
+
+
+def add_path_prefix(path: str, file_name: str) -> str:
+    return f"{path}/{file_name}" if path else file_name
+
+
+def collect_repository_data(
+    path: str, start_date: str, end_date: Optional[str]
+) -> RepositoryData:
+    started = time.perf_counter()
+    # A submodule without commits yet has no churn, like an empty repository
+    log = get_git_log_in_current_directory(start_date, end_date, cwd=path or None)
+    churn, file_names = parse_churn_from_log(log)
+    index = read_index_snapshot(path or None)
+    return RepositoryData(
+        path,
+        {add_path_prefix(path, name): count for name, count in churn.items()},
+        [add_path_prefix(path, name) for name in file_names],
+        {add_path_prefix(path, name): entry for name, entry in index.items()},
+        time.perf_counter() - started,
+    )
+
+
+def get_git_and_complexity_data_with_submodules(
+    endings: List[str],
+    start_date: str,
+    end_date: Optional[str],
+    jobs: int,
+    progress: Optional[ProgressReporter] = None,
+    engine: str = LIZARD_ENGINE,
+) -> Tuple[Dict[str, FileMetrics], Dict[str, int], List[str]]:
+    """Churn and complexity of the repository and all its submodules as one tree
+
+    The logs of the repositories are collected concurrently, and the files of
+    all of them share one complexity worker pool.
+    """
+    progress = progress or ProgressReporter(enabled=False)
+    repositories = [""] + list_submodules()
+    print(f"Retrieving git log of {len(repositories)} repositories...")
+    progress.start("git log", "repositories", len(repositories))
+    collected = []
+    with ThreadPoolExecutor(max_workers=jobs) as log_executor:
+        pending = [
+            log_executor.submit(collect_repository_data, path, start_date, end_date)
+            for path in repositories
+        ]
+        for future in as_completed(pending):
+            collected.append(future.result())
+            progress.update(1)
+    progress.finish()
+    collected.sort(key=lambda data: repositories.index(data.path))
+    churn: Dict[str, int] = {}
+    file_names: List[str] = []
+    index: Dict[str, IndexEntry] = {}
+    for data in collected:
+        logging.info(
+            f"{data.path or '.'}: {len(data.churn)} files changed, "
+            f"git log and index read in {data.seconds:.2f} s"
+        )
+        churn.update(data.churn)
+        file_names.extend(data.file_names)
+        index.update(data.tracked)
+    filtered_file_names = [
+        file_name
+        for file_name in file_names
+        if os.path.splitext(file_name)[1] in endings
+    ]
+
     print("Computing complexity...")
-    complexity = get_complexity_for_file_list(filtered_file_names, complexity_metric)  # type: ignore
+    started = time.perf_counter()
+    cache_path = get_blob_cache_path()
+    cache = load_blob_cache(cache_path)
+    if jobs > 1:
+        metrics: Dict[str, FileMetrics] = {}
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            batches = WorkerBatches(executor, jobs, engine)
+            for file_name in order_by_size(filtered_file_names, index):
+                schedule_tracked_file(file_name, index, cache, metrics, batches)
+            collect_worker_results(batches, index, cache, metrics, progress)
+    else:
+        metrics = get_metrics_for_tracked_files(
+            filtered_file_names, index, cache, progress, engine=engine
+        )
+    save_blob_cache(cache_path, cache)
+    logging.info(f"Complexity computed in {time.perf_counter() - started:.2f} s")
     print(f"{len(filtered_file_names)} files analyzed.")
-    return complexity, churn, filtered_file_names  # type: ignore
+    return metrics, churn, filtered_file_names
+
+
+class FileDelta(NamedTuple):
+    """How one file changed between the base and head of a comparison"""
+
+    file_name: str
+    base_complexity: Optional[Any]
+    head_complexity: Optional[Any]
+    base_churn: int
+    head_churn: int
+    base_outlier: bool
+    head_outlier: bool
+
+
+def resolve_revision_range(revision_range: str) -> Tuple[str, str]:
+    """Split base..head, or base...head which compares against the merge base"""
+    if "..." in revision_range:
+        base, head = revision_range.split("...", 1)
+        output = run_git_command(["git", "merge-base", base or "HEAD", head or "HEAD"])
+        return output.decode().strip(), head or "HEAD"
+    base, head = revision_range.split("..", 1)
+    return base or "HEAD", head or "HEAD"
+
+
+def get_compare_data(
+    base: str,
+    head: str,
+    endings: List[str],
+    start_date: str,
+    end_date: Optional[str] = None,
+    engine: str = LIZARD_ENGINE,
+) -> Tuple[
+    Dict[str, FileMetrics], Dict[str, FileMetrics], Dict[str, int], Dict[str, int]
+]:
+    """Metrics and churn at base and head, analyzing only the files that matter
+
+    Those are the files that differ between the trees, for their complexity
+    deltas, and the files with churn, which make up the outlier plot. Blobs
+    head shares with base are analyzed once, every other file is skipped.
+    """
+    print("Retrieving git log...")
+    base_log = get_git_log_in_current_directory(start_date, end_date, revisions=base)
+    base_churn, _ = parse_churn_from_log(base_log)
+    delta_log = get_git_log_in_current_directory(None, revisions=f"{base}..{head}")
+    delta_churn, _ = parse_churn_from_log(delta_log)
+    head_churn = dict(base_churn)
+    for file_name, count in delta_churn.items():
+        head_churn[file_name] = head_churn.get(file_name, 0) + count
+
+    print(f"Reading trees of {base} and {head}...")
+    base_tree = {
+        file_name: blob_id
+        for file_name, blob_id in list_tree_blobs(base).items()
+        if os.path.splitext(file_name)[1] in endings
+    }
+    head_tree = {
+        file_name: blob_id
+        for file_name, blob_id in list_tree_blobs(head).items()
+        if os.path.splitext(file_name)[1] in endings
+    }
+    changed = {
+        file_name
+        for file_name in set(base_tree) | set(head_tree)
+        if base_tree.get(file_name) != head_tree.get(file_name)
+    }
+    base_blobs = {
+        file_name: blob_id
+        for file_name, blob_id in base_tree.items()
+        if file_name in changed or base_churn.get(file_name)
+    }
+    head_blobs = {
+        file_name: blob_id
+        for file_name, blob_id in head_tree.items()
+        if file_name in changed or head_churn.get(file_name)
+    }
+    print(
+        f"{len(changed)} files differ between {base} and {head}, "
+        f"{len(set(base_blobs.values()) | set(head_blobs.values()))} distinct "
+        "blobs are needed."
+    )
+
+    print("Computing complexity...")
+    cache_path = get_blob_cache_path()
+    cache = load_blob_cache(cache_path)
+    analyze_missing_blobs(
+        set(base_blobs.items()) | set(head_blobs.items()), cache, engine
+    )
+    base_metrics = get_metrics_for_blobs(base_blobs, cache, engine)
+    head_metrics = get_metrics_for_blobs(head_blobs, cache, engine)
+    save_blob_cache(cache_path, cache)
+    return base_metrics, head_metrics, base_churn, head_churn
+
+
+def get_compare_deltas(
+    base_metrics: Dict[str, FileMetrics],
+    head_metrics: Dict[str, FileMetrics],
+    base_churn: Dict[str, int],
+    head_churn: Dict[str, int],
+    complexity_metric: str,
+    threshold: str = "half-max",
+) -> List[FileDelta]:
+    """Deltas for files that changed or whose outlier status changed"""
+    base_complexity = select_complexity_metric(base_metrics, complexity_metric)
+    head_complexity = select_complexity_metric(head_metrics, complexity_metric)
+    # Like in the outlier plot of a normal run, only files with churn count
+    base_outliers = find_churn_and_complexity_outliers(
+        base_complexity,
+        base_churn,
+        [file_name for file_name in base_complexity if base_churn.get(file_name)],
+        threshold,
+    )
+    head_outliers = find_churn_and_complexity_outliers(
+        head_complexity,
+        head_churn,
+        [file_name for file_name in head_complexity if head_churn.get(file_name)],
+        threshold,
+    )
+    deltas = []
+    for file_name in sorted(set(base_complexity) | set(head_complexity)):
+        delta = FileDelta(
+            file_name,
+            base_complexity.get(file_name),
+            head_complexity.get(file_name),
+            base_churn.get(file_name, 0),
+            head_churn.get(file_name, 0),
+            file_name in base_outliers,
+            file_name in head_outliers,
+        )
+        if (
+            delta.base_complexity != delta.head_complexity
+            or delta.base_churn != delta.head_churn
+            or delta.base_outlier != delta.head_outlier
+        ):
+            deltas.append(delta)
+    return deltas
+
+
+def format_change(before: Optional[Any], after: Optional[Any]) -> str:
+    if before is None or after is None:
+        return (
+            f"{'-' if before is None else before} -> {'-' if after is None else after}"
+        )
+    change = after - before
+    if isinstance(change, float):
+        change = round(change, 2)
+    return f"{before} -> {after} ({'+' if change >= 0 else ''}{change})"
+
+
+def get_outlier_status(delta: FileDelta) -> str:
+    if delta.head_outlier and not delta.base_outlier:
+        return "new"
+    if delta.base_outlier and not delta.head_outlier:
+        return "resolved"
+    return "yes" if delta.head_outlier else "no"
+
+
+def print_compare_report(
+    deltas: List[FileDelta], complexity_metric: str, base: str, head: str
+) -> None:
+    print_headline(f"Outlier changes between {base} and {head}")
+    print_subsection(
+        f"Files with changed complexity ({complexity_metric}), churn or outlier status"
+    )
+    if not deltas:
+        print("No changes were found.")
+        return
+    status_order = {"new": 0, "yes": 1, "resolved": 2, "no": 3}
+
+    def sort_key(delta: FileDelta) -> Tuple[int, float, str]:
+        complexity_change = (delta.head_complexity or 0) - (delta.base_complexity or 0)
+        return (
+            status_order[get_outlier_status(delta)],
+            -complexity_change,
+            delta.file_name,
+        )
+
+    print(f"{'Outlier':10}{'Complexity':24}{'Churn':18}Filenames")
+    for delta in sorted(deltas, key=sort_key):
+        print(
+            f"{get_outlier_status(delta):10}"
+            f"{format_change(delta.base_complexity, delta.head_complexity):24}"
+            f"{format_change(delta.base_churn, delta.head_churn):18}"
+            f"{delta.file_name}"
+        )
+
+
+def get_history_revisions(
+    count: int, history_by: str, end_date: Optional[str] = None
+) -> List[Tuple[str, str]]:
+    """Up to count (label, commit) samples of HEAD's history, oldest first"""
+    if history_by == "tag":
+        output = run_git_command(
+            ["git", "tag", "--merged", "HEAD", "--sort=creatordate"]
+        )
+        tags = output.decode("utf-8", "replace").split()[-count:]
+        return [(tag, tag) for tag in tags]
+
+    samples: List[Tuple[str, str]] = []
+    seen = set()
+    last = parse_git_date(end_date) if end_date else str(date.today())
+    for months_ago in range(count - 1, -1, -1):
+        sample_date = str(parse_date(last).date() + relativedelta(months=-months_ago))
+        commit = (
+            run_git_command(
+                ["git", "rev-list", "-1", f"--before={sample_date} 23:59:59", "HEAD"]
+            )
+            .decode()
+            .strip()
+        )
+        if commit and commit not in seen:
+            seen.add(commit)
+            samples.append((sample_date, commit))
+    return samples
+
+
+def get_complexity_history(
+    revisions: List[Tuple[str, str]], endings: List[str], engine: str = LIZARD_ENGINE
+) -> Dict[str, Dict[str, FileMetrics]]:
+    """Per-file metrics at each sampled revision, analyzing every distinct blob once"""
+    trees = {}
+    for label, commit in revisions:
+        trees[label] = {
+            file_name: blob_id
+            for file_name, blob_id in list_tree_blobs(commit).items()
+            if os.path.splitext(file_name)[1] in endings
+        }
+    cache_path = get_blob_cache_path()
+    cache = load_blob_cache(cache_path)
+    analyzed = analyze_missing_blobs(
+        {pair for tree in trees.values() for pair in tree.items()}, cache, engine
+    )
+    save_blob_cache(cache_path, cache)
+    print(f"{analyzed} distinct blobs analyzed.")
+
+    history: Dict[str, Dict[str, FileMetrics]] = {}
+    for label, tree in trees.items():
+        for file_name, blob_id in tree.items():
+            cached = get_cached_metrics(cache, file_name, blob_id, engine)
+            if cached is not None:
+                history.setdefault(file_name, {})[label] = cached
+    return history
+
+
+def print_complexity_history(
+    history: Dict[str, Dict[str, FileMetrics]],
+    labels: List[str],
+    complexity_metric: str,
+    top_complexity: int = 10,
+) -> None:
+    print_headline("Complexity history")
+    print_subsection(
+        "The top "
+        + str(top_complexity)
+        + " files with complexity ("
+        + complexity_metric
+        + ") at the latest sample, over "
+        + str(len(labels))
+        + " samples:"
+    )
+    field = METRIC_FIELDS[complexity_metric]
+    latest = {
+        file_name: getattr(samples[labels[-1]], field)
+        for file_name, samples in history.items()
+        if labels and labels[-1] in samples
+    }
+    width = max([len(label) for label in labels] + [10]) + 2
+    print("".join(f"{label:{width}}" for label in labels) + "Filenames")
+    for file_name, _ in sort_by_occurrence(latest)[0:top_complexity]:
+        samples = history[file_name]
+        values = [
+            str(getattr(samples[label], field)) if label in samples else "-"
+            for label in labels
+        ]
+        print("".join(f"{value:{width}}" for value in values) + file_name)
+
+
+BLAME_CACHE_VERSION = 1
+
+
+def get_blame_cache_path() -> str:
+    output = run_git_command(
+        ["git", "rev-parse", "--git-path", "git-outlier/blame-cache.json"]
+    )
+    return output.decode().strip()
+
+
+def load_blame_cache(path: str) -> Dict[str, LineTimes]:
+    try:
+        with open(path, encoding="utf-8") as cache_file:
+            stored = json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+    if stored.get("version") != BLAME_CACHE_VERSION:
+        logging.info("Discarding blame cache written by another version")
+        return {}
+    return {
+        key: [(time, count) for time, count in line_times]
+        for key, line_times in stored["line_times"].items()
+    }
+
+
+def save_blame_cache(path: str, cache: Dict[str, LineTimes]) -> None:
+    stored = {"version": BLAME_CACHE_VERSION, "line_times": cache}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as cache_file:
+            json.dump(stored, cache_file, separators=(",", ":"))
+        os.replace(temporary_path, path)
+    except OSError as err:
+        logging.warning(f"Could not write blame cache {path}: {err}")
+
+
+def get_window_end_commit(end_date: Optional[str]) -> Optional[str]:
+    """The last commit of HEAD's history up to the end of the window"""
+    git_command = ["git", "rev-list", "-1"]
+    if end_date:
+        git_command.append(f"--until={end_date}")
+    output = run_git_command(git_command + ["HEAD"])
+    return output.decode().strip() or None
+
+
+def get_last_commits(
+    file_names: List[str], start_date: str, end_date: Optional[str], revision: str
+) -> Dict[str, str]:
+    """The newest commit of the window changing each file, from one git log
+
+    The files changed in the window, so the log need not go further back.
+    The paths are passed on stdin, there may be more than a command line holds.
+    """
+    git_command = ["git", "log", "--no-merges", "-z", "--name-only"]
+    git_command += ["--format=%x01%H", f"--since={start_date}"]
+    if end_date:
+        git_command.append(f"--until={end_date}")
+    git_command += ["--stdin", revision]
+    paths = "".join(f":(literal){file_name}\n" for file_name in file_names)
+    output = run_git_command(git_command, stdin=f"--\n{paths}".encode())
+
+    last_commits: Dict[str, str] = {}
+    for record in output.split(COMMIT_MARKER)[1:]:
+        commit, _, raw_paths = record.partition(b"\0")
+        for raw_path in raw_paths.lstrip(b"\n").split(b"\0"):
+            if raw_path:
+                last_commits.setdefault(decode_path(raw_path), commit.decode())
+    return last_commits
+
+
+def blame_file(file_name: str, revision: str) -> LineTimes:
+    output = run_git_command(["git", "blame", "--porcelain", revision, "--", file_name])
+    return parse_blame_porcelain(output)
+
+
+def get_code_ages(
+    file_names: List[str],
+    start_date: str,
+    end_date: Optional[str],
+    months: int,
+    jobs: int = 1,
+) -> Dict[str, CodeAge]:
+    """Age of the lines of the files at the end of the window, from git blame
+
+    Blames are cached by the blob and the last commit changing the file, which
+    together decide the result, so later runs only blame the changed files.
+    Up to jobs blames run at a time, each in its own git process.
+    """
+    revision = get_window_end_commit(end_date) if file_names else None
+    if revision is None:
+        return {}
+    blobs = list_tree_blobs(revision)
+    present = [file_name for file_name in file_names if file_name in blobs]
+    last_commits = get_last_commits(present, start_date, end_date, revision)
+    keys = {
+        file_name: f"{blobs[file_name]}:{last_commits.get(file_name, revision)}"
+        for file_name in present
+    }
+
+    cache_path = get_blame_cache_path()
+    cache = load_blame_cache(cache_path)
+    missing = [file_name for file_name in present if keys[file_name] not in cache]
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = {
+            executor.submit(blame_file, file_name, revision): file_name
+            for file_name in missing
+        }
+        for future in as_completed(futures):
+            file_name = futures[future]
+            try:
+                cache[keys[file_name]] = future.result()
+            except GitCommandError as err:
+                logging.warning(f"Could not blame {file_name}: {err}")
+    if missing:
+        save_blame_cache(cache_path, cache)
+    print(f"{len(missing)} files blamed.")
+
+    _, until = get_window_timestamps(start_date, end_date)
+    reference = until if until is not None else int(time.time())
+    cutoff = datetime.fromtimestamp(reference) + relativedelta(months=-months)
+    return {
+        file_name: get_code_age(
+            cache[keys[file_name]], reference, int(cutoff.timestamp())
+        )
+        for file_name in present
+        if keys[file_name] in cache
+    }
+
+
+def print_code_age_outliers(
+    code_ages: Dict[str, CodeAge],
+    churn: Dict[str, int],
+    months: int,
+    top_files: int = 10,
+) -> None:
+    print_headline("Code age outliers")
+    print_subsection(
+        "The top "
+        + str(top_files)
+        + " files above the churn threshold by their share of lines older than "
+        + str(months)
+        + " months at the end of the window. Old code that churns is a red flag:"
+    )
+    ordered = sorted(
+        code_ages.items(),
+        key=lambda item: (-item[1].old_share, -churn.get(item[0], 0), item[0]),
+    )
+    print("Changes Old     Median age  Filenames")
+    for file_name, age in ordered[0:top_files]:
+        old = f"{age.old_share:.0%}"
+        median = f"{age.median_days:.0f} days"
+        print(f"{str(churn.get(file_name, 0)):8}{old:8}{median:12}{file_name}")
 
 
 def get_supported_languages() -> Dict[str, List[str]]:
@@ -396,8 +3322,29 @@ def get_supported_languages() -> Dict[str, List[str]]:
     }
 
 
+def get_text_formats() -> Dict[str, List[str]]:
+    """File types lizard cannot parse, only analyzed by the whitespace engine"""
+    return {
+        "css": [".css", ".scss", ".less"],
+        "html": [".html", ".htm"],
+        "make": [".mk"],
+        "shell": [".sh", ".bash", ".zsh"],
+        "sql": [".sql"],
+        "terraform": [".tf"],
+        "xml": [".xml"],
+        "yaml": [".yaml", ".yml"],
+    }
+
+
+def get_languages_for_engine(engine: str) -> Dict[str, List[str]]:
+    languages = get_supported_languages()
+    if engine == WHITESPACE_ENGINE:
+        languages.update(get_text_formats())
+    return languages
+
+
 def get_file_endings_for_languages(languages: Union[str, List[str]]) -> List[str]:
-    supported_languages = get_supported_languages()
+    supported_languages = get_languages_for_engine(WHITESPACE_ENGINE)
     language_file_endings = []
     if not isinstance(languages, list):
         languages = [languages]
@@ -407,38 +3354,160 @@ def get_file_endings_for_languages(languages: Union[str, List[str]]) -> List[str
     return language_file_endings
 
 
-def parse_arguments(incoming: List[str]) -> Any:
-    parser = argparse.ArgumentParser(
-        description="Find refactoring candidates by analyzing git history and code complexity.",
-        epilog="""Examples:
-  git outlier                            # analyze last 12 months (if installed as git add-on)
-  git-outlier                            # same as above, direct invocation
-  git outlier --since="6 months ago"     # analyze last 6 months  
-  git outlier --since="2023-01-01" --until="2023-12-31"  # specific date range
-  git outlier -l python -l javascript    # analyze only Python and JavaScript
-  git outlier --metric=NLOC              # use lines of code instead of cyclomatic complexity
+ANALYZER_ENTRY_POINTS = "git_outlier.analyzers"
+
+
+class AnalyzerPlugin(abc.ABC):
+    """Computes the metrics of batches of files, like lizard or an external tool.
+
+    Packages register plugin classes in the git_outlier.analyzers entry point
+    group, under the name --analyzer selects them by. A plugin is created once
+    per process and gets the files in batches of (path, content) pairs, so a
+    tool it starts or grammars it loads cost once per worker instead of once
+    per file. analyze_batch returns one FileMetrics, or a tuple in its field
+    order, per file and in the same order, with 0 in the fields the plugin
+    does not compute. Results are cached by blob, plugin name and version,
+    which defaults to the version of the package registering the plugin.
+    """
+
+    # File endings of the files the plugin analyzes
+    extensions: Sequence[str] = ()
+    # The --metric names of the fields it computes
+    metrics: Sequence[str] = tuple(METRIC_FIELDS)
+    # Most files in one batch
+    batch_size = 32
+    # Bump to discard the cached results of earlier versions
+    version = ""
+
+    @abc.abstractmethod
+    def analyze_batch(self, files: Sequence[Tuple[str, bytes]]) -> Sequence[Any]:
+        """One FileMetrics, or tuple of its fields, per (path, content) pair"""
+
+
+def get_indentation_metrics(content: bytes) -> FileMetrics:
+    indentation = get_indentation_complexity(content)
+    return FileMetrics(0, 0, 0, 0, 0, 0.0, indentation.total, indentation.lines)
+
+
+class LizardPlugin(AnalyzerPlugin):
+    """Every metric, from lizard's parse of the functions of each file"""
+
+    extensions = get_file_endings_for_languages(list(get_supported_languages()))
+
+    def analyze_batch(self, files: Sequence[Tuple[str, bytes]]) -> List[FileMetrics]:
+        records = []
+        for file_name, content in files:
+            indentation = get_indentation_complexity(content)
+            records.append(
+                get_file_metrics(run_analyzer_on_file(file_name, content))._replace(
+                    whitespace=indentation.total, text_lines=indentation.lines
+                )
+            )
+        return records
+
+
+class WhitespacePlugin(AnalyzerPlugin):
+    """Only the indentation, which any text file has"""
+
+    extensions = get_file_endings_for_languages(
+        list(get_languages_for_engine(WHITESPACE_ENGINE))
+    )
+    metrics = WHITESPACE_METRICS
+
+    def analyze_batch(self, files: Sequence[Tuple[str, bytes]]) -> List[FileMetrics]:
+        return [get_indentation_metrics(content) for _, content in files]
+
+
+class NlocPlugin(AnalyzerPlugin):
+    """Lines of code and indentation, from a scan of comments and strings"""
+
+    extensions = LizardPlugin.extensions
+    metrics = ["NLOC", *WHITESPACE_METRICS]
+
+    def analyze_batch(self, files: Sequence[Tuple[str, bytes]]) -> List[FileMetrics]:
+        return [
+            get_indentation_metrics(content)._replace(
+                nloc=count_nloc(file_name, content)
+            )
+            for file_name, content in files
+        ]
+
+
+BUILTIN_ANALYZERS: Dict[str, Type[AnalyzerPlugin]] = {
+    LIZARD_ENGINE: LizardPlugin,
+    WHITESPACE_ENGINE: WhitespacePlugin,
+    NLOC_ENGINE: NlocPlugin,
+}
+
+
+def get_analyzer_names() -> List[str]:
+    """The built-in analyzers, then those registered by installed packages"""
+    names = list(BUILTIN_ANALYZERS)
+    for entry_point in entry_points(group=ANALYZER_ENTRY_POINTS):
+        if entry_point.name not in names:
+            names.append(entry_point.name)
+    return names
+
+
+def get_analyzer_plugin_class(name: str) -> Type[AnalyzerPlugin]:
+    if name in BUILTIN_ANALYZERS:
+        return BUILTIN_ANALYZERS[name]
+    for entry_point in entry_points(group=ANALYZER_ENTRY_POINTS):
+        if entry_point.name == name:
+            try:
+                return entry_point.load()
+            except (ImportError, AttributeError) as err:
+                raise InvalidArgumentError(
+                    f"Cannot load analyzer {name}: {err}"
+                ) from err
+    raise InvalidArgumentError(
+        f"Unknown analyzer {name}, available: {', '.join(get_analyzer_names())}"
+    )
+
+
+@lru_cache(maxsize=None)
+def get_analyzer_plugin_version(name: str) -> str:
+    """The plugin's own version, else that of the package registering it"""
+    version = get_analyzer_plugin_class(name).version
+    if version:
+        return version
+    for entry_point in entry_points(group=ANALYZER_ENTRY_POINTS):
+        if entry_point.name == name and entry_point.dist is not None:
+            return entry_point.dist.version
+    return ""
+
 
-For more information, see: https://github.com/BjrnJhsn/git-outlier""",
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-    )
+@lru_cache(maxsize=None)
+def get_analyzer_plugin(name: str) -> AnalyzerPlugin:
+    """The plugin instance of this process, created on first use"""
+    return get_analyzer_plugin_class(name)()
+
+
+def get_analyzer_endings(name: str, metrics: Sequence[str]) -> List[str]:
+    """File endings the analyzer handles, if it computes every metric"""
+    plugin_class = get_analyzer_plugin_class(name)
+    missing = [metric for metric in metrics if metric not in plugin_class.metrics]
+    if missing:
+        raise InvalidArgumentError(
+            f"Analyzer {name} does not compute {', '.join(missing)}"
+        )
+    return list(plugin_class.extensions)
+
+
+def add_selection_arguments(parser: argparse.ArgumentParser) -> None:
     supported_languages = get_supported_languages()
-    supported_languages_list = [*supported_languages]
     parser.add_argument(
         "--languages",
         "-l",
         action="append",
         metavar="<lang>",
         help="Only analyze specified languages (can be repeated). "
-        f"Default: all supported languages. Available: {', '.join(sorted(supported_languages))}",
+        "Default: all supported languages. "
+        f"Available: {', '.join(sorted(supported_languages))}. "
+        "With the WHITESPACE metrics also: "
+        f"{', '.join(sorted(get_text_formats()))}",
         type=str,
     )
-    parser.add_argument(
-        "--metric",
-        "-m",
-        metavar="<type>",
-        help="Complexity metric to use: CCN (cyclomatic complexity) or NLOC (lines of code). Default: CCN",
-        default="CCN",
-    )
     parser.add_argument(
         "--since",
         metavar="<date>",
@@ -455,6 +3524,24 @@ For more information, see: https://github.com/BjrnJhsn/git-outlier""",
         default=None,
         type=str,
     )
+
+
+def add_report_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--metric",
+        "-m",
+        metavar="<type>",
+        help="Complexity metric to use: CCN (cyclomatic complexity), "
+        "NLOC (lines of code), MAX_CCN (highest function CCN), "
+        "AVG_CCN (average function CCN), TOKENS (token count), "
+        "FUNCTIONS (function count), "
+        "WHITESPACE (total indentation in levels of 4 columns) "
+        "or WHITESPACE_MEAN (indentation per line). The WHITESPACE metrics alone skip "
+        "lizard and also analyze text formats like YAML, SQL and shell scripts. NLOC, "
+        "alone or with them, is counted by a faster scanner than lizard. A "
+        "comma-separated list reports each metric from a single analysis. Default: CCN",
+        default="CCN",
+    )
     parser.add_argument(
         "--top",
         "-t",
@@ -464,11 +3551,46 @@ For more information, see: https://github.com/BjrnJhsn/git-outlier""",
         type=int,
     )
     parser.add_argument(
-        "path",
-        nargs="?",
-        default=".",
-        help="Path to git repository to analyze. Default: current directory",
+        "--threshold",
+        metavar="<policy>",
+        help="How outliers in the churn vs complexity plot are detected on both axes: "
+        "half-max (above half the maximum), percentile[:P] (top 100-P percent, default "
+        "90), iqr[:K] (above Q3 + K*IQR, default 1.5) or mad[:Z] (robust z-score above "
+        "Z, default 3.5). Default: half-max",
+        default="half-max",
+        type=str,
+    )
+
+
+def add_rollup_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--rollup",
+        metavar="<depth|auto>",
+        help="Also rank directories, <depth> levels below the repository root, by "
+        "the summed churn and complexity of their files, with the same outlier "
+        "detection. auto picks the shallowest depth with at least --top directories",
+        default=None,
     )
+    parser.add_argument(
+        "--rollup-path",
+        metavar="<dir>",
+        help="With --rollup, only rank the directories below <dir>, e.g. to drill "
+        "into a hotspot. The depth counts from <dir>",
+        default="",
+    )
+
+
+def add_progress_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--progress",
+        choices=["auto", "always", "never"],
+        help="Report progress, throughput and ETA of each stage on stderr. auto "
+        "reports only when stderr is a terminal. Default: auto",
+        default="auto",
+    )
+
+
+def add_verbose_argument(parser: argparse.ArgumentParser) -> None:
     parser.add_argument(
         "-v",
         "--verbose",
@@ -477,8 +3599,10 @@ For more information, see: https://github.com/BjrnJhsn/git-outlier""",
         help="Be more verbose (can be repeated for more detail)",
     )
 
-    args = parser.parse_args(incoming)
 
+def validate_selection_arguments(
+    parser: argparse.ArgumentParser, args: Any, engine: str = LIZARD_ENGINE
+) -> None:
     # Validate date parameters
     try:
         if args.since:
@@ -488,21 +3612,16 @@ For more information, see: https://github.com/BjrnJhsn/git-outlier""",
     except ValueError as e:
         parser.error(str(e))
 
-    ok_metrics = ["NLOC", "CCN"]
-    if args.metric not in ok_metrics:
-        parser.error(
-            str(args.metric)
-            + " is not a valid option for complexity metric. Please choose from: "
-            + str(ok_metrics)
-        )
-
-    supported_languages = get_supported_languages()
-    supported_languages_list = [*supported_languages]
-
+    supported_languages_list = [*get_languages_for_engine(engine)]
     if args.languages is None:
         args.languages = supported_languages_list
-
     if not all(elem in supported_languages_list for elem in args.languages):
+        text_formats = [elem for elem in args.languages if elem in get_text_formats()]
+        if text_formats:
+            parser.error(
+                f"{', '.join(text_formats)} can only be analyzed with the "
+                f"{' or '.join(WHITESPACE_METRICS)} metrics"
+            )
         parser.error(f"Unsupported languages: {args.languages}")
 
     levels = [logging.WARNING, logging.INFO, logging.DEBUG]
@@ -510,20 +3629,469 @@ For more information, see: https://github.com/BjrnJhsn/git-outlier""",
         min(len(levels) - 1, args.verbose)
     ]  # capped to number of levels
 
+
+def validate_report_arguments(parser: argparse.ArgumentParser, args: Any) -> None:
+    ok_metrics = [*METRIC_FIELDS]
+    args.metric = [metric.strip() for metric in args.metric.split(",")]
+    for metric in args.metric:
+        if metric not in ok_metrics:
+            parser.error(
+                str(metric)
+                + " is not a valid option for complexity metric. Please choose from: "
+                + str(ok_metrics)
+            )
+
+    try:
+        parse_threshold_policy(args.threshold)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.rollup is not None:
+        try:
+            args.rollup = parse_rollup_depth(args.rollup)
+        except ValueError as err:
+            parser.error(f"Invalid --rollup: {err}")
+    elif args.rollup_path:
+        parser.error("--rollup-path requires --rollup")
+
+
+def parse_arguments(incoming: List[str]) -> Any:
+    parser = argparse.ArgumentParser(
+        description="Find refactoring candidates by analyzing git history and code complexity.",
+        epilog="""Examples:
+  git outlier                            # analyze last 12 months (if installed as git add-on)
+  git-outlier                            # same as above, direct invocation
+  git outlier --since="6 months ago"     # analyze last 6 months  
+  git outlier --since="2023-01-01" --until="2023-12-31"  # specific date range
+  git outlier -l python -l javascript    # analyze only Python and JavaScript
+  git outlier --metric=NLOC              # use lines of code instead of cyclomatic complexity
+  git outlier --metric=CCN,NLOC          # report both metrics from one analysis
+  git outlier --metric=WHITESPACE        # indentation only, fast and for any text file
+  git outlier --compare=main...HEAD      # how a branch changed complexity and outliers
+  git outlier --history=12               # complexity of the top files over 12 months
+  git outlier --threshold=percentile:90  # outliers are in the top 10% on both axes
+  git outlier --jobs=0                   # analyze complexity on every CPU while reading the log
+  git outlier --ledger --since="3 years ago"  # read churn from the local commit ledger
+  git outlier --recurse-submodules -j 8  # one report for the repository and its submodules
+  git outlier --since="10 years ago" --sample-commits=0.1  # quick estimate from 10% of the commits
+  git outlier --rollup=auto              # also rank the directories of a monorepo
+  git outlier --since="20 years ago" --max-memory=2G  # exact churn within a memory budget
+  git outlier --outliers-only            # skip lizard for files that cannot be outliers
+  git outlier --time-budget=60 -j 0      # highest churn first, report what finished in 60s
+  git outlier --notes-cache=update       # share analysis results through refs/notes/git-outlier
+  git outlier --analyzer=nloc            # compute the metrics with one analyzer plugin
+  git outlier --code-age=12 -j 8         # share of churning lines older than a year
+  git log --numstat | git outlier --log-file=-  # churn from a log, e.g. an archived one
+
+For more information, see: https://github.com/BjrnJhsn/git-outlier""",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    add_selection_arguments(parser)
+    add_report_arguments(parser)
+    parser.add_argument(
+        "--analyzer",
+        metavar="<name>",
+        help="Analyzer plugin computing the metrics, for the file endings it "
+        f"declares. Packages register plugins as {ANALYZER_ENTRY_POINTS} entry "
+        f"points. Available: {', '.join(get_analyzer_names())}. Default: the "
+        "fastest built-in analyzer for the metrics",
+        default=None,
+    )
+    parser.add_argument(
+        "--approximate-churn",
+        metavar="<counters>",
+        help="Find the top churners approximately in fixed memory, tracking at most "
+        "<counters> files (Space-Saving). Counts are reported with error bounds. "
+        "Default: exact counting",
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--exact-recount",
+        action="store_true",
+        help="With --approximate-churn, recount the reported candidates exactly",
+    )
+    parser.add_argument(
+        "--sample-commits",
+        metavar="<fraction|n>",
+        help="Estimate churn quickly from a random sample of the commits in the "
+        "date range, either a fraction like 0.1 or a number of commits. Counts "
+        "are scaled up and ranks reported with a 95%% confidence interval",
+        default=None,
+    )
+    parser.add_argument(
+        "--sample-seed",
+        metavar="<n>",
+        help="Seed for --sample-commits, the same seed picks the same commits. "
+        "Default: 0",
+        default=0,
+        type=int,
+    )
+    parser.add_argument(
+        "--max-memory",
+        metavar="<size>",
+        help="Count the churn of the log within a memory budget like 512M or 2G "
+        "by spilling the counters to sorted files in the temporary directory, "
+        "which are merged at the end. Only the counting is bounded: the churn of "
+        "the files kept, the index and the metrics are held in memory afterwards, "
+        "and --jobs workers start once the merge is done. Of the files no longer "
+        "tracked only the --top most changed are kept, so the reports are the same "
+        "as without a budget. Default: no limit",
+        default=None,
+    )
+    parser.add_argument(
+        "--outliers-only",
+        action="store_true",
+        help="Only report churn and the churn vs complexity outliers, and only "
+        "analyze complexity for the files above the churn threshold of the "
+        "outlier plot. The complexity threshold is then taken among these files. "
+        "Requires the half-max threshold",
+    )
+    parser.add_argument(
+        "--time-budget",
+        metavar="<seconds>",
+        type=float,
+        help="Stop analyzing complexity when the run has taken this many seconds "
+        "and report what finished, with the share of files and churn covered. "
+        "Files are analyzed highest churn first, files in the blob cache always "
+        "count. Workers still analyzing are stopped. Blaming for --code-age and "
+        "writing --notes-cache come after the budget. Default: no limit",
+        default=None,
+    )
+    parser.add_argument(
+        "--notes-cache",
+        choices=["read", "update"],
+        help=f"Share the blob cache through the repository, as notes in {NOTES_REF}. "
+        "read adds the stored results for the files to the local cache before the "
+        "analysis, update also stores new results after the report, warning if "
+        "that fails. Fetch and push the notes ref to share them. Default: local "
+        "cache only",
+        default=None,
+    )
+    parser.add_argument(
+        "--code-age",
+        metavar="<months>",
+        help="Also report how old the lines of the files above the churn threshold "
+        "of the outlier plot are at the end of the window: their median age and "
+        "the share older than <months> months, from git blame. Blames are cached "
+        "per blob and last commit, so later runs only blame the changed files. "
+        "Default: off",
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--log-file",
+        metavar="<path|->",
+        help="Read churn from a saved git log --numstat, with or without -z, "
+        "instead of the history of the repository, or from stdin with -. "
+        "Complexity is still analyzed in the repository. A file is split at "
+        "commit boundaries and parsed in --jobs processes. Default: run git log",
+        default=None,
+    )
+    parser.add_argument(
+        "--ledger",
+        action="store_true",
+        help="Keep an indexed SQLite ledger of all commits in the repository and "
+        "read churn for the date range from it. Only commits not recorded yet "
+        "are read from git",
+    )
+    parser.add_argument(
+        "--path-prefix",
+        metavar="<dir>",
+        help="With --ledger, only count the churn of the files below <dir>, looked "
+        "up in the ledger's index of paths",
+        default="",
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="<base>..<head>",
+        help="Report how complexity, churn and outlier status changed between two "
+        "revisions, e.g. for a pull request. Only files that differ between the "
+        "revisions or have churn are read from the object store, and only blobs "
+        "missing from the blob cache are analyzed. Use <base>...<head> to compare "
+        "against the merge base",
+        default=None,
+        type=str,
+    )
+    parser.add_argument(
+        "--history",
+        metavar="<n>",
+        help="Show how the complexity of the top files evolved over <n> samples of "
+        "the history of HEAD instead of the usual reports. Each distinct blob is "
+        "analyzed once",
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--history-by",
+        choices=["month", "tag"],
+        help="Sample the history once per month, or at the most recent tags. "
+        "Default: month",
+        default="month",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        metavar="<n>",
+        help="Analyze complexity in <n> worker processes while the git log is still "
+        "being read, and run up to <n> blames at a time for --code-age. 0 starts "
+        "one worker per CPU. Default: 1 (no workers)",
+        default=1,
+        type=int,
+    )
+    add_progress_argument(parser)
+    parser.add_argument(
+        "--recurse-submodules",
+        action="store_true",
+        help="Also analyze the checked out submodules, as one tree with paths "
+        "prefixed by the submodule path. Uses --jobs for the git logs and the "
+        "complexity workers",
+    )
+    add_rollup_arguments(parser)
+    parser.add_argument(
+        "path",
+        nargs="?",
+        default=".",
+        help="Path to git repository to analyze. Default: current directory",
+    )
+    add_verbose_argument(parser)
+
+    args = parser.parse_args(incoming)
+
+    validate_report_arguments(parser, args)
+    if args.analyzer is not None:
+        if args.languages is not None:
+            parser.error(
+                "--analyzer cannot be combined with --languages, the analyzer "
+                "decides the file endings"
+            )
+        try:
+            get_analyzer_endings(args.analyzer, args.metric)
+        except InvalidArgumentError as err:
+            parser.error(str(err))
+    validate_selection_arguments(parser, args, get_engine_for_metrics(args.metric))
+
+    if args.jobs < 0:
+        parser.error("--jobs must not be negative")
+    if args.jobs == 0:
+        args.jobs = os.cpu_count() or 1
+
+    if args.history is not None and args.history < 1:
+        parser.error("--history needs at least one sample")
+
+    if args.compare is not None and ".." not in args.compare:
+        parser.error("--compare expects a revision range like main..HEAD")
+    if args.compare is not None and (
+        args.ledger
+        or args.approximate_churn is not None
+        or args.sample_commits
+        or args.max_memory
+        or args.outliers_only
+        or args.time_budget
+        or args.history
+        or args.recurse_submodules
+        or args.rollup is not None
+    ):
+        parser.error(
+            "--compare cannot be combined with --ledger, --approximate-churn, "
+            "--sample-commits, --max-memory, --outliers-only, --time-budget, "
+            "--history, --recurse-submodules or --rollup"
+        )
+
+    if args.approximate_churn is not None and args.approximate_churn < 1:
+        parser.error("--approximate-churn needs at least one counter")
+    if args.approximate_churn is not None and args.approximate_churn < args.top:
+        parser.error("--approximate-churn must track at least --top counters")
+    if args.exact_recount and args.approximate_churn is None:
+        parser.error("--exact-recount requires --approximate-churn")
+    if args.ledger and args.approximate_churn is not None:
+        parser.error("--ledger cannot be combined with --approximate-churn")
+    if args.path_prefix and not args.ledger:
+        parser.error("--path-prefix requires --ledger")
+    if args.sample_commits is not None:
+        try:
+            args.sample_commits = parse_sample_size(args.sample_commits)
+        except ValueError as err:
+            parser.error(f"Invalid --sample-commits: {err}")
+        if args.ledger or args.approximate_churn is not None or args.recurse_submodules:
+            parser.error(
+                "--sample-commits cannot be combined with --ledger, "
+                "--approximate-churn or --recurse-submodules"
+            )
+    if args.max_memory is not None:
+        try:
+            args.max_memory = parse_memory_size(args.max_memory)
+        except ValueError as err:
+            parser.error(f"Invalid --max-memory: {err}")
+        if (
+            args.ledger
+            or args.approximate_churn is not None
+            or args.sample_commits
+            or args.recurse_submodules
+        ):
+            parser.error(
+                "--max-memory cannot be combined with --ledger, --approximate-churn, "
+                "--sample-commits or --recurse-submodules"
+            )
+    if args.outliers_only and (
+        args.ledger
+        or args.approximate_churn is not None
+        or args.sample_commits
+        or args.recurse_submodules
+        or args.rollup is not None
+    ):
+        parser.error(
+            "--outliers-only cannot be combined with --ledger, --approximate-churn, "
+            "--sample-commits, --recurse-submodules or --rollup"
+        )
+    if args.outliers_only and parse_threshold_policy(args.threshold)[0] != "half-max":
+        # Their complexity threshold is a quantile over every file
+        parser.error("--outliers-only requires the half-max threshold")
+    if args.time_budget is not None:
+        if args.time_budget <= 0:
+            parser.error("--time-budget must be a positive number of seconds")
+        if (
+            args.ledger
+            or args.approximate_churn is not None
+            or args.sample_commits
+            or args.recurse_submodules
+        ):
+            parser.error(
+                "--time-budget cannot be combined with --ledger, --approximate-churn, "
+                "--sample-commits or --recurse-submodules"
+            )
+    if args.notes_cache and (args.compare or args.history or args.recurse_submodules):
+        parser.error(
+            "--notes-cache cannot be combined with --compare, --history or "
+            "--recurse-submodules"
+        )
+    if args.code_age is not None:
+        if args.code_age < 1:
+            parser.error("--code-age needs at least one month")
+        if args.compare or args.history or args.recurse_submodules:
+            parser.error(
+                "--code-age cannot be combined with --compare, --history or "
+                "--recurse-submodules"
+            )
+    if args.log_file is not None and (
+        args.since
+        or args.until
+        or args.ledger
+        or args.approximate_churn is not None
+        or args.sample_commits
+        or args.max_memory
+        or args.outliers_only
+        or args.time_budget
+        or args.compare
+        or args.history
+        or args.recurse_submodules
+        or args.code_age
+    ):
+        parser.error(
+            "--log-file holds the churn of its own window, it cannot be combined "
+            "with --since, --until, --ledger, --approximate-churn, "
+            "--sample-commits, --max-memory, --outliers-only, --time-budget, "
+            "--compare, --history, --recurse-submodules or --code-age"
+        )
+    if args.recurse_submodules and (args.ledger or args.approximate_churn is not None):
+        parser.error(
+            "--recurse-submodules cannot be combined with --ledger or "
+            "--approximate-churn"
+        )
+
+    return args
+
+
+def parse_slice_argument(parser: argparse.ArgumentParser, text: str) -> SliceCoverage:
+    try:
+        return parse_slice(text)
+    except ValueError as err:
+        parser.error(str(err))
+        raise
+
+
+def parse_shard_arguments(incoming: List[str]) -> Any:
+    parser = argparse.ArgumentParser(
+        prog="git-outlier shard",
+        description="Analyze a slice of the commits and of the changed files and "
+        "write the partial result to a shard file for git-outlier merge.",
+        epilog="""Examples:
+  git outlier shard --commits=0/4 --files=0/4 -o shard0.json  # machine 1 of 4
+  git outlier shard --commits=1/4 --files=1/4 -o shard1.json  # machine 2 of 4""",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    add_selection_arguments(parser)
+    parser.add_argument(
+        "--commits",
+        metavar="<i/n>",
+        help="Count churn for the i-th of n slices of the commits in the date "
+        "range, counting from 0. Default: 0/1 (all commits)",
+        default="0/1",
+    )
+    parser.add_argument(
+        "--files",
+        metavar="<i/n>",
+        help="Analyze complexity for the i-th of n slices of the changed files, "
+        "counting from 0. Default: 0/1 (all files)",
+        default="0/1",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        metavar="<file>",
+        help="Shard file to write",
+        required=True,
+    )
+    add_progress_argument(parser)
+    parser.add_argument(
+        "path",
+        nargs="?",
+        default=".",
+        help="Path to git repository to analyze. Default: current directory",
+    )
+    add_verbose_argument(parser)
+
+    args = parser.parse_args(incoming)
+    validate_selection_arguments(parser, args)
+    args.commits = parse_slice_argument(parser, args.commits)
+    args.files = parse_slice_argument(parser, args.files)
+    return args
+
+
+def parse_merge_arguments(incoming: List[str]) -> Any:
+    parser = argparse.ArgumentParser(
+        prog="git-outlier merge",
+        description="Combine shard files into the report of a single run, or into "
+        "one shard file.",
+        epilog="""Examples:
+  git outlier merge shard*.json          # report once every slice is there
+  git outlier merge -o half.json shard0.json shard1.json  # merge in stages""",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    add_report_arguments(parser)
+    add_rollup_arguments(parser)
+    parser.add_argument(
+        "--output",
+        "-o",
+        metavar="<file>",
+        help="Write the merged shard to <file> instead of printing the report",
+        default=None,
+    )
+    parser.add_argument("shards", nargs="+", metavar="<shard>", help="Shard files")
+    add_verbose_argument(parser)
+
+    args = parser.parse_args(incoming)
+    validate_report_arguments(parser, args)
+    args.level = [logging.WARNING, logging.INFO, logging.DEBUG][min(2, args.verbose)]
     return args
 
 
 def change_directory(path_to_switch: str) -> str:
     startup_path = os.getcwd()
     try:
-        expanded_path = os.path.expanduser(path_to_switch)
-        os.chdir(expanded_path)
+        os.chdir(os.path.expanduser(path_to_switch))
     except OSError as err:
-        logging.error(f"OS error: {err}")
-        sys.exit(1)
-    except Exception as err:
-        logging.error("Unexpected error: %s", err)
-        sys.exit(1)
+        raise RepositoryPathError(f"Cannot open repository: {err}") from err
     return startup_path
 
 
@@ -531,11 +4099,7 @@ def restore_directory(path: str) -> None:
     try:
         os.chdir(path)
     except OSError as err:
-        logging.error(f"OS error: {err}")
-        sys.exit(1)
-    except Exception as err:
-        logging.error("Unexpected error: %s", err)
-        sys.exit(1)
+        raise RepositoryPathError(f"Cannot return to {path}: {err}") from err
 
 
 def parse_git_date(date_str: Optional[str], default_months_ago: int = 0) -> str:
@@ -616,41 +4180,316 @@ def get_date_range(
     return start_date, end_date
 
 
-def main() -> None:
+def get_progress_reporter(mode: str) -> ProgressReporter:
+    enabled = mode == "always" or (mode == "auto" and sys.stderr.isatty())
+    return ProgressReporter(enabled)
+
 
-    options = parse_arguments(sys.argv[1:])
+def main() -> None:
+    # Subcommands are given as the first argument
+    commands = {
+        "shard": (parse_shard_arguments, run_shard),
+        "merge": (parse_merge_arguments, run_merge),
+    }
+    arguments = sys.argv[1:]
+    if arguments and arguments[0] in commands:
+        parse, command = commands[arguments[0]]
+        options = parse(arguments[1:])
+    else:
+        command = run_analysis
+        options = parse_arguments(arguments)
     logging.basicConfig(
         level=options.level, format="%(asctime)s %(levelname)s %(message)s"
     )
+    run(command, options)
+
 
+def run(command: Callable[[Any], None], options: Any) -> None:
+    """Run a command with its parsed options, exiting with the code of its error"""
+    try:
+        command(options)
+    except GitOutlierError as err:
+        logging.error(err)
+        sys.exit(err.exit_code)
+
+
+def run_analysis(options: Any) -> None:
+    """The reports of the mode the options select, for the repository they name"""
     startup_path = change_directory(options.path)
+    try:
+        index_blobs = None
+        if options.notes_cache:
+            index_blobs = {entry.blob_id for entry in read_index_snapshot().values()}
+            import_notes_cache(index_blobs)
 
-    endings = get_file_endings_for_languages(options.languages)
-    start_date, end_date = get_date_range(options.since, options.until)
-    (
-        computed_complexity,
-        churn,
-        filtered_file_names,
-    ) = get_git_and_complexity_data(endings, options.metric, start_date, end_date)
+        if options.analyzer:
+            endings = get_analyzer_endings(options.analyzer, options.metric)
+            engine = options.analyzer
+        else:
+            endings = get_file_endings_for_languages(options.languages)
+            engine = get_engine_for_metrics(options.metric)
+        start_date, end_date = get_date_range(options.since, options.until)
+        if options.compare:
+            run_compare(options, endings, engine, start_date, end_date)
+        elif options.history:
+            run_history(options, endings, engine)
+        else:
+            run_report(options, endings, engine, start_date, end_date, index_blobs)
+    finally:
+        restore_directory(startup_path)
 
-    restore_directory(startup_path)
 
-    print_churn_outliers(start_date, churn, endings, options.top)
+def run_compare(
+    options: Any,
+    endings: List[str],
+    engine: str,
+    start_date: str,
+    end_date: Optional[str],
+) -> None:
+    base, head = resolve_revision_range(options.compare)
+    compare_data = get_compare_data(base, head, endings, start_date, end_date, engine)
+    for metric in options.metric:
+        deltas = get_compare_deltas(*compare_data, metric, options.threshold)
+        print_compare_report(deltas, metric, base, head)
+    print_big_separator()
+
 
-    print_complexity_outliers(
-        computed_complexity, options.metric, start_date, endings, options.top
+def run_history(options: Any, endings: List[str], engine: str) -> None:
+    revisions = get_history_revisions(
+        options.history, options.history_by, options.until
     )
+    history = get_complexity_history(revisions, endings, engine)
+    labels = [label for label, _ in revisions]
+    for metric in options.metric:
+        print_complexity_history(history, labels, metric, options.top)
+    print_big_separator()
+
+
+def run_report(
+    options: Any,
+    endings: List[str],
+    engine: str,
+    start_date: str,
+    end_date: Optional[str],
+    index_blobs: Optional[Set[str]] = None,
+) -> None:
+    """Churn from the source the options select, complexity, and the reports"""
+    progress = get_progress_reporter(options.progress)
+    churn_errors = None
+    rank_intervals = None
+    churn_printed = False
+    if options.approximate_churn is not None:
+        churn, churn_errors = get_approximate_churn_data(
+            endings,
+            start_date,
+            end_date,
+            options.approximate_churn,
+            options.top,
+            options.exact_recount,
+        )
+        filtered_file_names = list(churn)
+        print("Computing complexity...")
+        metrics = get_metrics_for_files_in_index(filtered_file_names, progress, engine)
+    elif options.sample_commits:
+        churn, rank_intervals = get_sampled_churn_data(
+            endings,
+            start_date,
+            end_date,
+            options.sample_commits,
+            options.sample_seed,
+        )
+        filtered_file_names = list(churn)
+        print("Computing complexity...")
+        metrics = get_metrics_for_files_in_index(filtered_file_names, progress, engine)
+    elif options.log_file:
+        churn, filtered_file_names = get_log_file_churn_data(
+            options.log_file, endings, options.jobs
+        )
+        start_date = LOG_FILE_START
+        print("Computing complexity...")
+        metrics = get_metrics_for_files_in_index(filtered_file_names, progress, engine)
+        print(f"{len(filtered_file_names)} files analyzed.")
+    elif options.ledger:
+        churn, filtered_file_names = get_ledger_churn_data(
+            endings, start_date, end_date, options.path_prefix
+        )
+        print("Computing complexity...")
+        metrics = get_metrics_for_files_in_index(filtered_file_names, progress, engine)
+        print(f"{len(filtered_file_names)} files analyzed.")
+    elif options.recurse_submodules:
+        metrics, churn, filtered_file_names = (
+            get_git_and_complexity_data_with_submodules(
+                endings, start_date, end_date, options.jobs, progress, engine
+            )
+        )
+    elif options.jobs > 1:
+
+        def print_churn(churn: Dict[str, int]) -> None:
+            print_churn_outliers(start_date, churn, endings, options.top)
+
+        metrics, churn, filtered_file_names = get_git_and_complexity_data_pipelined(
+            endings,
+            start_date,
+            end_date,
+            options.jobs,
+            print_churn,
+            progress,
+            options.max_memory,
+            options.top,
+            options.outliers_only,
+            options.threshold,
+            options.time_budget,
+            engine,
+        )
+        churn_printed = True
+    else:
+        metrics, churn, filtered_file_names = get_git_and_complexity_data(
+            endings,
+            start_date,
+            end_date,
+            progress,
+            options.max_memory,
+            options.top,
+            options.outliers_only,
+            options.threshold,
+            options.time_budget,
+            engine,
+        )
+
+    code_ages = None
+    if options.code_age is not None:
+        candidates, _ = get_outlier_candidates(
+            churn, filtered_file_names, read_index_snapshot(), options.threshold
+        )
+        outside_budget = ", outside the time budget" if options.time_budget else ""
+        print(
+            f"Blaming {len(candidates)} files above the churn threshold"
+            f"{outside_budget}..."
+        )
+        code_ages = get_code_ages(
+            candidates, start_date, end_date, options.code_age, options.jobs
+        )
 
-    print_churn_and_complexity_outliers(
-        computed_complexity,
+    print_reports(
+        options,
+        start_date,
+        endings,
+        metrics,
         churn,
         filtered_file_names,
-        options.metric,
-        start_date,
+        churn_printed,
+        churn_errors,
+        rank_intervals,
+        complexity_report=not options.outliers_only,
+        code_ages=code_ages,
     )
 
+    if options.notes_cache == "update" and index_blobs is not None:
+        # After the report, which does not depend on sharing the results
+        try:
+            export_notes_cache(index_blobs)
+        except GitCommandError as err:
+            logging.warning(f"Could not write the notes to {NOTES_REF}: {err}")
+
+
+def print_reports(
+    options: Any,
+    start_date: str,
+    endings: List[str],
+    metrics: Dict[str, FileMetrics],
+    churn: Dict[str, int],
+    filtered_file_names: List[str],
+    churn_printed: bool = False,
+    churn_errors: Optional[Dict[str, int]] = None,
+    rank_intervals: Optional[Dict[str, Tuple[int, int]]] = None,
+    complexity_report: bool = True,
+    code_ages: Optional[Dict[str, CodeAge]] = None,
+) -> None:
+    """The churn, complexity and outlier reports, and the code age and rollup reports"""
+    if not churn_printed:
+        print_churn_outliers(
+            start_date, churn, endings, options.top, churn_errors, rank_intervals
+        )
+
+    for metric in options.metric:
+        computed_complexity = select_complexity_metric(metrics, metric)
+        # Without the files below the churn threshold the list would be wrong
+        if complexity_report:
+            print_complexity_outliers(
+                computed_complexity, metric, start_date, endings, options.top
+            )
+
+        print_churn_and_complexity_outliers(
+            computed_complexity,
+            churn,
+            filtered_file_names,
+            metric,
+            start_date,
+            options.threshold,
+        )
+        if not complexity_report:
+            print(
+                "Only the files above the churn threshold were analyzed, the "
+                "complexity threshold is taken among them."
+            )
+
+    if code_ages is not None:
+        print_code_age_outliers(code_ages, churn, options.code_age, options.top)
+
+    if options.rollup is not None:
+        tree = build_rollup_tree(churn, metrics, filtered_file_names)
+        for metric in options.metric:
+            print_rollup_report(
+                tree,
+                metric,
+                start_date,
+                options.rollup,
+                options.rollup_path,
+                options.top,
+                options.threshold,
+            )
+
     print_big_separator()
 
 
+def run_shard(options: Any) -> None:
+    startup_path = change_directory(options.path)
+    try:
+        endings = get_file_endings_for_languages(options.languages)
+        start_date, end_date = get_date_range(options.since, options.until)
+        shard = create_shard(
+            endings,
+            start_date,
+            end_date,
+            options.commits,
+            options.files,
+            get_progress_reporter(options.progress),
+        )
+    finally:
+        restore_directory(startup_path)
+    # The output path is relative to where the command was started
+    save_shard(options.output, shard)
+    print(
+        f"Wrote {options.output}: churn of {len(shard.churn)} files, "
+        f"metrics of {len(shard.metrics)} files."
+    )
+
+
+def run_merge(options: Any) -> None:
+    try:
+        shard = merge_shards([load_shard(path) for path in options.shards])
+    except ValueError as err:
+        raise InvalidArgumentError(str(err)) from err
+    if options.output:
+        save_shard(options.output, shard)
+        print(
+            f"Wrote {options.output}: commit slices {shard.commits}, "
+            f"file slices {shard.files}."
+        )
+        return
+    metrics, churn, file_names = get_shard_data(shard)
+    print_reports(options, shard.since, list(shard.endings), metrics, churn, file_names)
+
+
 if __name__ == "__main__":
     main()
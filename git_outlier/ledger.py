@@ -0,0 +1,187 @@
+"""Local SQLite ledger of per-commit file changes, queried by date range."""
+
+import os
+import sqlite3
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+LEDGER_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS commits (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    timestamp INTEGER NOT NULL,
+    author TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS paths (
+    id INTEGER PRIMARY KEY,
+    path BLOB NOT NULL UNIQUE,
+    extension BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    commit_id INTEGER NOT NULL,
+    timestamp INTEGER NOT NULL,
+    path_id INTEGER NOT NULL,
+    added INTEGER,
+    deleted INTEGER
+);
+CREATE INDEX IF NOT EXISTS changes_by_time ON changes (timestamp, path_id);
+CREATE INDEX IF NOT EXISTS changes_by_path ON changes (path_id, timestamp);
+CREATE INDEX IF NOT EXISTS paths_by_extension ON paths (extension);
+"""
+
+
+class FileChange(NamedTuple):
+    path: bytes
+    # None for binary files, which numstat reports as "-"
+    added: Optional[int]
+    deleted: Optional[int]
+
+
+class CommitRecord(NamedTuple):
+    commit: str
+    timestamp: int
+    author: str
+    changes: List[FileChange]
+
+
+def get_prefix_upper_bound(prefix: bytes) -> Optional[bytes]:
+    """Smallest byte string sorting after every string that starts with prefix"""
+    stripped = prefix.rstrip(b"\xff")
+    if not stripped:
+        return None
+    return stripped[:-1] + bytes([stripped[-1] + 1])
+
+
+class CommitLedger:
+    """Commits and the files they changed, indexed by time and by path.
+
+    ``tip`` is the commit the ledger was last brought up to date with. Every
+    commit reachable from it is recorded, so only ``tip..HEAD`` needs to be
+    read from git on the next run.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(SCHEMA)
+        if self._get_meta("version") != str(LEDGER_VERSION):
+            self.reset()
+        self._path_ids: Optional[Dict[bytes, int]] = None
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._connection.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    @property
+    def tip(self) -> Optional[str]:
+        return self._get_meta("tip")
+
+    @property
+    def commit_count(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM commits").fetchone()[0]
+
+    def reset(self) -> None:
+        """Forget every recorded commit, e.g. after history was rewritten"""
+        with self._connection:
+            for table in ["meta", "commits", "paths", "changes"]:
+                self._connection.execute(f"DELETE FROM {table}")
+            self._set_meta("version", str(LEDGER_VERSION))
+        self._path_ids = None
+
+    def _get_path_id(self, path: bytes) -> int:
+        if self._path_ids is None:
+            self._path_ids = dict(
+                self._connection.execute("SELECT path, id FROM paths").fetchall()
+            )
+        path_id = self._path_ids.get(path)
+        if path_id is None:
+            cursor = self._connection.execute(
+                "INSERT INTO paths (path, extension) VALUES (?, ?)",
+                (path, os.path.splitext(path)[1]),
+            )
+            path_id = cursor.lastrowid
+            assert path_id is not None
+            self._path_ids[path] = path_id
+        return path_id
+
+    def append(self, records: Iterable[CommitRecord], tip: str) -> int:
+        """Record the commits that are not in the ledger yet and move the tip"""
+        added = 0
+        with self._connection:
+            for record in records:
+                cursor = self._connection.execute(
+                    "INSERT OR IGNORE INTO commits (hash, timestamp, author) "
+                    "VALUES (?, ?, ?)",
+                    (record.commit, record.timestamp, record.author),
+                )
+                if cursor.rowcount == 0:
+                    continue
+                self._connection.executemany(
+                    "INSERT INTO changes "
+                    "(commit_id, timestamp, path_id, added, deleted) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (
+                            cursor.lastrowid,
+                            record.timestamp,
+                            self._get_path_id(change.path),
+                            change.added,
+                            change.deleted,
+                        )
+                        for change in record.changes
+                    ],
+                )
+                added += 1
+            self._set_meta("tip", tip)
+        return added
+
+    def churn(
+        self,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        extensions: Optional[Sequence[bytes]] = None,
+        prefix: Optional[bytes] = None,
+    ) -> Dict[bytes, int]:
+        """Number of commits changing each path with since <= timestamp < until"""
+        conditions = []
+        parameters: List[object] = []
+        if since is not None:
+            conditions.append("changes.timestamp >= ?")
+            parameters.append(since)
+        if until is not None:
+            conditions.append("changes.timestamp < ?")
+            parameters.append(until)
+        if extensions is not None:
+            placeholders = ", ".join("?" for _ in extensions)
+            conditions.append(f"paths.extension IN ({placeholders})")
+            parameters.extend(extensions)
+        if prefix:
+            conditions.append("paths.path >= ?")
+            parameters.append(prefix)
+            upper_bound = get_prefix_upper_bound(prefix)
+            if upper_bound is not None:
+                conditions.append("paths.path < ?")
+                parameters.append(upper_bound)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._connection.execute(
+            "SELECT paths.path, COUNT(*) FROM changes "
+            "JOIN paths ON paths.id = changes.path_id "
+            f"{where} GROUP BY changes.path_id",
+            parameters,
+        )
+        return {bytes(path): count for path, count in rows}
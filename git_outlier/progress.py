@@ -0,0 +1,138 @@
+"""Throttled progress lines on stderr for the long running stages."""
+
+import sys
+import time
+from typing import IO, Callable, Iterable, Iterator, Optional
+
+# Seconds between two progress lines of a stage
+PROGRESS_INTERVAL = 2.0
+
+
+def format_count(value: float) -> str:
+    return f"{value:,.0f}"
+
+
+def format_size(size: float) -> str:
+    for unit in ["B", "KiB", "MiB"]:
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def format_duration(seconds: float) -> str:
+    hours, rest = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}h{minutes:02}m"
+    if minutes:
+        return f"{minutes}m{seconds:02}s"
+    return f"{seconds}s"
+
+
+class ProgressReporter:
+    """Reports the progress of one stage at a time, at most once per interval.
+
+    A disabled reporter returns from every call right away. An update only adds
+    to two counters and reads the clock, so it can be called per chunk or per
+    file. On a terminal the line is rewritten in place, elsewhere, e.g. in a
+    CI log, every report is a line of its own.
+    """
+
+    def __init__(
+        self,
+        enabled: bool,
+        stream: Optional[IO[str]] = None,
+        interval: float = PROGRESS_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.enabled = enabled
+        self.stream = stream if stream is not None else sys.stderr
+        self.interval = interval
+        self.clock = clock
+        self._rewrite = enabled and self.stream.isatty()
+        self.stage = ""
+        self.unit = ""
+        self.total: Optional[int] = None
+        self.total_size: Optional[int] = None
+        self.done = 0
+        self.size = 0
+        self._started = 0.0
+        self._next_report = 0.0
+
+    def start(
+        self,
+        stage: str,
+        unit: str,
+        total: Optional[int] = None,
+        total_size: Optional[int] = None,
+    ) -> None:
+        if not self.enabled:
+            return
+        self.stage = stage
+        self.unit = unit
+        self.total = total
+        self.total_size = total_size
+        self.done = 0
+        self.size = 0
+        self._started = self.clock()
+        self._next_report = self._started + self.interval
+
+    def update(self, done: int = 0, size: int = 0) -> None:
+        if not self.enabled:
+            return
+        self.done += done
+        self.size += size
+        now = self.clock()
+        if now >= self._next_report:
+            self._next_report = now + self.interval
+            self._write(self.get_line(now))
+
+    def track_chunks(
+        self, chunks: Iterable[bytes], marker: Optional[bytes] = None
+    ) -> Iterator[bytes]:
+        """Pass chunks through, counting their bytes and the markers in them"""
+        if not self.enabled:
+            yield from chunks
+            return
+        for chunk in chunks:
+            self.update(chunk.count(marker) if marker else 0, len(chunk))
+            yield chunk
+
+    def finish(self) -> None:
+        if not self.enabled or not self.stage:
+            return
+        self._write(self.get_line(self.clock(), final=True), final=True)
+        self.stage = ""
+
+    def get_eta(self, elapsed: float) -> Optional[float]:
+        if self.total_size and self.size:
+            return elapsed * (self.total_size - self.size) / self.size
+        if self.total and self.done:
+            return elapsed * (self.total - self.done) / self.done
+        return None
+
+    def get_line(self, now: float, final: bool = False) -> str:
+        elapsed = max(now - self._started, 1e-6)
+        count = format_count(self.done)
+        if self.total is not None:
+            count += f"/{format_count(self.total)}"
+        parts = [
+            f"{self.stage}: {count} {self.unit}",
+            f"{format_count(self.done / elapsed)} {self.unit}/s",
+        ]
+        if self.size:
+            parts.append(f"{format_size(self.size / elapsed)}/s")
+        eta = None if final else self.get_eta(elapsed)
+        if final:
+            parts.append(f"done in {format_duration(elapsed)}")
+        elif eta is not None:
+            parts.append(f"ETA {format_duration(eta)}")
+        return ", ".join(parts)
+
+    def _write(self, line: str, final: bool = False) -> None:
+        if self._rewrite:
+            self.stream.write(f"\r\x1b[K{line}" + ("\n" if final else ""))
+        else:
+            self.stream.write(f"{line}\n")
+        self.stream.flush()
@@ -0,0 +1,133 @@
+"""Per-file values combined up the directory tree, for reports per directory."""
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+# Label suffix of the files directly inside a directory that also has
+# subdirectories in the report, e.g. "src/*"
+OWN_FILES_SUFFIX = "*"
+
+
+class DirectoryNode:
+    """A directory with the combined values of its own files and its subtree.
+
+    ``own`` combines only the files directly inside the directory, ``total``
+    also every subdirectory. Both are None while no file contributes to them.
+    """
+
+    __slots__ = ("path", "depth", "children", "own", "own_files", "total", "files")
+
+    def __init__(self, path: str, depth: int) -> None:
+        self.path = path
+        self.depth = depth
+        self.children: Dict[str, "DirectoryNode"] = {}
+        self.own: Optional[Any] = None
+        self.own_files = 0
+        self.total: Optional[Any] = None
+        self.files = 0
+
+
+class RollupUnit(NamedTuple):
+    label: str
+    value: Any
+    files: int
+
+
+def get_directory_label(path: str) -> str:
+    return f"{path}/" if path else "./"
+
+
+def add_values(
+    first: Optional[Any], second: Optional[Any], combine: Callable[[Any, Any], Any]
+) -> Optional[Any]:
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return combine(first, second)
+
+
+def build_directory_tree(
+    file_values: Dict[str, Any], combine: Callable[[Any, Any], Any]
+) -> DirectoryNode:
+    """Insert every file, then combine all subtrees in one post-order pass"""
+    root = DirectoryNode("", 0)
+    for file_name, value in file_values.items():
+        node = root
+        for part in file_name.split("/")[:-1]:
+            child = node.children.get(part)
+            if child is None:
+                path = f"{node.path}/{part}" if node.path else part
+                child = DirectoryNode(path, node.depth + 1)
+                node.children[part] = child
+            node = child
+        node.own = add_values(node.own, value, combine)
+        node.own_files += 1
+
+    # Children are finished before their parent, without recursing, as
+    # generated paths can be deeper than the recursion limit
+    stack: List[Tuple[DirectoryNode, bool]] = [(root, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if not children_done:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.children.values())
+            continue
+        node.total = node.own
+        node.files = node.own_files
+        for child in node.children.values():
+            node.total = add_values(node.total, child.total, combine)
+            node.files += child.files
+    return root
+
+
+def find_directory(root: DirectoryNode, path: str) -> Optional[DirectoryNode]:
+    node: Optional[DirectoryNode] = root
+    for part in path.strip("/").split("/"):
+        if part in ("", "."):
+            continue
+        if node is None:
+            return None
+        node = node.children.get(part)
+    return node
+
+
+def get_tree_depth(node: DirectoryNode) -> int:
+    """Levels of subdirectories below node"""
+    deepest = node.depth
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        deepest = max(deepest, current.depth)
+        stack.extend(current.children.values())
+    return deepest - node.depth
+
+
+def get_rollup_units(node: DirectoryNode, depth: int) -> List[RollupUnit]:
+    """Cut the tree depth levels below node.
+
+    Directories on that level report their whole subtree. Files above it are
+    reported with the directory they are in, so every file is in one unit.
+    """
+    units = []
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        label = get_directory_label(current.path)
+        if current.depth - node.depth == depth or not current.children:
+            units.append(RollupUnit(label, current.total, current.files))
+            continue
+        if current.own_files:
+            units.append(
+                RollupUnit(label + OWN_FILES_SUFFIX, current.own, current.own_files)
+            )
+        stack.extend(current.children.values())
+    return units
+
+
+def choose_rollup_depth(node: DirectoryNode, minimum_units: int) -> int:
+    """Shallowest depth with at least minimum_units units, or the deepest one"""
+    deepest = max(get_tree_depth(node), 1)
+    for depth in range(1, deepest):
+        if len(get_rollup_units(node, depth)) >= minimum_units:
+            return depth
+    return deepest
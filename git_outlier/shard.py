@@ -0,0 +1,177 @@
+"""Partial results of a sliced analysis, merged into the result of one run."""
+
+import json
+import zlib
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+SHARD_FORMAT = "git-outlier-shard"
+# Bumped whenever the fields of the complexity records change, shards store
+# them as plain tuples. Version 2 added the whitespace fields.
+SHARD_VERSION = 2
+
+
+class SliceCoverage(NamedTuple):
+    """Which of the ``of`` parts of the commits or files a shard holds"""
+
+    of: int
+    parts: Tuple[int, ...]
+
+    @property
+    def complete(self) -> bool:
+        return self.parts == tuple(range(self.of))
+
+    def __str__(self) -> str:
+        return f"{','.join(map(str, self.parts)) or 'none'} of {self.of}"
+
+
+def parse_slice(text: str) -> SliceCoverage:
+    """Coverage of a slice given as i/n, the i-th of n parts counted from 0"""
+    part, _, count = text.partition("/")
+    try:
+        coverage = SliceCoverage(int(count), (int(part),))
+    except ValueError:
+        raise ValueError(f"expected a slice like 0/4, got '{text}'")
+    if not 0 <= coverage.parts[0] < coverage.of:
+        raise ValueError(f"slice {text} is not one of the {coverage.of} parts")
+    return coverage
+
+
+def get_path_part(path: str, count: int) -> int:
+    """The part a file belongs to, the same on every machine"""
+    return zlib.crc32(path.encode("utf-8", "surrogateescape")) % count
+
+
+class ChurnRecord(NamedTuple):
+    changes: int
+    # Where the file first appears in the log of a single run: the position of
+    # the newest commit changing it and the file's position in that commit
+    commit_position: int
+    position_in_commit: int
+
+
+class Shard(NamedTuple):
+    """Churn of a slice of the commits and complexity of a slice of the files.
+
+    Shards only merge when they describe the same analysis: the same HEAD,
+    date range and file endings. The metrics are stored as plain tuples in
+    the field order of the complexity records.
+    """
+
+    head: Optional[str]
+    since: str
+    until: Optional[str]
+    endings: Tuple[str, ...]
+    commits: SliceCoverage
+    files: SliceCoverage
+    churn: Dict[str, ChurnRecord]
+    metrics: Dict[str, Tuple[Any, ...]]
+
+    def get_ordered_churn(self) -> Tuple[Dict[str, int], List[str]]:
+        """Churn and file names in the order a single run finds them"""
+        file_names = sorted(
+            self.churn,
+            key=lambda name: (
+                self.churn[name].commit_position,
+                self.churn[name].position_in_commit,
+            ),
+        )
+        return {name: self.churn[name].changes for name in file_names}, file_names
+
+
+def merge_coverage(
+    first: SliceCoverage, second: SliceCoverage, kind: str, disjoint: bool
+) -> SliceCoverage:
+    if first.of != second.of:
+        raise ValueError(
+            f"Shards split the {kind} into {first.of} and {second.of} parts"
+        )
+    overlap = set(first.parts) & set(second.parts)
+    if disjoint and overlap:
+        raise ValueError(f"More than one shard holds {kind} part(s) {sorted(overlap)}")
+    return SliceCoverage(first.of, tuple(sorted(set(first.parts) | set(second.parts))))
+
+
+def merge_two_shards(first: Shard, second: Shard) -> Shard:
+    for field in ["head", "since", "until", "endings"]:
+        if getattr(first, field) != getattr(second, field):
+            raise ValueError(
+                f"Shards are from different analyses: {field} "
+                f"{getattr(first, field)} differs from {getattr(second, field)}"
+            )
+    churn = dict(first.churn)
+    for file_name, record in second.churn.items():
+        known = churn.get(file_name)
+        if known is None:
+            churn[file_name] = record
+        else:
+            churn[file_name] = ChurnRecord(
+                known.changes + record.changes, *min(known[1:], record[1:])
+            )
+    return first._replace(
+        # Counting a commit twice would be wrong, the metrics of a file are
+        # the same in every shard that analyzed it
+        commits=merge_coverage(first.commits, second.commits, "commits", True),
+        files=merge_coverage(first.files, second.files, "files", False),
+        churn=churn,
+        metrics={**first.metrics, **second.metrics},
+    )
+
+
+def merge_shards(shards: Sequence[Shard]) -> Shard:
+    """Combine shards in any order and grouping into the same result"""
+    if not shards:
+        raise ValueError("No shards to merge")
+    merged = shards[0]
+    for shard in shards[1:]:
+        merged = merge_two_shards(merged, shard)
+    return merged
+
+
+def shard_to_dict(shard: Shard) -> Dict[str, Any]:
+    return {
+        "format": SHARD_FORMAT,
+        "version": SHARD_VERSION,
+        "head": shard.head,
+        "since": shard.since,
+        "until": shard.until,
+        "endings": list(shard.endings),
+        "commits": {"of": shard.commits.of, "parts": list(shard.commits.parts)},
+        "files": {"of": shard.files.of, "parts": list(shard.files.parts)},
+        "churn": {name: list(record) for name, record in sorted(shard.churn.items())},
+        "metrics": {
+            name: list(values) for name, values in sorted(shard.metrics.items())
+        },
+    }
+
+
+def shard_from_dict(data: Dict[str, Any]) -> Shard:
+    if data.get("format") != SHARD_FORMAT:
+        raise ValueError("Not a git-outlier shard")
+    if data.get("version") != SHARD_VERSION:
+        raise ValueError(
+            f"Shard format version {data.get('version')} is not supported, "
+            f"expected {SHARD_VERSION}"
+        )
+    return Shard(
+        head=data["head"],
+        since=data["since"],
+        until=data["until"],
+        endings=tuple(data["endings"]),
+        commits=SliceCoverage(data["commits"]["of"], tuple(data["commits"]["parts"])),
+        files=SliceCoverage(data["files"]["of"], tuple(data["files"]["parts"])),
+        churn={name: ChurnRecord(*record) for name, record in data["churn"].items()},
+        metrics={name: tuple(values) for name, values in data["metrics"].items()},
+    )
+
+
+def save_shard(path: str, shard: Shard) -> None:
+    with open(path, "w") as shard_file:
+        json.dump(shard_to_dict(shard), shard_file, separators=(",", ":"))
+
+
+def load_shard(path: str) -> Shard:
+    try:
+        with open(path) as shard_file:
+            return shard_from_dict(json.load(shard_file))
+    except (OSError, KeyError, TypeError, ValueError) as err:
+        raise ValueError(f"Cannot read shard {path}: {err}") from err
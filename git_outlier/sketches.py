@@ -0,0 +1,60 @@
+"""Fixed-memory streaming summaries used by the approximate analysis modes."""
+
+import heapq
+from typing import Dict, Hashable, List, Tuple
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitter counter (Metwally, Agrawal, El Abbadi 2005).
+
+    At most ``capacity`` items are monitored. Every reported count is an upper
+    bound of the true count, and ``count - error`` is a lower bound. Any item
+    occurring more than ``total / capacity`` times is guaranteed to be
+    monitored.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        if capacity < 1:
+            raise ValueError("Space-Saving capacity must be at least 1")
+        self.capacity = capacity
+        self.total = 0
+        self._counts: Dict[Hashable, int] = {}
+        self._errors: Dict[Hashable, int] = {}
+        # One entry per monitored item. The stored count may lag behind the
+        # real one, which is only corrected when the entry reaches the top.
+        self._heap: List[Tuple[int, Hashable]] = []
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def add(self, item: Hashable, count: int = 1) -> None:
+        self.total += count
+        if item in self._counts:
+            self._counts[item] += count
+            return
+        if len(self._counts) < self.capacity:
+            self._counts[item] = count
+            self._errors[item] = 0
+            heapq.heappush(self._heap, (count, item))
+            return
+        minimum, evicted = self._pop_minimum()
+        del self._counts[evicted]
+        del self._errors[evicted]
+        self._counts[item] = minimum + count
+        self._errors[item] = minimum
+        heapq.heappush(self._heap, (minimum + count, item))
+
+    def _pop_minimum(self) -> Tuple[int, Hashable]:
+        while True:
+            stored, item = heapq.heappop(self._heap)
+            current = self._counts[item]
+            if current == stored:
+                return current, item
+            heapq.heappush(self._heap, (current, item))
+
+    def top(self, n: int) -> List[Tuple[Hashable, int, int]]:
+        """Return up to ``n`` (item, count, error) triples, highest count first."""
+        ranked = sorted(
+            self._counts.items(), key=lambda kv: (kv[1], kv[0]), reverse=True
+        )
+        return [(item, count, self._errors[item]) for item, count in ranked[:n]]
@@ -0,0 +1,162 @@
+"""Exact counting of paths in bounded memory, spilling sorted runs to disk."""
+
+import heapq
+import os
+import shutil
+import struct
+import tempfile
+from array import array
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Path length, position where the path was first seen, count
+RUN_RECORD = struct.Struct("<IQQ")
+RUN_BUFFER_SIZE = 1 << 16
+
+# Bytes the counters hold per distinct path besides the path itself: the bytes
+# object header, its dict slot and the two array items
+ENTRY_OVERHEAD = 140
+
+
+def write_run(stream: BinaryIO, records: Iterable[Tuple[bytes, int, int]]) -> None:
+    pack = RUN_RECORD.pack
+    for path, first, count in records:
+        stream.write(pack(len(path), first, count) + path)
+
+
+def read_run(path: str) -> Iterator[Tuple[bytes, int, int]]:
+    with open(path, "rb", buffering=RUN_BUFFER_SIZE) as stream:
+        while True:
+            header = stream.read(RUN_RECORD.size)
+            if not header:
+                return
+            length, first, count = RUN_RECORD.unpack(header)
+            yield stream.read(length), first, count
+
+
+def combine_counts(
+    records: Iterable[Tuple[bytes, int, int]],
+) -> Iterator[Tuple[bytes, int, int]]:
+    """Sorted records with each path once, its earliest position and total count"""
+    current: Optional[bytes] = None
+    first = count = 0
+    for path, record_first, record_count in records:
+        if path == current:
+            first = min(first, record_first)
+            count += record_count
+            continue
+        if current is not None:
+            yield current, first, count
+        current, first, count = path, record_first, record_count
+    if current is not None:
+        yield current, first, count
+
+
+class SpillingCounter:
+    """Counts paths exactly while keeping the counters within a memory budget.
+
+    When the estimated size of the counters exceeds the budget, they are
+    written to a run file sorted by path and cleared. merged() combines the
+    runs and the counters still in memory with a k-way merge, so the whole
+    set of paths never has to fit in memory. Every open run takes a read
+    buffer, so runs beyond what the budget can buffer are merged in passes
+    first. Every path remembers the position it was first seen at, which
+    restores the original order.
+    """
+
+    def __init__(self, memory_budget: int, directory: Optional[str] = None) -> None:
+        self.memory_budget = memory_budget
+        self.directory = directory
+        self.runs: List[str] = []
+        self._run_directory: Optional[str] = None
+        self._ids: Dict[bytes, int] = {}
+        self._first = array("Q")
+        self._counts = array("Q")
+        self._memory = 0
+        self._position = 0
+        self._run_count = 0
+
+    def __enter__(self) -> "SpillingCounter":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._run_directory is not None:
+            shutil.rmtree(self._run_directory, ignore_errors=True)
+            self._run_directory = None
+            self.runs = []
+
+    def add(self, path: bytes, count: int = 1) -> None:
+        self.update([(path, count)])
+
+    def update(self, counts: Iterable[Tuple[bytes, int]]) -> None:
+        """Add the (path, count) pairs, spilling whenever the budget is exceeded"""
+        ids = self._ids
+        for path, count in counts:
+            path_id = ids.get(path)
+            if path_id is not None:
+                self._counts[path_id] += count
+                continue
+            ids[path] = len(self._counts)
+            self._first.append(self._position)
+            self._counts.append(count)
+            self._position += 1
+            self._memory += ENTRY_OVERHEAD + len(path)
+            if self._memory > self.memory_budget:
+                self.spill()
+                ids = self._ids
+
+    def _sorted_records(self) -> List[Tuple[bytes, int, int]]:
+        return sorted(
+            (path, self._first[path_id], self._counts[path_id])
+            for path, path_id in self._ids.items()
+        )
+
+    def _new_run_path(self) -> str:
+        if self._run_directory is None:
+            self._run_directory = tempfile.mkdtemp(
+                prefix="git-outlier-", dir=self.directory
+            )
+        self._run_count += 1
+        return os.path.join(self._run_directory, f"run{self._run_count}")
+
+    def spill(self) -> None:
+        """Write the counters to a new run file and start over empty"""
+        if not self._ids:
+            return
+        run_path = self._new_run_path()
+        with open(run_path, "wb", buffering=RUN_BUFFER_SIZE) as stream:
+            write_run(stream, self._sorted_records())
+        self.runs.append(run_path)
+        self._ids = {}
+        self._first = array("Q")
+        self._counts = array("Q")
+        self._memory = 0
+
+    def _merge_runs(self, runs: List[str]) -> str:
+        """Merge the runs into a new run file, adding up the counts of each path"""
+        run_path = self._new_run_path()
+        with open(run_path, "wb", buffering=RUN_BUFFER_SIZE) as stream:
+            write_run(
+                stream, combine_counts(heapq.merge(*(read_run(run) for run in runs)))
+            )
+        for run in runs:
+            os.remove(run)
+        return run_path
+
+    def merged(self) -> Iterator[Tuple[bytes, int, int]]:
+        """Every path once, in byte order, with its first position and total count"""
+        # The counters are cleared for the merge, their share of the budget
+        # buffers the runs read at once and the one written
+        fan_in = max(2, self.memory_budget // RUN_BUFFER_SIZE - 1)
+        while len(self.runs) > fan_in:
+            self.runs = self.runs[fan_in:] + [self._merge_runs(self.runs[:fan_in])]
+        in_memory = self._sorted_records()
+        self._ids = {}
+        self._first = array("Q")
+        self._counts = array("Q")
+        self._memory = 0
+        yield from combine_counts(
+            heapq.merge(in_memory, *(read_run(run) for run in self.runs))
+        )
@@ -0,0 +1,56 @@
+// Package cache keeps the most recently used values.
+package cache
+
+import "container/list"
+
+/*
+LRU is a least recently used cache of a fixed number of entries.
+It is not safe for concurrent use.
+*/
+type LRU struct {
+	capacity int
+	order    *list.List // front is the most recent
+	entries  map[string]*list.Element
+}
+
+type entry struct {
+	key   string
+	value interface{}
+}
+
+const usage = `cache := New(100)
+// keeps 100 entries`
+
+// New returns an empty cache holding up to capacity entries.
+func New(capacity int) *LRU {
+	return &LRU{
+		capacity: capacity,
+		order:    list.New(),
+		entries:  make(map[string]*list.Element),
+	}
+}
+
+// Get returns the value of the key and marks it as recently used.
+func (c *LRU) Get(key string) (interface{}, bool) {
+	element, ok := c.entries[key]
+	if !ok {
+		return nil, false
+	}
+	c.order.MoveToFront(element)
+	return element.Value.(*entry).value, true
+}
+
+// Put stores the value, evicting the least recently used entry if full.
+func (c *LRU) Put(key string, value interface{}) {
+	if element, ok := c.entries[key]; ok {
+		element.Value.(*entry).value = value
+		c.order.MoveToFront(element)
+		return
+	}
+	if c.order.Len() >= c.capacity {
+		oldest := c.order.Back() /* never nil when full */
+		c.order.Remove(oldest)
+		delete(c.entries, oldest.Value.(*entry).key)
+	}
+	c.entries[key] = c.order.PushFront(&entry{key, value})
+}
@@ -0,0 +1,46 @@
+"""Indentation based complexity of any text file, measured without parsing it."""
+
+import re
+from typing import NamedTuple
+
+# Columns a tab advances to, and columns per logical indentation level
+TAB_WIDTH = 4
+INDENT_WIDTH = 4
+
+# Like git, content with a NUL byte in its first 8000 bytes is binary
+BINARY_PROBE_SIZE = 8000
+
+# The leading blanks of every line that is not blank itself
+INDENTATION_PATTERN = re.compile(rb"^[ \t]*(?=\S)", re.MULTILINE)
+
+
+class IndentationComplexity(NamedTuple):
+    # Lines with anything but whitespace on them
+    lines: int
+    # Logical indentation levels of those lines, summed
+    total: float
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.lines if self.lines else 0.0
+
+
+def is_binary(content: bytes) -> bool:
+    return b"\0" in content[:BINARY_PROBE_SIZE]
+
+
+def get_indentation_complexity(
+    content: bytes, tab_width: int = TAB_WIDTH
+) -> IndentationComplexity:
+    """Indentation of the content, which counts as empty if it is binary.
+
+    The work is done by bytes methods and one regular expression over the
+    whole buffer, no Python code runs per line.
+    """
+    if is_binary(content):
+        return IndentationComplexity(0, 0.0)
+    if b"\t" in content:
+        content = content.expandtabs(tab_width)
+    indentations = INDENTATION_PATTERN.findall(content)
+    columns = sum(map(len, indentations))
+    return IndentationComplexity(len(indentations), columns / INDENT_WIDTH)
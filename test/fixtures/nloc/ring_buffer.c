@@ -0,0 +1,67 @@
+/*
+ * A fixed size ring buffer of bytes.
+ *
+ * Writers block nothing: when the buffer is full the oldest bytes are
+ * overwritten and counted as dropped.
+ */
+#include <stddef.h>
+#include <string.h>
+
+#define RING_CAPACITY 4096 /* must be a power of two */
+#define RING_MASK (RING_CAPACITY - 1)
+#define RING_MIN(a, b) \
+    ((a) < (b) ? (a) : (b))
+
+struct ring {
+    unsigned char data[RING_CAPACITY];
+    size_t head; // next byte to write
+    size_t tail; // next byte to read
+    size_t dropped;
+};
+
+static const char *ring_name = "ring /* not a comment */";
+
+void ring_init(struct ring *ring)
+{
+    memset(ring, 0, sizeof(*ring));
+}
+
+size_t ring_used(const struct ring *ring)
+{
+    return ring->head - ring->tail;
+}
+
+void ring_write(struct ring *ring, const unsigned char *bytes, size_t count)
+{
+    size_t index;
+
+    for (index = 0; index < count; index++) {
+        if (ring_used(ring) == RING_CAPACITY) {
+            ring->tail++;
+            ring->dropped++;
+        }
+        ring->data[ring->head++ & RING_MASK] = bytes[index];
+    }
+}
+
+size_t ring_read(struct ring *ring, unsigned char *bytes, size_t count)
+{
+    size_t available = RING_MIN(count, ring_used(ring));
+    size_t index;
+
+    /* Copy byte by byte, the wrap around
+       makes memcpy awkward */
+    for (index = 0; index < available; index++) {
+        bytes[index] = ring->data[ring->tail++ & RING_MASK];
+    }
+    return available;
+}
+
+#ifdef RING_DEBUG
+#include <stdio.h>
+void ring_dump(const struct ring *ring)
+{
+    printf("%s: %zu used, %zu dropped\n", ring_name, ring_used(ring),
+           ring->dropped);
+}
+#endif
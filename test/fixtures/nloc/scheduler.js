@@ -0,0 +1,43 @@
+/**
+ * Runs tasks with at most `limit` of them in flight.
+ */
+class Scheduler {
+  constructor(limit) {
+    this.limit = limit; // tasks running at once
+    this.running = 0;
+    this.queue = [];
+  }
+
+  /* Adds a task, which is a function returning a promise */
+  add(task) {
+    return new Promise((resolve, reject) => {
+      this.queue.push({ task, resolve, reject });
+      this.next();
+    });
+  }
+
+  next() {
+    if (this.running >= this.limit || this.queue.length === 0) {
+      return;
+    }
+    const { task, resolve, reject } = this.queue.shift();
+    this.running++;
+    task()
+      .then(resolve, reject)
+      .finally(() => {
+        this.running--;
+        this.next();
+      });
+  }
+}
+
+const banner = `Scheduler
+// started with a template literal
+`;
+
+function describe(scheduler) {
+  // Quotes hide comment markers: '/*' and "//"
+  return `${scheduler.running} running, ${scheduler.queue.length} queued`;
+}
+
+module.exports = { Scheduler, describe, banner };
@@ -0,0 +1,65 @@
+"""
+Tests for the age of lines taken from git blame --porcelain.
+"""
+
+from git_outlier.blame import CodeAge, get_code_age, parse_blame_porcelain
+
+OLD = "a" * 40
+NEW = "b" * 40
+
+# Headers follow the first group of each commit, later groups only name it
+PORCELAIN = (
+    f"{OLD} 1 1 2\n"
+    "author A\n"
+    "committer-time 1000\n"
+    "filename a.py\n"
+    "\tx = 1\n"
+    f"{OLD} 2 2\n"
+    "\tcommitter-time 5\n"
+    f"{NEW} 3 3 1\n"
+    "author B\n"
+    "committer-time 3000\n"
+    "filename a.py\n"
+    "\ty = 2\n"
+    f"{OLD} 4 4 1\n"
+    "\tz = 3\n"
+).encode()
+
+
+class TestParseBlamePorcelain:
+    """Test line counts per commit time"""
+
+    def test_groups_add_up_per_commit(self):
+        """Lines of content never count as headers, whatever they hold"""
+        assert parse_blame_porcelain(PORCELAIN) == [(1000, 3), (3000, 1)]
+
+    def test_commits_with_the_same_time_share_an_entry(self):
+        porcelain = PORCELAIN.replace(b"committer-time 3000", b"committer-time 1000")
+        assert parse_blame_porcelain(porcelain) == [(1000, 4)]
+
+    def test_empty_file(self):
+        assert parse_blame_porcelain(b"") == []
+
+
+class TestGetCodeAge:
+    """Test the median age and the share of old lines"""
+
+    def test_median_and_old_share(self):
+        day = 86400
+        line_times = [(0, 3), (10 * day, 1)]
+
+        age = get_code_age(line_times, reference=20 * day, cutoff=5 * day)
+
+        assert age == CodeAge(lines=4, median_days=20.0, old_share=0.75)
+
+    def test_lower_median_of_an_even_count(self):
+        day = 86400
+        line_times = [(0, 2), (10 * day, 2)]
+
+        assert get_code_age(line_times, 20 * day, 0).median_days == 20.0
+
+    def test_lines_after_the_reference_are_new(self):
+        assert get_code_age([(100, 1)], 50, 0) == CodeAge(1, 0.0, 0.0)
+
+    def test_empty_file(self):
+        assert get_code_age([], 100, 50) == CodeAge(0, 0.0, 0.0)
@@ -5,6 +5,10 @@ Test error handling and edge cases for git-outlier.
 import pytest
 from unittest.mock import patch, Mock
 from git_outlier.git_outlier import (
+    GitCommandError,
+    NotAGitRepositoryError,
+    RepositoryPathError,
+    run,
     get_git_log_in_current_directory,
     change_directory,
     restore_directory,
@@ -19,42 +23,57 @@ class TestGitCommandErrors:
     def test_git_command_failure(self, mock_popen):
         """Test git command failure handling"""
         process = Mock()
-        process.communicate.return_value = ("", "git command failed")
+        process.communicate.return_value = (b"", b"git command failed")
         process.returncode = 1  # Non-zero return code
         mock_popen.return_value = process
 
-        with pytest.raises(SystemExit) as exc_info:
+        with pytest.raises(GitCommandError) as exc_info:
             get_git_log_in_current_directory("2023-01-01")
-        assert exc_info.value.code == 1
+        assert exc_info.value.exit_code == 1
 
     @patch("subprocess.Popen")
     def test_git_os_error(self, mock_popen):
         """Test OS error when executing git command"""
         mock_popen.side_effect = OSError("Command not found")
 
-        with pytest.raises(SystemExit) as exc_info:
+        with pytest.raises(GitCommandError) as exc_info:
             get_git_log_in_current_directory("2023-01-01")
-        assert exc_info.value.code == 1
+        assert exc_info.value.exit_code == 1
 
     @patch("subprocess.Popen")
     def test_git_unexpected_error(self, mock_popen):
-        """Test unexpected error handling"""
-        mock_popen.side_effect = Exception("Unexpected error")
+        """Test unexpected errors are not hidden behind an exit"""
+        mock_popen.side_effect = RuntimeError("Unexpected error")
 
-        with pytest.raises(SystemExit) as exc_info:
+        with pytest.raises(RuntimeError):
             get_git_log_in_current_directory("2023-01-01")
-        assert exc_info.value.code == 1
 
     def test_empty_repository_scenario(self):
         """Test scenario with empty git repository"""
         with patch("subprocess.Popen") as mock_popen:
             process = Mock()
-            process.communicate.return_value = ("", "does not have any commits yet")
+            process.communicate.return_value = (b"", b"does not have any commits yet")
             process.returncode = 1
             mock_popen.return_value = process
 
             result = get_git_log_in_current_directory("2023-01-01")
-            assert result == ""
+            assert result == b""
+
+
+class TestExitCodes:
+    """Test the command line turns errors into exit codes"""
+
+    def test_run_exits_with_the_code_of_the_error(self):
+        """Test run exits with the exit code of the raised error"""
+        command = Mock(side_effect=NotAGitRepositoryError("not a git repository"))
+        with pytest.raises(SystemExit) as exc_info:
+            run(command, Mock())
+        assert exc_info.value.code == 128
+
+    def test_run_lets_other_errors_through(self):
+        """Test run does not hide unexpected errors"""
+        with pytest.raises(KeyError):
+            run(Mock(side_effect=KeyError("bug")), Mock())
 
 
 class TestDirectoryErrors:
@@ -62,29 +81,27 @@ class TestDirectoryErrors:
 
     def test_change_directory_os_error(self):
         """Test change_directory with invalid path"""
-        with pytest.raises(SystemExit) as exc_info:
+        with pytest.raises(RepositoryPathError) as exc_info:
             change_directory("/nonexistent/path/that/does/not/exist")
-        assert exc_info.value.code == 1
+        assert exc_info.value.exit_code == 1
 
-    def test_change_directory_unexpected_error(self):
-        """Test change_directory with unexpected error"""
-        with patch("os.chdir", side_effect=Exception("Unexpected error")):
-            with pytest.raises(SystemExit) as exc_info:
+    def test_change_directory_permission_error(self):
+        """Test change_directory with a directory that cannot be entered"""
+        with patch("os.chdir", side_effect=PermissionError("Permission denied")):
+            with pytest.raises(RepositoryPathError):
                 change_directory(".")
-            assert exc_info.value.code == 1
 
     def test_restore_directory_os_error(self):
         """Test restore_directory with invalid path"""
-        with pytest.raises(SystemExit) as exc_info:
+        with pytest.raises(RepositoryPathError) as exc_info:
             restore_directory("/nonexistent/path/that/does/not/exist")
-        assert exc_info.value.code == 1
+        assert exc_info.value.exit_code == 1
 
-    def test_restore_directory_unexpected_error(self):
-        """Test restore_directory with unexpected error"""
-        with patch("os.chdir", side_effect=Exception("Unexpected error")):
-            with pytest.raises(SystemExit) as exc_info:
+    def test_restore_directory_permission_error(self):
+        """Test restore_directory with a directory that cannot be entered"""
+        with patch("os.chdir", side_effect=PermissionError("Permission denied")):
+            with pytest.raises(RepositoryPathError):
                 restore_directory(".")
-            assert exc_info.value.code == 1
 
 
 class TestArgumentValidationErrors:
@@ -110,6 +127,76 @@ class TestArgumentValidationErrors:
         with pytest.raises(SystemExit):
             parse_arguments(["-l", "unsupported_language", "."])
 
+    def test_invalid_threshold_policy(self):
+        """Test unknown outlier threshold policy"""
+        with pytest.raises(SystemExit):
+            parse_arguments(["--threshold", "percentile:120", "."])
+
+    def test_approximate_churn_smaller_than_top(self):
+        """Approximate churn needs at least as many counters as reported files"""
+        with pytest.raises(SystemExit):
+            parse_arguments(["--approximate-churn", "5", "--top", "10", "."])
+
+    def test_approximate_churn_needs_a_counter(self):
+        """Zero counters is an error, not exact counting"""
+        with pytest.raises(SystemExit):
+            parse_arguments(["--approximate-churn", "0", "--top", "0", "."])
+        with pytest.raises(SystemExit):
+            parse_arguments(["--approximate-churn", "0", "--top", "0", "--ledger"])
+
+    def test_exact_recount_without_approximate_churn(self):
+        """Exact recount only applies to approximate churn"""
+        with pytest.raises(SystemExit):
+            parse_arguments(["--exact-recount", "."])
+
+    def test_notes_cache_with_other_trees(self):
+        """The notes cache holds the results for the files of the working tree"""
+        with pytest.raises(SystemExit):
+            parse_arguments(["--notes-cache", "update", "--history", "3", "."])
+        with pytest.raises(SystemExit):
+            parse_arguments(["--notes-cache", "write", "."])
+        assert parse_arguments(["--notes-cache", "read", "."]).notes_cache == "read"
+
+    def test_analyzer_must_exist_and_compute_the_metric(self):
+        """An analyzer plugin only reports the metrics it computes"""
+        with pytest.raises(SystemExit):
+            parse_arguments(["--analyzer", "does-not-exist", "."])
+        with pytest.raises(SystemExit):
+            parse_arguments(["--analyzer", "nloc", "--metric", "CCN", "."])
+        with pytest.raises(SystemExit):
+            parse_arguments(["--analyzer", "lizard", "-l", "python", "."])
+        assert parse_arguments(["--analyzer", "nloc", "-m", "NLOC"]).analyzer == "nloc"
+
+    def test_code_age_months_and_other_trees(self):
+        """Code age is blamed at the end of the window of the working tree"""
+        with pytest.raises(SystemExit):
+            parse_arguments(["--code-age", "0", "."])
+        with pytest.raises(SystemExit):
+            parse_arguments(["--code-age", "12", "--compare", "main..HEAD", "."])
+        assert parse_arguments(["--code-age", "6", "."]).code_age == 6
+
+    def test_path_prefix_is_read_from_the_ledger(self):
+        """Only the ledger indexes the paths, so the prefix needs it"""
+        with pytest.raises(SystemExit):
+            parse_arguments(["--path-prefix", "src", "."])
+        options = parse_arguments(["--ledger", "--path-prefix", "src", "."])
+        assert options.path_prefix == "src"
+
+    def test_compare_rejects_other_churn_modes(self):
+        """Compare reads its own churn, so other churn sources are refused"""
+        for flag in (["--ledger"], ["--approximate-churn", "64"], ["--history", "3"]):
+            with pytest.raises(SystemExit):
+                parse_arguments(["--compare", "main..HEAD", *flag, "."])
+        assert parse_arguments(["--compare", "main..HEAD", "."]).compare == "main..HEAD"
+
+    def test_log_file_holds_its_own_window(self):
+        """A saved log replaces the date range and the other churn sources"""
+        with pytest.raises(SystemExit):
+            parse_arguments(["--log-file", "-", "--since", "2023-01-01", "."])
+        with pytest.raises(SystemExit):
+            parse_arguments(["--log-file", "a.log", "--ledger", "."])
+        assert parse_arguments(["--log-file", "-", "."]).log_file == "-"
+
     def test_valid_date_parsing_edge_cases(self):
         """Test edge cases in date parsing that should succeed"""
         # Test with whitespace
@@ -3,16 +3,58 @@ Simple git integration tests that run with real git commands.
 These tests create temporary git repositories and test actual git functionality.
 """
 
+import io
 import os
+import sys
 import tempfile
 import subprocess
 import pytest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from importlib.metadata import EntryPoint
 from pathlib import Path
+from unittest.mock import patch
 
 from git_outlier.git_outlier import (
+    run_analyzer_on_file,
     get_git_log_in_current_directory,
     parse_churn_from_log,
+    get_approximate_churn_data,
+    get_compare_data,
+    get_compare_deltas,
+    list_tree_blobs,
+    read_blobs,
+    get_history_revisions,
+    get_complexity_history,
+    get_git_and_complexity_data,
+    get_git_and_complexity_data_pipelined,
+    read_index_snapshot,
+    get_metrics_for_tracked_files,
+    get_ledger_churn_data,
+    get_ledger_path,
+    list_submodules,
+    get_git_and_complexity_data_with_submodules,
+    get_sampled_churn_data,
+    get_blob_cache_path,
+    load_blob_cache,
+    save_blob_cache,
+    import_notes_cache,
+    export_notes_cache,
+    NOTES_REF,
+    get_code_ages,
+    blame_file,
+    parse_churn_from_log_file,
+    parse_arguments,
+    run_analysis,
+    run_shard,
+    parse_shard_arguments,
+    WorkerBatches,
 )
+from git_outlier import Analyzer, InvalidArgumentError, NotAGitRepositoryError
+from git_outlier import RepositoryPathError
+from git_outlier import GitCommandError, GitOutlierError
+from git_outlier import AnalyzerPlugin
+from git_outlier.ledger import CommitLedger
 
 
 @pytest.fixture
@@ -51,7 +93,7 @@ def test_empty_git_repository(temp_git_repo):
     """Test behavior with empty git repository"""
     # Should not crash with empty repository
     result = get_git_log_in_current_directory("2020-01-01")
-    assert result == ""  # Empty repository should return empty string
+    assert result == b""  # Empty repository should return an empty log
 
 
 def test_git_repository_with_commits(temp_git_repo):
@@ -65,7 +107,7 @@ def test_git_repository_with_commits(temp_git_repo):
 
     # Test git log retrieval
     result = get_git_log_in_current_directory("2020-01-01")
-    assert result != ""  # Should have some output
+    assert result != b""  # Should have some output
 
     # Test parsing the log
     churn, file_names = parse_churn_from_log(result)
@@ -101,9 +143,803 @@ def test_non_git_directory():
         original_cwd = os.getcwd()
         try:
             os.chdir(temp_dir)
-            # Should exit with code 128 when not in a git repository
-            with pytest.raises(SystemExit) as exc_info:
+            # The command line exits with 128 when not in a git repository
+            with pytest.raises(NotAGitRepositoryError) as exc_info:
                 get_git_log_in_current_directory("2020-01-01")
-            assert exc_info.value.code == 128  # Git's standard exit code
+            assert exc_info.value.exit_code == 128  # Git's standard exit code
         finally:
             os.chdir(original_cwd)
+
+
+def test_approximate_churn_with_exact_recount(temp_git_repo):
+    """Approximate churn finds the top churner and recounts it exactly"""
+    for version in range(3):
+        (temp_git_repo / "hot.py").write_text(f"x = {version}")
+        subprocess.run(["git", "add", "hot.py"], check=True)
+        subprocess.run(["git", "commit", "-m", f"Change {version}"], check=True)
+    (temp_git_repo / "cold.py").write_text("y = 1")
+    (temp_git_repo / "notes.txt").write_text("ignored")
+    subprocess.run(["git", "add", "cold.py", "notes.txt"], check=True)
+    subprocess.run(["git", "commit", "-m", "Add cold"], check=True)
+
+    churn, errors = get_approximate_churn_data([".py"], "2020-01-01", None, 2, 1)
+    assert churn == {"hot.py": 3}
+    assert errors == {"hot.py": 0}
+
+    churn, errors = get_approximate_churn_data(
+        [".py"], "2020-01-01", None, 2, 2, exact_recount=True
+    )
+    assert churn == {"hot.py": 3, "cold.py": 1}
+    assert errors is None
+
+
+def test_pipelined_analysis_matches_sequential(temp_git_repo):
+    """Worker processes give the same result and report churn before complexity"""
+    for version in range(2):
+        (temp_git_repo / "a.py").write_text(f"def f(x):\n    return x or {version}\n")
+        (temp_git_repo / "b.py").write_text("def g(y):\n    if y:\n        return 1\n")
+        (temp_git_repo / "notes.txt").write_text(f"note {version}")
+        subprocess.run(["git", "add", "."], check=True)
+        subprocess.run(["git", "commit", "-m", f"Change {version}"], check=True)
+    (temp_git_repo / "b.py").unlink()
+    subprocess.run(["git", "commit", "-am", "Remove b"], check=True)
+
+    reported = []
+    pipelined = get_git_and_complexity_data_pipelined(
+        [".py"], "2020-01-01", None, 2, reported.append
+    )
+    sequential = get_git_and_complexity_data([".py"], "2020-01-01")
+
+    assert pipelined[0] == sequential[0]
+    assert pipelined[1] == sequential[1]
+    assert sorted(pipelined[2]) == sorted(sequential[2])
+    assert reported == [sequential[1]]
+
+
+def test_memory_budget_gives_the_same_results(temp_git_repo):
+    """Spilling the counters changes neither churn, order nor metrics"""
+    for version in range(3):
+        for number in range(version, 12):
+            (temp_git_repo / f"file{number}.py").write_text(f"x = {version}\n")
+        (temp_git_repo / "notes.txt").write_text(f"note {version}")
+        subprocess.run(["git", "add", "."], check=True)
+        subprocess.run(["git", "commit", "-m", f"Change {version}"], check=True)
+    for number in range(4):
+        (temp_git_repo / f"file{number}.py").unlink()
+    subprocess.run(["git", "commit", "-am", "Remove files"], check=True)
+
+    metrics, churn, file_names = get_git_and_complexity_data([".py"], "2020-01-01")
+    budgeted = get_git_and_complexity_data(
+        [".py"], "2020-01-01", max_memory=1000, top=2
+    )
+    pipelined = get_git_and_complexity_data_pipelined(
+        [".py"], "2020-01-01", None, 2, max_memory=1000, top=2
+    )
+
+    # Of the deleted files only the two top churners can show up in a report
+    kept = [name for name in file_names if name not in ["file0.py", "file1.py"]]
+    assert budgeted == (metrics, {name: churn[name] for name in kept}, kept)
+    assert pipelined == budgeted
+
+
+def test_workers_get_the_largest_files_first(temp_git_repo):
+    """Once the log is read, files go to the workers by size, largest first"""
+    for number, lines in enumerate([3, 40, 1, 12]):
+        (temp_git_repo / f"file{number}.py").write_text("x = 1\n" * lines)
+    subprocess.run(["git", "add", "."], check=True)
+    subprocess.run(["git", "commit", "-m", "Add files"], check=True)
+
+    added = []
+    add = WorkerBatches.add
+
+    def record_add(batches, file_name):
+        added.append(file_name)
+        add(batches, file_name)
+
+    with patch.object(WorkerBatches, "add", record_add):
+        get_git_and_complexity_data_pipelined(
+            [".py"], "2020-01-01", None, 2, max_memory=1 << 20
+        )
+    assert added == ["file1.py", "file3.py", "file0.py", "file2.py"]
+
+
+def test_outliers_only_skips_files_below_the_churn_threshold(temp_git_repo, capsys):
+    """Only files that can be outliers are analyzed, with or without workers"""
+    for version in range(4):
+        (temp_git_repo / "hot.py").write_text(f"def f(x):\n    return x or {version}\n")
+        if version < 2:
+            (temp_git_repo / f"cold{version}.py").write_text("y = 1\n")
+        subprocess.run(["git", "add", "."], check=True)
+        subprocess.run(["git", "commit", "-m", f"Change {version}"], check=True)
+
+    metrics, churn, file_names = get_git_and_complexity_data(
+        [".py"], "2020-01-01", outliers_only=True
+    )
+    pipelined = get_git_and_complexity_data_pipelined(
+        [".py"], "2020-01-01", None, 2, outliers_only=True
+    )
+
+    assert list(metrics) == ["hot.py"]
+    assert churn == {"hot.py": 4, "cold1.py": 1, "cold0.py": 1}
+    assert pipelined == (metrics, churn, file_names)
+    assert "2 skipped below the churn threshold" in capsys.readouterr().out
+
+
+def test_time_budget_analyzes_the_highest_churn_first(temp_git_repo, capsys):
+    """Files in the blob cache count even when the budget ran out"""
+    for version in range(3):
+        (temp_git_repo / "hot.py").write_text(f"def f(x):\n    return x or {version}\n")
+        if version < 2:
+            (temp_git_repo / "warm.py").write_text(f"y = {version}\n")
+        (temp_git_repo / "cold.py").write_text("z = 1\n")
+        subprocess.run(["git", "add", "."], check=True)
+        subprocess.run(["git", "commit", "-m", f"Change {version}"], check=True)
+    (temp_git_repo / "warm.py").write_text("y = 2\n")
+
+    with Analyzer(time_budget=1e-9) as analyzer:
+        metrics, churn, _ = analyzer.collect([".py"], "2020-01-01")
+    assert metrics == {}
+    assert analyzer.coverage == (0, 3, 0, 6)
+
+    get_git_and_complexity_data([".py"], "2020-01-01")
+    # warm.py is changed in the working tree, so it is not in the cache
+    for jobs in [1, 2]:
+        with Analyzer(jobs=jobs, time_budget=1e-9) as analyzer:
+            result = analyzer.analyze(str(temp_git_repo))
+        assert sorted(result.metrics) == ["cold.py", "hot.py"]
+        assert result.coverage == (2, 3, 4, 6)
+        assert result.coverage.churn_share == 4 / 6
+
+    with Analyzer(jobs=2, time_budget=60) as analyzer:
+        metrics, _, _ = analyzer.collect([".py"], "2020-01-01")
+    assert sorted(metrics) == ["cold.py", "hot.py", "warm.py"]
+    assert analyzer.coverage.complete
+
+    get_git_and_complexity_data([".py"], "2020-01-01", time_budget=1e-9)
+    output = capsys.readouterr().out
+    assert "Coverage within the time budget of 1e-09s: 2/3 files analyzed" in output
+    assert "The time budget ran out" in output
+
+
+def test_whitespace_metric_analyzes_text_formats(temp_git_repo):
+    """The whitespace engine reads YAML and shell without running lizard"""
+    (temp_git_repo / "ci.yml").write_text("jobs:\n  test:\n    run: make\n")
+    (temp_git_repo / "build.sh").write_text("if true; then\n  make\nfi\n")
+    (temp_git_repo / "a.py").write_text("def f(x):\n    return x\n")
+    subprocess.run(["git", "add", "."], check=True)
+    subprocess.run(["git", "commit", "-m", "Add files"], check=True)
+
+    with patch("git_outlier.git_outlier.run_analyzer_on_file") as mock_analyzer:
+        for jobs in [1, 2]:
+            with Analyzer(jobs=jobs) as analyzer:
+                result = analyzer.analyze(
+                    str(temp_git_repo), since="2020-01-01", metric="WHITESPACE"
+                )
+            assert result.complexity == {"ci.yml": 1.5, "build.sh": 0.5, "a.py": 1.0}
+    mock_analyzer.assert_not_called()
+    cache = load_blob_cache(get_blob_cache_path())
+    assert len(cache) == 3
+    assert all(key.endswith(":whitespace") for key in cache)
+
+    # Lizard results are cached apart, and hold the indentation as well
+    result = Analyzer().analyze(
+        str(temp_git_repo), since="2020-01-01", metric="WHITESPACE_MEAN"
+    )
+    assert result.complexity["ci.yml"] == 0.5
+    result = Analyzer().analyze(str(temp_git_repo), since="2020-01-01")
+    assert result.complexity == {"a.py": 1}
+    assert result.metrics["a.py"].whitespace == 1.0
+    with pytest.raises(InvalidArgumentError):
+        Analyzer().analyze(str(temp_git_repo), languages=["yaml"])
+
+
+def test_notes_cache_is_shared_through_the_repository(temp_git_repo, tmp_path):
+    """A clone without a blob cache reads the results stored in notes by another"""
+    (temp_git_repo / "a.py").write_text("def f(x):\n    if x:\n        return 1\n")
+    (temp_git_repo / "b.py").write_text("y = 1\n")
+    subprocess.run(["git", "add", "."], check=True)
+    subprocess.run(["git", "commit", "-m", "Add files"], check=True)
+    blobs = {entry.blob_id for entry in read_index_snapshot().values()}
+    assert import_notes_cache(blobs) == 0
+
+    Analyzer().analyze(str(temp_git_repo), since="2020-01-01", metric="WHITESPACE")
+    assert export_notes_cache(blobs) == 2
+    assert export_notes_cache(blobs) == 0
+    # Results of another engine are added to the same notes
+    Analyzer().analyze(str(temp_git_repo), since="2020-01-01")
+    assert export_notes_cache(blobs) == 2
+    note = subprocess.check_output(
+        ["git", "notes", f"--ref={NOTES_REF}", "show", "HEAD:a.py"]
+    )
+    assert b'".py":[2,3,' in note and b'":whitespace":[' in note
+
+    clone = tmp_path / "clone"
+    subprocess.run(["git", "clone", "-q", str(temp_git_repo), str(clone)], check=True)
+    os.chdir(clone)
+    subprocess.run(
+        ["git", "fetch", "-q", "origin", f"{NOTES_REF}:{NOTES_REF}"], check=True
+    )
+    assert import_notes_cache(blobs) == 4
+    assert import_notes_cache(blobs) == 0
+    with patch("git_outlier.git_outlier.analyze_file") as mock_analyze:
+        result = Analyzer().analyze(str(clone), since="2020-01-01")
+    mock_analyze.assert_not_called()
+    assert result.complexity == {"a.py": 2, "b.py": 0}
+
+    # Notes written by another analyzer version are ignored
+    save_blob_cache(get_blob_cache_path(), {})
+    with patch("git_outlier.git_outlier.get_analyzer_version", return_value="lizard 0"):
+        assert import_notes_cache(blobs) == 0
+
+
+def test_log_file_churn_matches_the_repository(temp_git_repo, tmp_path):
+    """Saved logs of every format give the churn of the repository's own log"""
+    for content in ["x = 1\n", "x = 2\n", "x = 3\n"]:
+        (temp_git_repo / "a b.py").write_text(content)
+        (temp_git_repo / "\u00e9.py").write_text(content)
+        subprocess.run(["git", "add", "."], check=True)
+        subprocess.run(["git", "commit", "-m", "Change\n\n1\t2\tnot.py"], check=True)
+    os.mkdir(temp_git_repo / "src")
+    subprocess.run(["git", "mv", "a b.py", "src/a b.py"], check=True)
+    subprocess.run(["git", "commit", "-m", "Move"], check=True)
+    expected, _ = parse_churn_from_log(get_git_log_in_current_directory("2000-01-01"))
+    assert expected == {"a b.py": 3, "\u00e9.py": 3, "src/a b.py": 1}
+
+    formats = [[], ["-z"], ["-z", "--pretty=format:%x01"], ["--format=%H %s"]]
+    for options in formats:
+        log = subprocess.check_output(["git", "log", "--numstat", *options])
+        log_path = tmp_path / "log"
+        log_path.write_bytes(log)
+        for jobs, chunk_size in [(1, None), (1, 1), (2, 1)]:
+            churn, _ = parse_churn_from_log_file(str(log_path), jobs, chunk_size)
+            assert churn == expected, (options, jobs, chunk_size)
+        with patch("sys.stdin", io.TextIOWrapper(io.BytesIO(log))):
+            assert parse_churn_from_log_file("-")[0] == expected
+
+    (tmp_path / "empty").write_bytes(b"")
+    assert parse_churn_from_log_file(str(tmp_path / "empty"), 2) == ({}, [])
+    with pytest.raises(GitOutlierError):
+        parse_churn_from_log_file(str(tmp_path / "missing"))
+
+
+def commit_at(message, day):
+    environment = dict(
+        os.environ,
+        GIT_AUTHOR_DATE=f"{day}T12:00:00",
+        GIT_COMMITTER_DATE=f"{day}T12:00:00",
+    )
+    subprocess.run(["git", "add", "."], check=True)
+    subprocess.run(["git", "commit", "-m", message], check=True, env=environment)
+
+
+def test_code_age_blames_only_changed_files(temp_git_repo):
+    """Ages at the end of the window, blamed again only when a file changed"""
+    (temp_git_repo / "a.py").write_text("x = 1\ny = 2\nz = 3\n")
+    commit_at("Old code", "2022-01-10")
+    (temp_git_repo / "a.py").write_text("x = 1\ny = 2\nz = 3\nw = 4\n")
+    (temp_git_repo / "b.py").write_text("a = 1\nb = 2\n")
+    commit_at("New code", "2023-06-01")
+    (temp_git_repo / "b.py").write_text("a = 1\nb = 3\n")
+    commit_at("After the window", "2023-08-01")
+
+    ages = get_code_ages(["a.py", "b.py"], "2023-01-01", "2023-06-30", 12, jobs=2)
+
+    assert ages["a.py"].lines == 4
+    assert ages["a.py"].old_share == 0.75
+    # The window ends on 2023-06-30 at the current time of day, as in git log
+    assert ages["a.py"].median_days == pytest.approx(536, abs=0.5)
+    assert ages["b.py"].old_share == 0.0
+
+    with patch("git_outlier.git_outlier.blame_file") as mock_blame:
+        assert get_code_ages(["a.py", "b.py"], "2023-01-01", "2023-06-30", 12) == ages
+    mock_blame.assert_not_called()
+
+    # Only b.py changed since, so only b.py is blamed at the new window end
+    with patch("git_outlier.git_outlier.blame_file", wraps=blame_file) as mock_blame:
+        ages = get_code_ages(["a.py", "b.py"], "2023-01-01", "2023-08-31", 12)
+    assert [call.args[0] for call in mock_blame.call_args_list] == ["b.py"]
+    assert ages["a.py"].old_share == 0.75
+
+
+def run_git_outlier(*arguments):
+    """Run the command line in its own process, as another machine would"""
+    package_root = str(Path(__file__).resolve().parents[1])
+    return subprocess.Popen(
+        [sys.executable, "-m", "git_outlier.git_outlier", *arguments],
+        stdout=subprocess.PIPE,
+        env={**os.environ, "PYTHONPATH": package_root},
+        cwd=package_root,
+    )
+
+
+def get_report(output):
+    """The reports, without the progress messages in front of them"""
+    text = output.decode()
+    return text[text.index("=" * 99) :]
+
+
+def test_merged_shards_match_a_single_run(temp_git_repo, tmp_path):
+    """Shards written by separate processes merge into the single run report"""
+    for version in range(6):
+        for number in range(version % 3, 9, 2):
+            body = "".join(
+                f"    if x == {i}:\n        return {i}\n" for i in range(number)
+            )
+            (temp_git_repo / f"pkg{number % 2}").mkdir(exist_ok=True)
+            (temp_git_repo / f"pkg{number % 2}" / f"m{number}.py").write_text(
+                f"def f(x):\n{body}    return {version}\n"
+            )
+        subprocess.run(["git", "add", "."], check=True)
+        subprocess.run(["git", "commit", "-m", f"Change {version}"], check=True)
+    (temp_git_repo / "pkg0" / "m2.py").unlink()
+    subprocess.run(["git", "commit", "-am", "Remove m2"], check=True)
+    repo = str(temp_git_repo)
+    common = ["--since=2020-01-01", "--progress=never"]
+
+    single = run_git_outlier(*common, "--rollup=1", repo).communicate()[0]
+    shards = [str(tmp_path / f"shard{part}.json") for part in range(3)]
+    processes = [
+        run_git_outlier(
+            "shard",
+            *common,
+            f"--commits={part}/3",
+            f"--files={part}/3",
+            "-o",
+            shard,
+            repo,
+        )
+        for part, shard in enumerate(shards)
+    ]
+    assert [process.wait() for process in processes] == [0, 0, 0]
+    merged = run_git_outlier("merge", "--rollup=1", *shards).communicate()[0]
+    half = str(tmp_path / "half.json")
+    assert run_git_outlier("merge", "-o", half, shards[2], shards[0]).wait() == 0
+    staged = run_git_outlier("merge", "--rollup=1", shards[1], half).communicate()[0]
+    incomplete = run_git_outlier("merge", shards[0], shards[1])
+
+    assert get_report(merged) == get_report(single)
+    assert get_report(staged) == get_report(single)
+    assert "m2.py" in get_report(single)
+    assert incomplete.wait() == 1
+
+
+def test_index_snapshot_replaces_file_checks(temp_git_repo):
+    """Untracked and deleted paths are dropped, clean files go through the cache"""
+    (temp_git_repo / "clean.py").write_text("x = 1\n")
+    (temp_git_repo / "dirty.py").write_text("y = 1\n")
+    (temp_git_repo / "gone.py").write_text("z = 1\n")
+    subprocess.run(["git", "add", "."], check=True)
+    subprocess.run(["git", "commit", "-m", "Add files"], check=True)
+    (temp_git_repo / "dirty.py").write_text("def f(y):\n    return y and 1\n")
+    (temp_git_repo / "gone.py").unlink()
+    (temp_git_repo / "untracked.py").write_text("w = 1\n")
+
+    index = read_index_snapshot()
+    assert sorted(index) == ["clean.py", "dirty.py", "gone.py"]
+    assert index["clean.py"].size == 6
+    assert index["clean.py"].clean
+    assert not index["dirty.py"].clean
+    assert not index["gone.py"].clean
+
+    cache = {}
+    files = ["clean.py", "dirty.py", "gone.py", "untracked.py", "never.py"]
+    metrics = get_metrics_for_tracked_files(files, index, cache)
+    assert sorted(metrics) == ["clean.py", "dirty.py"]
+    assert metrics["dirty.py"].function_count == 1
+    assert list(cache) == [f"{index['clean.py'].blob_id}.py"]
+
+
+def test_ledger_is_updated_incrementally(temp_git_repo):
+    """The ledger gives the same churn as the log and only reads new commits"""
+    for version in range(2):
+        (temp_git_repo / "a.py").write_text(f"x = {version}")
+        (temp_git_repo / "b.txt").write_text(f"y = {version}")
+        subprocess.run(["git", "add", "."], check=True)
+        subprocess.run(["git", "commit", "-m", f"Change {version}"], check=True)
+
+    churn, _ = get_ledger_churn_data([".py", ".txt"], "2020-01-01")
+    assert churn == {"a.py": 2, "b.txt": 2}
+    assert get_ledger_churn_data([".py"], "2020-01-01")[0] == {"a.py": 2}
+    assert get_ledger_churn_data([".py"], "2020-01-01", "2020-12-31")[0] == {}
+
+    (temp_git_repo / "a.py").write_text("x = 3")
+    subprocess.run(["git", "commit", "-am", "Change 3"], check=True)
+    churn, _ = get_ledger_churn_data([".py"], "2020-01-01")
+    assert churn == {"a.py": 3}
+    ledger = CommitLedger(get_ledger_path())
+    assert ledger.commit_count == 3
+    ledger.close()
+
+    # Rewriting the last commit leaves the old tip out of the history
+    (temp_git_repo / "c.py").write_text("z = 1")
+    subprocess.run(["git", "add", "c.py"], check=True)
+    subprocess.run(["git", "commit", "--amend", "-m", "Change 3 and c"], check=True)
+    churn, _ = get_ledger_churn_data([".py"], "2020-01-01")
+    assert churn == {"a.py": 3, "c.py": 1}
+
+
+def test_ledger_counts_the_commits_git_log_shows(temp_git_repo):
+    """Git takes a bare date at the current time of day, so does the ledger"""
+    day = date.today() - timedelta(days=3)
+    next_day = day + timedelta(days=1)
+    # Just after midnight of the first day and just before the end of the last
+    for name, moment in [
+        ("early.py", f"{day}T00:00:01"),
+        ("middle.py", f"{day}T23:59:59"),
+        ("late.py", f"{next_day}T23:59:59"),
+    ]:
+        (temp_git_repo / name).write_text("x = 1\n")
+        subprocess.run(["git", "add", name], check=True)
+        environment = dict(os.environ, GIT_COMMITTER_DATE=moment)
+        subprocess.run(["git", "commit", "-m", name], check=True, env=environment)
+
+    log = get_git_log_in_current_directory(str(day), str(next_day))
+    churn, _ = get_ledger_churn_data([".py"], str(day), str(next_day))
+    assert churn == parse_churn_from_log(log)[0] == {"middle.py": 1}
+
+
+def test_ledger_churn_below_a_path_prefix(temp_git_repo):
+    """Only files below the directory are counted, not those sharing its name"""
+    for name in ["src/a.py", "src/sub/b.py", "srcx/c.py", "d.py"]:
+        (temp_git_repo / name).parent.mkdir(parents=True, exist_ok=True)
+        (temp_git_repo / name).write_text("x = 1\n")
+    subprocess.run(["git", "add", "."], check=True)
+    subprocess.run(["git", "commit", "-m", "Add files"], check=True)
+
+    expected = {"src/a.py": 1, "src/sub/b.py": 1}
+    for prefix in ["src", "src/", "/src/"]:
+        churn, _ = get_ledger_churn_data([".py"], "2020-01-01", path_prefix=prefix)
+        assert churn == expected
+
+
+def test_recurse_into_submodules(temp_git_repo, tmp_path):
+    """Submodule files are reported with the submodule path as prefix"""
+    library = tmp_path / "library"
+    library.mkdir()
+    git_in_library = ["git", "-C", str(library)]
+    subprocess.run(git_in_library + ["init"], check=True)
+    subprocess.run(git_in_library + ["config", "user.email", "t@e.com"], check=True)
+    subprocess.run(git_in_library + ["config", "user.name", "Test"], check=True)
+    for version in range(2):
+        (library / "lib.py").write_text(f"def f(x):\n    return x or {version}\n")
+        subprocess.run(git_in_library + ["add", "lib.py"], check=True)
+        subprocess.run(git_in_library + ["commit", "-m", f"v{version}"], check=True)
+
+    (temp_git_repo / "app.py").write_text("x = 1\n")
+    subprocess.run(["git", "add", "app.py"], check=True)
+    subprocess.run(
+        ["git", "-c", "protocol.file.allow=always", "submodule", "add"]
+        + [str(library), "vendor/library"],
+        check=True,
+    )
+    subprocess.run(["git", "commit", "-m", "Add library"], check=True)
+
+    assert list_submodules() == ["vendor/library"]
+    sequential = get_git_and_complexity_data_with_submodules(
+        [".py"], "2020-01-01", None, 1
+    )
+    metrics, churn, file_names = sequential
+    assert churn["vendor/library/lib.py"] == 2
+    assert churn["app.py"] == 1
+    assert sorted(file_names) == ["app.py", "vendor/library/lib.py"]
+    assert metrics["vendor/library/lib.py"].function_count == 1
+
+    parallel = get_git_and_complexity_data_with_submodules(
+        [".py"], "2020-01-01", None, 2
+    )
+    assert parallel == sequential
+
+
+def test_recurse_into_a_submodule_without_commits(temp_git_repo):
+    """A checked out submodule with no commits yet adds no churn"""
+    (temp_git_repo / "app.py").write_text("x = 1\n")
+    subprocess.run(["git", "add", "app.py"], check=True)
+    subprocess.run(["git", "commit", "-m", "Add app"], check=True)
+    head = subprocess.check_output(["git", "rev-parse", "HEAD"], text=True).strip()
+    subprocess.run(
+        ["git", "update-index", "--add", "--cacheinfo", f"160000,{head},empty"],
+        check=True,
+    )
+    subprocess.run(["git", "init", "empty"], check=True)
+
+    assert list_submodules() == ["empty"]
+    metrics, churn, file_names = get_git_and_complexity_data_with_submodules(
+        [".py"], "2020-01-01", None, 1
+    )
+    assert churn == {"app.py": 1}
+    assert file_names == ["app.py"]
+
+
+def test_sampled_churn_finds_the_top_churners(temp_git_repo):
+    """A 30% commit sample ranks the same top 10 as the full log"""
+    commits = []
+    for number in range(300):
+        commits.append("commit refs/heads/main\n")
+        commits.append(f"committer T <t@e.com> {1700000000 + number * 60} +0000\n")
+        commits.append("data 1\nc\n")
+        touched = [f"hot{k}.py" for k in range(10) if number % (k + 2) == 0]
+        for file_name in touched + [f"cold{number}.py"]:
+            commits.append(f"M 644 inline {file_name}\ndata 4\n{number:03}\n\n")
+    subprocess.run(
+        ["git", "fast-import", "--quiet"], input="".join(commits).encode(), check=True
+    )
+    subprocess.run(["git", "checkout", "-q", "main"], check=True)
+
+    exact, _ = parse_churn_from_log(get_git_log_in_current_directory("2020-01-01"))
+    churn, ranks = get_sampled_churn_data([".py"], "2020-01-01", None, 0.3, seed=1)
+
+    def top_ten(counts):
+        return set(sorted(counts, key=counts.get, reverse=True)[:10])
+
+    assert top_ten(churn) == top_ten(exact) == {f"hot{k}.py" for k in range(10)}
+    assert ranks["hot0.py"][0] == 1
+    assert all(ranks[name][0] >= 10 for name in ranks if name.startswith("cold"))
+    assert get_sampled_churn_data([".py"], "2020-01-01", None, 0.3, seed=1) == (
+        churn,
+        ranks,
+    )
+    assert get_sampled_churn_data([".py"], "2020-01-01", None, 1.0)[0] == exact
+
+
+class LineCountPlugin(AnalyzerPlugin):
+    """Counts lines, like a tool that is expensive to start"""
+
+    extensions = [".py", ".txt"]
+    metrics = ["NLOC"]
+    batches = []
+
+    def analyze_batch(self, files):
+        LineCountPlugin.batches.append([path for path, _ in files])
+        return [(0, content.count(b"\n"), 0, 0, 0, 0.0) for _, content in files]
+
+
+def test_analyzer_plugin_from_an_entry_point(temp_git_repo):
+    """Registered plugins get the files they declare in batches"""
+    (temp_git_repo / "a.py").write_text("x = 1\ny = 2\n")
+    (temp_git_repo / "notes.txt").write_text("one\n")
+    (temp_git_repo / "b.c").write_text("int x;\n")
+    subprocess.run(["git", "add", "."], check=True)
+    subprocess.run(["git", "commit", "-m", "Add files"], check=True)
+    plugin = EntryPoint(
+        "lines",
+        "test.test_git_integration:LineCountPlugin",
+        "git_outlier.analyzers",
+    )
+
+    with patch("git_outlier.git_outlier.entry_points", return_value=[plugin]):
+        result = Analyzer().analyze(
+            str(temp_git_repo), since="2020-01-01", metric="NLOC", analyzer="lines"
+        )
+        with pytest.raises(InvalidArgumentError):
+            Analyzer().analyze(str(temp_git_repo), metric="CCN", analyzer="lines")
+        with pytest.raises(InvalidArgumentError):
+            Analyzer().analyze(
+                str(temp_git_repo), languages=["python"], analyzer="lines"
+            )
+    assert result.complexity == {"a.py": 2, "notes.txt": 1}
+    assert LineCountPlugin.batches == [["a.py", "notes.txt"]]
+    cache = load_blob_cache(get_blob_cache_path())
+    assert len(cache) == 2
+    assert all(key.endswith(":lines") for key in cache)
+
+
+def test_analyzer_api(temp_git_repo, tmp_path):
+    """The API returns results, raises errors and keeps its caches between calls"""
+    (temp_git_repo / "a.py").write_text("def f(x):\n    if x:\n        return 1\n")
+    (temp_git_repo / "b.py").write_text("y = 1\n")
+    subprocess.run(["git", "add", "."], check=True)
+    subprocess.run(["git", "commit", "-m", "Add files"], check=True)
+    os.chdir(tmp_path)
+
+    with Analyzer(jobs=2) as analyzer:
+        result = analyzer.analyze(str(temp_git_repo), since="2020-01-01")
+        assert os.getcwd() == str(tmp_path)
+        assert result.churn == {"a.py": 1, "b.py": 1}
+        assert result.complexity == {"a.py": 2, "b.py": 0}
+        assert result.top_complexity[0] == ("a.py", 2)
+        assert result.metrics["a.py"].function_count == 1
+
+        executor = analyzer._executor
+        with patch("git_outlier.git_outlier.analyze_files_in_worker") as mock_worker:
+            again = analyzer.analyze(str(temp_git_repo), "2020-01-01", metric="TOKENS")
+        mock_worker.assert_not_called()
+        assert analyzer._executor is executor
+        assert again.complexity == {"a.py": 11, "b.py": 3}
+
+        with pytest.raises(NotAGitRepositoryError):
+            analyzer.analyze(str(tmp_path))
+        with pytest.raises(InvalidArgumentError):
+            analyzer.analyze(str(temp_git_repo), metric="LINES")
+        with pytest.raises(InvalidArgumentError):
+            analyzer.analyze(str(temp_git_repo), languages=["cobol"])
+        with pytest.raises(RepositoryPathError):
+            analyzer.analyze(str(tmp_path / "missing"))
+    assert analyzer._executor is None
+
+
+def test_analyzers_run_in_parallel_without_changing_directory(temp_git_repo, tmp_path):
+    """Each analysis reads its repository by path, so threads need no lock"""
+    (temp_git_repo / "a.py").write_text("def f(x):\n    return x\n")
+    subprocess.run(["git", "add", "."], check=True)
+    subprocess.run(["git", "commit", "-m", "Add file"], check=True)
+    other = tmp_path / "other"
+    subprocess.run(["git", "clone", "-q", str(temp_git_repo), str(other)], check=True)
+    # Changed in the working tree only, so it is read from the clone's directory
+    (other / "a.py").write_text("def f(x):\n    if x:\n        return 1\n")
+    os.chdir(tmp_path)
+
+    with patch("os.chdir", side_effect=AssertionError("chdir")):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = list(
+                executor.map(
+                    lambda repo: Analyzer().analyze(repo, since="2020-01-01"),
+                    [str(temp_git_repo), str(other)],
+                )
+            )
+    assert [result.complexity for result in results] == [{"a.py": 1}, {"a.py": 2}]
+
+
+def test_notes_are_written_after_the_report(temp_git_repo, capsys, caplog):
+    """A failed notes export warns once the report is printed"""
+    (temp_git_repo / "a.py").write_text("def f(x):\n    return x\n")
+    subprocess.run(["git", "add", "."], check=True)
+    subprocess.run(["git", "commit", "-m", "Add file"], check=True)
+
+    def failing_export(blob_ids):
+        assert "Detected outliers" in capsys.readouterr().out
+        raise GitCommandError("cannot lock ref")
+
+    with patch(
+        "git_outlier.git_outlier.export_notes_cache", side_effect=failing_export
+    ) as mock_export:
+        run_analysis(
+            parse_arguments(["--notes-cache", "update", "--since", "2020-01-01"])
+        )
+    mock_export.assert_called_once()
+    assert "Could not write the notes" in caplog.text
+
+
+def test_outliers_only_report_states_the_complexity_threshold(temp_git_repo, capsys):
+    """The outlier section says which files the complexity threshold comes from"""
+    (temp_git_repo / "a.py").write_text("def f(x):\n    return x\n")
+    subprocess.run(["git", "add", "."], check=True)
+    subprocess.run(["git", "commit", "-m", "Add file"], check=True)
+
+    run_analysis(parse_arguments(["--outliers-only", "--since", "2020-01-01"]))
+    output = capsys.readouterr().out
+    assert "complexity threshold is taken among them" in output
+    assert output.index("Detected outliers") < output.index("taken among them")
+
+
+def test_failed_shard_returns_to_the_start_directory(temp_git_repo, tmp_path):
+    """The working directory is restored when creating a shard fails"""
+    os.chdir(tmp_path)
+    options = parse_shard_arguments(["-o", "shard.json", str(temp_git_repo)])
+    with patch(
+        "git_outlier.git_outlier.create_shard",
+        side_effect=GitCommandError("bad object"),
+    ):
+        with pytest.raises(GitCommandError):
+            run_shard(options)
+    assert os.getcwd() == str(tmp_path)
+    assert not (tmp_path / "shard.json").exists()
+
+
+def test_list_tree_blobs_and_read_blobs(temp_git_repo):
+    """Blobs are listed per path and read back from the object store"""
+    (temp_git_repo / "a b.py").write_text("x = 1\n")
+    subprocess.run(["git", "add", "a b.py"], check=True)
+    subprocess.run(["git", "commit", "-m", "Add file"], check=True)
+
+    blobs = list_tree_blobs("HEAD")
+    assert list(blobs) == ["a b.py"]
+    assert list(read_blobs(list(blobs.values()))) == [(blobs["a b.py"], b"x = 1\n")]
+
+
+def test_compare_revisions(temp_git_repo):
+    """Compare reports deltas and reuses the blob cache on later runs"""
+    (temp_git_repo / "a.py").write_text("def f(x):\n    return x\n")
+    (temp_git_repo / "b.py").write_text(
+        "def g(y):\n    if y:\n        return 1\n    return y and 2\n"
+    )
+    subprocess.run(["git", "add", "a.py", "b.py"], check=True)
+    subprocess.run(["git", "commit", "-m", "Base"], check=True)
+    subprocess.run(["git", "branch", "base"], check=True)
+    (temp_git_repo / "a.py").write_text(
+        "def f(x):\n    if x:\n        return 1\n    return x or 2\n"
+    )
+    subprocess.run(["git", "commit", "-am", "Head"], check=True)
+
+    compare_data = get_compare_data("base", "HEAD", [".py"], "2020-01-01")
+    deltas = get_compare_deltas(*compare_data, "CCN")
+
+    a_delta = [delta for delta in deltas if delta.file_name == "a.py"][0]
+    assert (a_delta.base_complexity, a_delta.head_complexity) == (1, 3)
+    assert (a_delta.base_churn, a_delta.head_churn) == (1, 2)
+    assert not a_delta.base_outlier and a_delta.head_outlier
+
+    with patch("git_outlier.git_outlier.run_analyzer_on_file") as mock_analyzer:
+        assert get_compare_data("base", "HEAD", [".py"], "2020-01-01") == compare_data
+        mock_analyzer.assert_not_called()
+
+
+def test_compare_skips_unchanged_files_without_churn(temp_git_repo):
+    """A cold compare analyzes only files that changed or have churn"""
+    (temp_git_repo / "old.py").write_text("def h(z):\n    return z\n")
+    subprocess.run(["git", "add", "old.py"], check=True)
+    environment = dict(
+        os.environ,
+        GIT_AUTHOR_DATE="2019-01-01T12:00:00",
+        GIT_COMMITTER_DATE="2019-01-01T12:00:00",
+    )
+    subprocess.run(["git", "commit", "-m", "Old"], check=True, env=environment)
+    (temp_git_repo / "a.py").write_text("def f(x):\n    return x\n")
+    subprocess.run(["git", "add", "a.py"], check=True)
+    subprocess.run(["git", "commit", "-m", "Base"], check=True)
+    subprocess.run(["git", "branch", "base"], check=True)
+    (temp_git_repo / "a.py").write_text("def f(x):\n    return x or 1\n")
+    subprocess.run(["git", "commit", "-am", "Head"], check=True)
+
+    with patch(
+        "git_outlier.git_outlier.run_analyzer_on_file",
+        wraps=run_analyzer_on_file,
+    ) as mock_analyzer:
+        base_metrics, head_metrics, _, _ = get_compare_data(
+            "base", "HEAD", [".py"], "2020-01-01"
+        )
+        assert mock_analyzer.call_count == 2  # both versions of a.py
+
+    assert set(base_metrics) == set(head_metrics) == {"a.py"}
+
+
+def test_complexity_history_by_tag(temp_git_repo):
+    """History samples tags and analyzes each distinct blob once"""
+    (temp_git_repo / "a.py").write_text("def f(x):\n    return x\n")
+    (temp_git_repo / "b.py").write_text("def g(y):\n    return y\n")
+    subprocess.run(["git", "add", "a.py", "b.py"], check=True)
+    subprocess.run(["git", "commit", "-m", "First"], check=True)
+    subprocess.run(["git", "tag", "v1"], check=True)
+    (temp_git_repo / "a.py").write_text(
+        "def f(x):\n    if x:\n        return 1\n    return x\n"
+    )
+    subprocess.run(["git", "commit", "-am", "Second"], check=True)
+    subprocess.run(["git", "tag", "v2"], check=True)
+
+    revisions = get_history_revisions(5, "tag")
+    assert revisions == [("v1", "v1"), ("v2", "v2")]
+
+    with patch(
+        "git_outlier.git_outlier.run_analyzer_on_file",
+        wraps=run_analyzer_on_file,
+    ) as mock_analyzer:
+        history = get_complexity_history(revisions, [".py"])
+        assert mock_analyzer.call_count == 3  # b.py is unchanged between tags
+
+    assert history["a.py"]["v1"].ccn == 1
+    assert history["a.py"]["v2"].ccn == 2
+    assert history["b.py"]["v1"] == history["b.py"]["v2"]
+
+
+def test_history_revisions_by_month(temp_git_repo):
+    """Monthly samples pick the last commit before each sample date"""
+    (temp_git_repo / "a.py").write_text("x = 1\n")
+    subprocess.run(["git", "add", "a.py"], check=True)
+    environment = dict(os.environ, GIT_COMMITTER_DATE="2023-01-15T12:00:00")
+    subprocess.run(["git", "commit", "-m", "Old"], check=True, env=environment)
+
+    revisions = get_history_revisions(3, "month", "2023-03-20")
+    assert [label for label, _ in revisions] == ["2023-01-20"]
+
+
+def test_paths_with_spaces_and_non_ascii_names(temp_git_repo):
+    """Localized file names and names with spaces are counted under their own name"""
+    for version in range(2):
+        (temp_git_repo / "mätning av data.py").write_text(f"x = {version}")
+        (temp_git_repo / "größe.py").write_text(f"y = {version}")
+        subprocess.run(["git", "add", "."], check=True)
+        subprocess.run(["git", "commit", "-m", f"Change {version}"], check=True)
+
+    churn, file_names = parse_churn_from_log(
+        get_git_log_in_current_directory("2020-01-01")
+    )
+    assert churn == {"mätning av data.py": 2, "größe.py": 2}
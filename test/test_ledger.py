@@ -0,0 +1,96 @@
+"""
+Tests for the SQLite commit ledger.
+"""
+
+import pytest
+
+from git_outlier.ledger import (
+    CommitLedger,
+    CommitRecord,
+    FileChange,
+    get_prefix_upper_bound,
+)
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = CommitLedger(str(tmp_path / "ledger" / "ledger.sqlite3"))
+    yield ledger
+    ledger.close()
+
+
+def make_commit(commit, timestamp, *paths):
+    return CommitRecord(
+        commit, timestamp, "Author", [FileChange(path, 1, 0) for path in paths]
+    )
+
+
+class TestCommitLedger:
+    """Test recording commits and querying churn"""
+
+    def test_churn_by_time_window(self, ledger):
+        """Only commits with since <= timestamp < until are counted"""
+        ledger.append(
+            [
+                make_commit("c1", 100, b"a.py", b"b.py"),
+                make_commit("c2", 200, b"a.py"),
+                make_commit("c3", 300, b"a.py", b"c.txt"),
+            ],
+            "c3",
+        )
+
+        assert ledger.churn() == {b"a.py": 3, b"b.py": 1, b"c.txt": 1}
+        assert ledger.churn(since=200) == {b"a.py": 2, b"c.txt": 1}
+        assert ledger.churn(since=100, until=300) == {b"a.py": 2, b"b.py": 1}
+        assert ledger.tip == "c3"
+
+    def test_churn_by_extension_and_prefix(self, ledger):
+        """Language and path prefix filters are part of the query"""
+        ledger.append(
+            [
+                make_commit("c1", 100, b"src/a.py", b"src/b.c", b"srcx/c.py"),
+                make_commit("c2", 200, b"docs/d.py"),
+            ],
+            "c2",
+        )
+
+        assert ledger.churn(extensions=[b".py"]) == {
+            b"src/a.py": 1,
+            b"srcx/c.py": 1,
+            b"docs/d.py": 1,
+        }
+        assert ledger.churn(prefix=b"src/") == {b"src/a.py": 1, b"src/b.c": 1}
+
+    def test_recorded_commits_are_not_counted_twice(self, ledger):
+        """Appending a commit that is already recorded changes nothing"""
+        assert ledger.append([make_commit("c1", 100, b"a.py")], "c1") == 1
+        assert ledger.append([make_commit("c1", 100, b"a.py")], "c1") == 0
+
+        assert ledger.churn() == {b"a.py": 1}
+        assert ledger.commit_count == 1
+
+    def test_reset_forgets_everything(self, ledger):
+        """Reset empties the ledger, e.g. after a history rewrite"""
+        ledger.append([make_commit("c1", 100, b"a.py")], "c1")
+        ledger.reset()
+
+        assert ledger.churn() == {}
+        assert ledger.tip is None
+
+    def test_ledger_persists_between_sessions(self, tmp_path):
+        """A reopened ledger still has its commits and tip"""
+        path = str(tmp_path / "ledger.sqlite3")
+        ledger = CommitLedger(path)
+        ledger.append([make_commit("c1", 100, b"a.py")], "c1")
+        ledger.close()
+
+        reopened = CommitLedger(path)
+        assert reopened.tip == "c1"
+        assert reopened.churn() == {b"a.py": 1}
+        reopened.close()
+
+
+def test_get_prefix_upper_bound():
+    assert get_prefix_upper_bound(b"src/") == b"src0"
+    assert get_prefix_upper_bound(b"a\xff") == b"b"
+    assert get_prefix_upper_bound(b"\xff") is None
@@ -11,6 +11,8 @@ from pathlib import Path
 from git_outlier.git_outlier import (
     run_analyzer_on_file,
     get_complexity_for_file_list,
+    get_metrics_for_file_list,
+    InvalidArgumentError,
 )
 
 
@@ -57,6 +59,21 @@ def test_lizard_metrics_extraction_ccn_vs_nloc():
     assert ccn_value != nloc_value, "CCN and NLOC should typically be different"
 
 
+def test_lizard_metrics_computed_once_per_file():
+    """Test all metrics come from a single lizard run per file"""
+    test_file = "test/test_outlier.py"
+    metrics = get_metrics_for_file_list([test_file])
+    record = metrics[test_file]
+    result = run_analyzer_on_file(test_file)
+
+    assert record.ccn == result.CCN
+    assert record.nloc == result.nloc
+    assert record.token_count == result.token_count
+    assert record.function_count == len(result.function_list)
+    assert record.max_ccn == max(f.cyclomatic_complexity for f in result.function_list)
+    assert record.average_ccn == result.average_cyclomatic_complexity
+
+
 def test_lizard_main_module_analysis():
     """Test lizard analysis on the main git_outlier module"""
     main_file = "git_outlier/git_outlier.py"
@@ -133,11 +150,11 @@ def test_lizard_error_handling_invalid_metric():
     """Test error handling for invalid complexity metric"""
     test_file = "test/test_outlier.py"
 
-    # This should call sys.exit(1) for invalid metric
-    with pytest.raises(SystemExit) as exc_info:
+    # The command line exits with 1 for an invalid metric
+    with pytest.raises(InvalidArgumentError) as exc_info:
         get_complexity_for_file_list([test_file], "INVALID_METRIC")
 
-    assert exc_info.value.code == 1
+    assert exc_info.value.exit_code == 1
 
 
 def test_lizard_nonexistent_file():
@@ -4,7 +4,7 @@ Test main function integration and end-to-end scenarios for git-outlier.
 
 import pytest
 from unittest.mock import patch, Mock
-from git_outlier.git_outlier import main, get_git_and_complexity_data
+from git_outlier.git_outlier import main, get_git_and_complexity_data, FileMetrics
 
 
 class TestMainFunction:
@@ -43,14 +43,35 @@ class TestMainFunction:
         mock_args.languages = ["python"]
         mock_args.since = None
         mock_args.until = None
-        mock_args.metric = "CCN"
+        mock_args.metric = ["CCN", "NLOC"]
         mock_args.top = 10
+        mock_args.approximate_churn = None
+        mock_args.compare = None
+        mock_args.history = None
+        mock_args.jobs = 1
+        mock_args.ledger = False
+        mock_args.recurse_submodules = False
+        mock_args.sample_commits = None
+        mock_args.progress = "never"
+        mock_args.rollup = None
+        mock_args.max_memory = None
+        mock_args.outliers_only = False
+        mock_args.time_budget = None
+        mock_args.notes_cache = None
+        mock_args.analyzer = None
+        mock_args.code_age = None
+        mock_args.log_file = None
+        mock_args.path_prefix = ""
         mock_parse.return_value = mock_args
 
         mock_change.return_value = "/original/path"
         mock_get_endings.return_value = [".py"]
         mock_get_range.return_value = ("2023-01-01", None)
-        mock_get_data.return_value = ({"file.py": 10}, {"file.py": 5}, ["file.py"])
+        mock_get_data.return_value = (
+            {"file.py": FileMetrics(10, 50, 200, 4, 5, 2.5)},
+            {"file.py": 5},
+            ["file.py"],
+        )
 
         # Execute main
         main()
@@ -61,52 +82,76 @@ class TestMainFunction:
         mock_restore.assert_called_once_with("/original/path")
         mock_get_data.assert_called_once()
         mock_print_churn.assert_called_once()
-        mock_print_comp.assert_called_once()
-        mock_print_churn_comp.assert_called_once()
+        assert mock_print_comp.call_count == 2
+        assert mock_print_churn_comp.call_count == 2
+        assert mock_print_comp.call_args_list[0][0][0] == {"file.py": 10}
+        assert mock_print_comp.call_args_list[1][0][0] == {"file.py": 50}
         mock_print_sep.assert_called_once()
 
 
 class TestDataIntegration:
     """Test data processing integration functions"""
 
-    @patch("git_outlier.git_outlier.get_git_log_in_current_directory")
-    @patch("git_outlier.git_outlier.parse_churn_from_log")
-    @patch("git_outlier.git_outlier.filter_files_by_extension")
-    @patch("git_outlier.git_outlier.get_complexity_for_file_list")
+    @patch("git_outlier.git_outlier.stream_git_log_in_current_directory")
+    @patch("git_outlier.git_outlier.parse_churn_from_chunks")
+    @patch("git_outlier.git_outlier.read_index_snapshot")
+    @patch("git_outlier.git_outlier.Analyzer._get_cache")
+    @patch("git_outlier.git_outlier.save_blob_cache")
+    @patch("git_outlier.git_outlier.get_metrics_for_tracked_files")
     def test_get_git_and_complexity_data_with_until(
-        self, mock_complexity, mock_filter, mock_parse_churn, mock_get_log
+        self,
+        mock_complexity,
+        mock_save_cache,
+        mock_get_cache,
+        mock_index,
+        mock_parse_churn,
+        mock_get_log,
     ):
         """Test get_git_and_complexity_data with until parameter"""
-        mock_get_log.return_value = "git log output"
-        mock_parse_churn.return_value = ({"file.py": 5}, ["file.py"])
-        mock_filter.return_value = ["file.py"]
+        mock_get_log.return_value = iter([b"git log output"])
+        mock_parse_churn.return_value = (
+            {"file.py": 5, "notes.txt": 1},
+            ["file.py", "notes.txt"],
+        )
+        mock_get_cache.return_value = ("blob-cache.json", {})
         mock_complexity.return_value = {"file.py": 10}
 
-        result = get_git_and_complexity_data([".py"], "CCN", "2023-01-01", "2023-12-31")
+        result = get_git_and_complexity_data([".py"], "2023-01-01", "2023-12-31")
 
         complexity, churn, files = result
         assert "file.py" in complexity
         assert "file.py" in churn
-        assert "file.py" in files
-        mock_get_log.assert_called_once_with("2023-01-01", "2023-12-31")
+        assert files == ["file.py"]
+        mock_get_log.assert_called_once_with("2023-01-01", "2023-12-31", None)
 
-    @patch("git_outlier.git_outlier.get_git_log_in_current_directory")
-    @patch("git_outlier.git_outlier.parse_churn_from_log")
-    @patch("git_outlier.git_outlier.filter_files_by_extension")
-    @patch("git_outlier.git_outlier.get_complexity_for_file_list")
+    @patch("git_outlier.git_outlier.stream_git_log_in_current_directory")
+    @patch("git_outlier.git_outlier.parse_churn_from_chunks")
+    @patch("git_outlier.git_outlier.read_index_snapshot")
+    @patch("git_outlier.git_outlier.Analyzer._get_cache")
+    @patch("git_outlier.git_outlier.save_blob_cache")
+    @patch("git_outlier.git_outlier.get_metrics_for_tracked_files")
     def test_get_git_and_complexity_data_without_until(
-        self, mock_complexity, mock_filter, mock_parse_churn, mock_get_log
+        self,
+        mock_complexity,
+        mock_save_cache,
+        mock_get_cache,
+        mock_index,
+        mock_parse_churn,
+        mock_get_log,
     ):
         """Test get_git_and_complexity_data without until parameter"""
-        mock_get_log.return_value = "git log output"
-        mock_parse_churn.return_value = ({"file.py": 5}, ["file.py"])
-        mock_filter.return_value = ["file.py"]
+        mock_get_log.return_value = iter([b"git log output"])
+        mock_parse_churn.return_value = (
+            {"file.py": 5, "notes.txt": 1},
+            ["file.py", "notes.txt"],
+        )
+        mock_get_cache.return_value = ("blob-cache.json", {})
         mock_complexity.return_value = {"file.py": 10}
 
-        result = get_git_and_complexity_data([".py"], "CCN", "2023-01-01")
+        result = get_git_and_complexity_data([".py"], "2023-01-01")
 
         complexity, churn, files = result
         assert "file.py" in complexity
         assert "file.py" in churn
-        assert "file.py" in files
-        mock_get_log.assert_called_once_with("2023-01-01", None)
+        assert files == ["file.py"]
+        mock_get_log.assert_called_once_with("2023-01-01", None, None)
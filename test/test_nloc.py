@@ -0,0 +1,73 @@
+"""
+Tests for lines of code counted without lizard, checked against lizard itself.
+"""
+
+from pathlib import Path
+
+import lizard
+import pytest
+
+from git_outlier.nloc import count_nloc
+
+
+def lizard_nloc(file_name, content):
+    code = content.decode("utf-8-sig", "ignore")
+    return lizard.analyze_file.analyze_source_code(file_name, code).nloc
+
+
+# Real source files of several languages, frozen so the counts do not move
+FIXTURE_FILES = sorted((Path(__file__).parent / "fixtures" / "nloc").iterdir())
+
+
+# Snippets of each comment and string rule, lizard counts them the same way
+FIXTURES = [
+    ("a.c", b"int x; // c\n// only comment\n\nint y;\n"),
+    ("a.c", b"/* a\n   b */ int x;\nint y; /* c\n d */\n"),
+    ("a.c", b'char *s = "// not a comment";\nchar c = \'"\';\n'),
+    ("a.c", b"#include <stdio.h>\n#define A 1 \\\n  + 2\n#ifdef B\nint x;\n#endif\n"),
+    ("a.c", b"#define A 1 /* a\n b */\nint x;\n"),
+    ("a.cpp", b'auto s = "a\\"/*";\nint y; /**/\n'),
+    ("a.java", b"/**\n * Doc\n */\nclass A {\n  int x; // c\n}\n"),
+    ("a.js", b"const s = `a\n// b\nc`;\n// d\nlet x = '/*';\n"),
+    ("a.go", b"s := `raw\n/* not a comment */`\n/* c */\n"),
+    (
+        "a.py",
+        b'"""Module\ndoc"""\nimport os\n\ndef f():\n    """Doc."""\n    return 1\n',
+    ),
+    ("a.py", b'x = """a\nb"""\ny = f(\n    """c\nd"""\n)\n'),
+    ("a.py", b"# c\nx = '#'  # c\ns = r'\\d' # c\n"),
+    ("a.py", b"def f():\n    '''single\n    quoted doc'''\n    pass\n"),
+    ("a.rb", b"# c\nx = '#' # c\nputs \"a\"\n"),
+    ("a.lua", b"-- c\n--[[ a\nb ]]\nx = [[a\nb]]\n"),
+    ("a.f90", b"! c\nx = 1 ! c\ny = '!'\n"),
+    ("a.php", b"<?php\n# c\n// c\n/* c */\n$x = 1;\n"),
+]
+
+
+class TestCountNloc:
+    """Test lines of code by the rules of each language family"""
+
+    @pytest.mark.parametrize("file_name,content", FIXTURES)
+    def test_matches_lizard(self, file_name, content):
+        """The fixtures count exactly as lizard counts them"""
+        assert count_nloc(file_name, content) == lizard_nloc(file_name, content)
+
+    def test_empty_content(self):
+        assert count_nloc("a.py", b"") == 0
+        assert count_nloc("a.c", b"\n\n  \n") == 0
+
+    def test_unterminated_comment_and_string(self):
+        """What follows an opening that never closes counts as code"""
+        assert count_nloc("a.c", b"int x;\n/* open\nint y;\n") == 3
+        assert count_nloc("a.py", b'x = 1\ny = """open\nz = 2\n') == 3
+
+    def test_within_tolerance_of_lizard_on_real_files(self):
+        """Real files stay within one percent of lizard's total"""
+        ours = theirs = 0
+        for path in FIXTURE_FILES:
+            content = path.read_bytes()
+            ours += count_nloc(path.name, content)
+            theirs += lizard_nloc(path.name, content)
+
+        assert len(FIXTURE_FILES) >= 5
+        assert abs(ours - theirs) <= theirs * 0.01
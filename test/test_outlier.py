@@ -1,6 +1,10 @@
 from git_outlier.git_outlier import *
+import io
+import random
+import tracemalloc
 from unittest.mock import patch
 from unittest.mock import Mock
+import pytest
 
 
 def test_get_file_name_from_git_log_line():
@@ -29,6 +33,114 @@ def test_get_file_occurences_from_git_log():
     assert file_occurences["filename3"] == 3
 
 
+def test_get_file_occurences_from_bytes_log():
+    # When
+    file_occurences, file_names = parse_churn_from_log(
+        b"1\t2\tb.py\n3\t4\ta.py\n-\t-\tb.py\n5\t6\t\xc3\xa9.py\n"
+    )
+
+    # Then
+    assert file_occurences == {"b.py": 2, "a.py": 1, "\u00e9.py": 1}
+    assert file_names == ["b.py", "a.py", "\u00e9.py"]
+
+
+def test_path_table_interns_paths():
+    # When
+    table = PathTable()
+    first = table.add(b"a.py")
+    second = table.add(b"b.py", 3)
+    again = table.add(b"a.py")
+
+    # Then
+    assert first == again == 0
+    assert second == 1
+    assert len(table) == 2
+    assert table.as_dict() == {"a.py": 2, "b.py": 3}
+
+
+def test_parse_churn_across_chunks():
+    # When
+    log = b"".join(b"1\t1\tfile%d.py\n" % (index % 7) for index in range(1000))
+    chunks = list(iterate_log_chunks(log, chunk_size=100))
+    churn, _ = parse_churn_from_log(log)
+
+    # Then
+    assert b"".join(chunks) == log
+    assert all(chunk.endswith(b"\n") for chunk in chunks)
+    assert sum(churn.values()) == 1000
+
+
+def test_get_file_occurences_from_nul_separated_log():
+    # When
+    file_occurences, file_names = parse_churn_from_log(
+        b"1\t0\ta b.py\x000\t0\t\x00\xc3\xa9.py\x00f.py\x00"
+        b"1\t0\ta b.py\x00-\t-\t\xff.bin\x00"
+    )
+
+    # Then
+    assert file_occurences == {"a b.py": 2, "f.py": 1, "\udcff.bin": 1}
+    assert file_names == ["a b.py", "f.py", "\udcff.bin"]
+    assert file_names[2].encode("utf-8", "surrogateescape") == b"\xff.bin"
+
+
+def test_iterate_numstat_paths_across_chunk_boundaries():
+    # When
+    log = b"1\t2\tsrc/a b.py\x003\t4\t\x00old.py\x00new.py\x00" * 50
+    expected = [b"src/a b.py", b"new.py"] * 50
+    for size in [1, 3, 7, 64]:
+        chunks = [log[start : start + size] for start in range(0, len(log), size)]
+        paths = [path for paths in iterate_numstat_paths(chunks) for path in paths]
+
+        # Then
+        assert paths == expected
+
+
+def test_resolve_numstat_path_of_renamed_and_quoted_paths():
+    # Then
+    assert resolve_numstat_path(b"a b.py") == b"a b.py"
+    assert resolve_numstat_path(b"old.py => new.py") == b"new.py"
+    assert resolve_numstat_path(b"src/{a => b}/f.py") == b"src/b/f.py"
+    assert resolve_numstat_path(b"src/{ => b}/f.py") == b"src/b/f.py"
+    assert resolve_numstat_path(b"src/{a => }/f.py") == b"src/f.py"
+    assert resolve_numstat_path(b'"\\303\\251 \\"q\\".py"') == b'\xc3\xa9 "q".py'
+
+
+def test_split_log_at_commit_boundaries():
+    # Given
+    log = b"commit 1\n\n1\t1\ta.py\n" * 50 + b"commit 2\n\n1\t1\tb.py\n"
+    separator = get_commit_separator(log)
+
+    # When
+    ranges = list(split_log(log, 40, separator))
+
+    # Then
+    assert separator == (b"\ncommit ", 1)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(log)
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    assert all(log.startswith(b"commit ", start) for start, _ in ranges)
+    assert len(ranges) > 1
+
+
+def test_get_commit_separator_by_log_format():
+    # Then
+    assert get_commit_separator(b"\x01\x001\t1\ta.py\x00") == (b"\x01", 0)
+    assert get_commit_separator(b"commit 1\n\n1\t1\ta.py\x00") == (b"\0commit ", 1)
+    assert get_commit_separator(b"1\t1\ta.py\n") == (b"\n", 1)
+    assert get_commit_separator(b"1 a\n1\t1\ta.py\x00") is None
+
+
+def test_count_log_paths_of_plain_numstat_lines():
+    # Given
+    log = (
+        b"commit 1\nDate: 1\t2\t3\n\n    12\t3\tin the message\n\n"
+        b"1\t1\ta.py\r\n-\t-\tb.bin\n2\t0\t{x => y}/a.py\n1\t0\ty/a.py\n"
+    )
+
+    # Then
+    assert count_log_paths(log, False) == {b"a.py": 1, b"b.bin": 1, b"y/a.py": 2}
+    assert count_log_paths(log, False, log.index(b"-\t")) == {b"b.bin": 1, b"y/a.py": 2}
+
+
 def test_ordered_list_with_files():
     # When
     subject = sort_by_occurrence({"filename": 2, "filename2": 1, "filename3": 3})
@@ -138,6 +250,11 @@ def test_argument_parser():
     assert subject.languages == supported_languages_list
     assert subject.path == "."
 
+    assert subject.metric == ["CCN"]
+
+    subject = parse_arguments([".", "--metric", "CCN,NLOC"])
+    assert subject.metric == ["CCN", "NLOC"]
+
     subject = parse_arguments([".", "-l", "cpp", "-l", "python"])
     assert subject.since is None
     assert subject.until is None
@@ -145,6 +262,70 @@ def test_argument_parser():
     assert subject.path == "."
 
 
+def test_parse_arguments_with_whitespace_metrics():
+    subject = parse_arguments(["--metric", "WHITESPACE,WHITESPACE_MEAN"])
+    assert "yaml" in subject.languages
+    assert ".yml" in get_file_endings_for_languages(subject.languages)
+
+    subject = parse_arguments(["--metric", "WHITESPACE", "-l", "sql", "-l", "python"])
+    assert subject.languages == ["sql", "python"]
+
+    # Lizard cannot parse YAML, and CCN needs lizard
+    with pytest.raises(SystemExit):
+        parse_arguments(["--metric", "CCN,WHITESPACE", "-l", "yaml"])
+    assert "yaml" not in parse_arguments(["--metric", "CCN,WHITESPACE"]).languages
+
+
+def test_get_engine_for_metrics():
+    assert get_engine_for_metrics(["WHITESPACE"]) == WHITESPACE_ENGINE
+    assert get_engine_for_metrics(["WHITESPACE_MEAN", "WHITESPACE"]) == (
+        WHITESPACE_ENGINE
+    )
+    assert get_engine_for_metrics(["WHITESPACE", "NLOC"]) == NLOC_ENGINE
+    assert get_engine_for_metrics(["NLOC"]) == NLOC_ENGINE
+    assert get_engine_for_metrics(["CCN", "NLOC"]) == LIZARD_ENGINE
+    assert get_engine_for_metrics(["CCN"]) == LIZARD_ENGINE
+
+
+def test_whitespace_engine_skips_lizard(tmp_path):
+    source = tmp_path / "deploy.yaml"
+    source.write_bytes(b"steps:\n  - run: |\n      make\n")
+    with patch("git_outlier.git_outlier.run_analyzer_on_file") as analyzer:
+        metrics = analyze_file(str(source), engine=WHITESPACE_ENGINE)
+    analyzer.assert_not_called()
+    assert (metrics.whitespace, metrics.text_lines) == (2.0, 3)
+    assert metrics.whitespace_mean == 0.67
+    assert metrics.ccn == 0
+
+    source = tmp_path / "f.py"
+    source.write_bytes(b"def f(x):\n    if x:\n        return 1\n")
+    metrics = analyze_file(str(source))
+    assert (metrics.ccn, metrics.whitespace, metrics.text_lines) == (2, 3.0, 3)
+    assert analyze_file(str(source), b"x = 1\n").whitespace == 0.0
+
+    assert get_blob_cache_key("f.py", "1" * 40) == "1" * 40 + ".py"
+    assert get_blob_cache_key("f.py", "1" * 40, WHITESPACE_ENGINE) == (
+        "1" * 40 + ":whitespace"
+    )
+
+
+def test_nloc_engine_skips_lizard(tmp_path):
+    source = tmp_path / "f.py"
+    source.write_bytes(b'def f(x):\n    """Doc."""\n    # c\n\n    return x\n')
+    with patch("git_outlier.git_outlier.run_analyzer_on_file") as analyzer:
+        metrics = analyze_file(str(source), engine=NLOC_ENGINE)
+        complexity = get_complexity_for_file_list([str(source)], "NLOC")
+    analyzer.assert_not_called()
+    assert (metrics.nloc, metrics.ccn, metrics.text_lines) == (2, 0, 4)
+    assert complexity == {str(source): 2}
+    assert get_blob_cache_key("f.py", "1" * 40, NLOC_ENGINE) == "1" * 40 + ".py:nloc"
+
+    # Lizard counts a little differently, the NLOC engine keeps its own counts
+    cache = {get_blob_cache_key("f.py", "1" * 40): metrics._replace(nloc=3)}
+    assert get_cached_metrics(cache, "f.py", "1" * 40, NLOC_ENGINE) is None
+    assert get_cached_metrics(cache, "f.py", "1" * 40, WHITESPACE_ENGINE).nloc == 3
+
+
 def test_get_outliers_output():
     subject = get_outliers_output([])
     assert subject == "No outliers were found.\n"
@@ -153,18 +334,41 @@ def test_get_outliers_output():
     assert subject == "foo\nbar\n"
 
 
-@patch("sys.exit")
 @patch("git_outlier.git_outlier.run_analyzer_on_file")
 @patch("os.path.isfile", return_value=True)
-def test_get_complexity_for_file_list(mock_io, mock_run_analyzer, mock_sys_exit):
+def test_get_complexity_for_file_list(mock_io, mock_run_analyzer):
     assert mock_io is os.path.isfile
     file_list = ["test.py"]
     subject = get_complexity_for_file_list(file_list, "CCN")
     mock_io.assert_called_once_with(file_list[0])
     mock_run_analyzer.assert_called_once_with("test.py")
 
-    subject = get_complexity_for_file_list(["test.py"], "Does not exist")
-    mock_sys_exit.assert_called_once()
+    with pytest.raises(InvalidArgumentError):
+        get_complexity_for_file_list(["test.py"], "Does not exist")
+
+
+def test_select_complexity_metric():
+    metrics = {
+        "a.py": FileMetrics(
+            ccn=7,
+            nloc=40,
+            token_count=300,
+            function_count=3,
+            max_ccn=4,
+            average_ccn=2.3,
+        )
+    }
+    assert select_complexity_metric(metrics, "CCN") == {"a.py": 7}
+    assert select_complexity_metric(metrics, "NLOC") == {"a.py": 40}
+    assert select_complexity_metric(metrics, "TOKENS") == {"a.py": 300}
+    assert select_complexity_metric(metrics, "FUNCTIONS") == {"a.py": 3}
+    assert select_complexity_metric(metrics, "MAX_CCN") == {"a.py": 4}
+    assert select_complexity_metric(metrics, "AVG_CCN") == {"a.py": 2.3}
+    assert select_complexity_metric(metrics, "WHITESPACE") == {"a.py": 0.0}
+
+    metrics = {"a.yaml": FileMetrics(0, 0, 0, 0, 0, 0.0, 7.5, 3)}
+    assert select_complexity_metric(metrics, "WHITESPACE") == {"a.yaml": 7.5}
+    assert select_complexity_metric(metrics, "WHITESPACE_MEAN") == {"a.yaml": 2.5}
 
 
 def test_convert_analysis_to_plot_data():
@@ -207,15 +411,467 @@ def test_combine_churn_and_complexity():
 def test_get_git_log_in_current_directory(mock_subprocess_popen):
     assert mock_subprocess_popen is subprocess.Popen
     process = Mock()
-    process.communicate.return_value = "foo", "bar"
+    process.communicate.return_value = b"foo", b"bar"
     process.returncode = 0  # Mock successful git command
     mock_subprocess_popen.return_value = process
     subject = get_git_log_in_current_directory("12345")
 
-    assert subject == "foo"
+    assert subject == b"foo"
     mock_subprocess_popen.assert_called_once_with(
-        ["git", "log", "--numstat", "--no-merges", "--since=12345", "--pretty="],
+        [
+            "git",
+            "log",
+            "--numstat",
+            "-z",
+            "--no-merges",
+            "--since=12345",
+            "--pretty=format:\x01",
+        ],
+        cwd=None,
         stdout=-1,
         stderr=-1,
-        universal_newlines=True,
     )
+
+
+def test_get_git_log_command_with_revisions():
+    subject = get_git_log_command(None, revisions="main..HEAD")
+    assert subject == [
+        "git",
+        "log",
+        "--numstat",
+        "-z",
+        "--no-merges",
+        "--pretty=format:\x01",
+        "main..HEAD",
+    ]
+
+    subject = get_git_log_command("2023-01-01", "2023-12-31", ["a.py"])
+    assert subject == [
+        "git",
+        "log",
+        "--numstat",
+        "-z",
+        "--no-merges",
+        "--since=2023-01-01",
+        "--until=2023-12-31",
+        "--pretty=format:\x01",
+        "--",
+        ":(literal)a.py",
+    ]
+
+
+def test_parse_sample_size():
+    assert parse_sample_size("0.1") == 0.1
+    assert parse_sample_size("500") == 500
+    assert get_sample_count(0.1, 1234) == 123
+    assert get_sample_count(500, 100) == 100
+    with pytest.raises(ValueError):
+        parse_sample_size("1.5")
+    with pytest.raises(ValueError):
+        parse_sample_size("0")
+
+
+def test_get_churn_interval():
+    # A full sample is exact
+    assert get_churn_interval(7, 100, 100) == (7.0, 7.0)
+
+    lower, upper = get_churn_interval(10, 100, 1000)
+    assert 10 <= lower < 100 < upper <= 910
+
+
+def test_get_rank_intervals():
+    intervals = {"a.py": (90.0, 110.0), "b.py": (40.0, 95.0), "c.py": (10.0, 20.0)}
+    assert get_rank_intervals(intervals) == {
+        "a.py": (1, 2),
+        "b.py": (1, 2),
+        "c.py": (3, 3),
+    }
+
+
+def test_merge_file_metrics():
+    first = FileMetrics(10, 100, 500, 4, 6, 2.5)
+    second = FileMetrics(3, 20, 80, 1, 3, 3.0)
+
+    merged = merge_file_metrics(first, second)
+
+    assert merged == FileMetrics(13, 120, 580, 5, 6, 2.6)
+    merged = merge_file_metrics(
+        first._replace(whitespace=6.0, text_lines=10),
+        second._replace(whitespace=1.5, text_lines=5),
+    )
+    assert (merged.whitespace, merged.text_lines, merged.whitespace_mean) == (
+        7.5,
+        15,
+        0.5,
+    )
+    assert (
+        merge_file_metrics(
+            FileMetrics(0, 5, 9, 0, 0, 0.0), FileMetrics(0, 1, 2, 0, 0, 0.0)
+        ).average_ccn
+        == 0.0
+    )
+
+
+def test_parse_rollup_depth():
+    assert parse_rollup_depth("auto") == "auto"
+    assert parse_rollup_depth("2") == 2
+    with pytest.raises(ValueError):
+        parse_rollup_depth("0")
+    with pytest.raises(ValueError):
+        parse_rollup_depth("deep")
+
+
+def test_get_rollup_data():
+    churn = {"a/x.py": 5, "a/y.py": 1, "b/z.py": 2, "top.py": 9, "notes.txt": 4}
+    metrics = {
+        "a/x.py": FileMetrics(10, 100, 500, 4, 6, 2.5),
+        "a/y.py": FileMetrics(3, 20, 80, 1, 3, 3.0),
+        "b/z.py": FileMetrics(1, 5, 10, 1, 1, 1.0),
+        "top.py": FileMetrics(2, 8, 30, 1, 2, 2.0),
+    }
+    tree = build_rollup_tree(churn, metrics, list(churn))
+
+    rollup_churn, complexity, files, depth = get_rollup_data(tree, "MAX_CCN", 1)
+
+    assert depth == 1
+    assert rollup_churn == {"./*": 9, "a/": 6, "b/": 2}
+    assert complexity == {"./*": 2, "a/": 6, "b/": 1}
+    assert files == {"./*": 1, "a/": 2, "b/": 1}
+
+    rollup_churn, _, _, _ = get_rollup_data(tree, "CCN", "auto", "a", top=10)
+    assert rollup_churn == {"a/": 6}
+    with pytest.raises(InvalidArgumentError):
+        get_rollup_data(tree, "CCN", 1, "c")
+
+
+def test_print_rollup_report(capsys):
+    churn = {"a/x.py": 5, "a/y.py": 1, "b/z.py": 2}
+    metrics = {
+        "a/x.py": FileMetrics(10, 100, 500, 4, 6, 2.5),
+        "a/y.py": FileMetrics(3, 20, 80, 1, 3, 3.0),
+        "b/z.py": FileMetrics(1, 5, 10, 1, 1, 1.0),
+    }
+    tree = build_rollup_tree(churn, metrics, list(churn))
+
+    print_rollup_report(tree, "CCN", "2023-01-01", 1)
+
+    output = capsys.readouterr().out
+    assert "Directory rollup" in output
+    assert "6       13         2      a/" in output
+    assert "Detected outlier directories" in output
+    assert output.rstrip().endswith("a/")
+
+
+def test_parse_memory_size():
+    assert parse_memory_size("512M") == 512 << 20
+    assert parse_memory_size("2g") == 2 << 30
+    assert parse_memory_size("1.5K") == 1536
+    assert parse_memory_size("4096") == 4096
+    with pytest.raises(ValueError):
+        parse_memory_size("lots")
+    with pytest.raises(ValueError):
+        parse_memory_size("0M")
+
+
+def test_parse_churn_within_memory_matches_in_memory_parsing():
+    rng = random.Random(5)
+    records = []
+    for _ in range(3000):
+        number = int(rng.paretovariate(1.1)) % 400
+        ending = ".py" if number % 3 else ".txt"
+        records.append(f"1\t1\tdir{number % 7}/file{number}{ending}\0")
+    log = "".join(records).encode()
+    tracked = {f"dir{number % 7}/file{number}.py" for number in range(0, 400, 2)}
+    churn, file_names = parse_churn_from_chunks([log])
+    py_files = [name for name in file_names if name.endswith(".py")]
+
+    budget_churn, budget_names = parse_churn_within_memory(
+        [log[i : i + 100] for i in range(0, len(log), 100)], [".py"], tracked, 5, 4000
+    )
+
+    untracked = [name for name in py_files if name not in tracked]
+    top_untracked = sorted(untracked, key=lambda name: (churn[name], name))[-5:]
+    expected = [name for name in py_files if name in tracked or name in top_untracked]
+    assert budget_names == expected
+    assert budget_churn == {name: churn[name] for name in expected}
+    assert (
+        sort_by_occurrence(budget_churn)[:5]
+        == [item for item in sort_by_occurrence(churn) if item[0].endswith(".py")][:5]
+    )
+
+
+def test_parse_churn_within_memory_counts_within_the_budget():
+    """The peak while counting, spilled runs and their merge included, fits"""
+
+    def chunks():
+        for start in range(0, 20000, 1000):
+            yield "".join(
+                f"1\t1\tdir{number % 97}/file{number}.py\0"
+                for number in range(start, start + 1000)
+            ).encode()
+
+    tracemalloc.start()
+    try:
+        churn, _ = parse_churn_within_memory(chunks(), [".py"], set(), 5, 1 << 19)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert len(churn) == 5
+    assert peak < 1 << 19
+
+
+def test_get_outlier_candidates():
+    churn = {f"file{number}.py": number for number in range(1, 21)}
+    churn["deleted.py"] = 100
+    index = {
+        file_name: IndexEntry("0" * 40, 10, True)
+        for file_name in churn
+        if file_name != "deleted.py"
+    }
+    file_names = list(churn)
+
+    candidates, skipped = get_outlier_candidates(churn, file_names, index)
+
+    # Above half the maximum of the files that get metrics, deleted.py has none
+    assert candidates == [f"file{number}.py" for number in range(11, 21)]
+    assert skipped == 10
+
+    candidates, skipped = get_outlier_candidates(
+        churn, file_names, index, "percentile:90"
+    )
+    assert candidates == ["file19.py", "file20.py"]
+    assert skipped == 18
+
+
+def test_order_by_churn():
+    churn = {"a.py": 2, "b.py": 5, "c.py": 2}
+    assert order_by_churn(["a.py", "b.py", "c.py", "new.py"], churn) == [
+        "b.py",
+        "a.py",
+        "c.py",
+        "new.py",
+    ]
+
+
+def test_order_by_size():
+    index = {
+        "small.py": IndexEntry("0" * 40, 10, True),
+        "large.py": IndexEntry("1" * 40, 900, True),
+        "medium.py": IndexEntry("2" * 40, 80, True),
+        "same.py": IndexEntry("3" * 40, 80, True),
+    }
+    file_names = ["small.py", "medium.py", "deleted.py", "large.py", "same.py"]
+    assert order_by_size(file_names, index) == [
+        "large.py",
+        "medium.py",
+        "same.py",
+        "small.py",
+        "deleted.py",
+    ]
+
+
+def test_get_analysis_coverage():
+    churn = {"a.py": 6, "b.py": 3, "c.py": 1, "deleted.py": 50}
+    index = {
+        file_name: IndexEntry("0" * 40, 10, True)
+        for file_name in ["a.py", "b.py", "c.py"]
+    }
+    metrics = {"a.py": Mock(), "c.py": Mock()}
+
+    coverage = get_analysis_coverage(list(churn), index, churn, metrics)
+
+    # deleted.py is not in the index, it would never get metrics
+    assert coverage == AnalysisCoverage(2, 3, 7, 10)
+    assert coverage.churn_share == 0.7
+    assert not coverage.complete
+    assert AnalysisCoverage(0, 0, 0, 0).complete
+
+
+def test_tracked_files_past_the_deadline_only_come_from_the_cache():
+    index = {
+        "cached.py": IndexEntry("1" * 40, 10, True),
+        "new.py": IndexEntry("2" * 40, 10, True),
+    }
+    cache = {get_blob_cache_key("cached.py", "1" * 40): Mock()}
+    with patch("git_outlier.git_outlier.run_analyzer_on_file") as analyzer:
+        metrics = get_metrics_for_tracked_files(
+            ["new.py", "cached.py"], index, cache, deadline=time.monotonic()
+        )
+    assert list(metrics) == ["cached.py"]
+    analyzer.assert_not_called()
+
+
+def test_tracked_files_are_analyzed_one_at_a_time_until_the_deadline():
+    """No batch is analyzed past the deadline, progress counts analyzed files"""
+    index = {
+        f"f{number}.py": IndexEntry(f"{number:040}", 10, True) for number in range(40)
+    }
+    clock = [0.0]
+    analyzed = []
+
+    def slow_analyzer(files, engine):
+        analyzed.extend(file_name for file_name, _ in files)
+        clock[0] += len(files)
+        return [FileMetrics(1, 1, 1, 1, 1, 1.0)] * len(files)
+
+    progress = Mock()
+    with patch("git_outlier.git_outlier.analyze_files", side_effect=slow_analyzer):
+        with patch("git_outlier.git_outlier.read_file", return_value=b""):
+            with patch("git_outlier.git_outlier.time.monotonic", lambda: clock[0]):
+                metrics = get_metrics_for_tracked_files(
+                    list(index), index, {}, progress, deadline=2.5
+                )
+    assert analyzed == ["f0.py", "f1.py", "f2.py"]
+    assert list(metrics) == analyzed
+    assert sum(call.args[0] for call in progress.update.call_args_list) == 40
+
+
+def test_worker_results_past_the_deadline_are_cancelled():
+    index = {
+        file_name: IndexEntry("0" * 40, 10, True)
+        for file_name in ["done.py", "waiting.py"]
+    }
+    done = Future()
+    done.set_result([Mock()])
+    waiting = Future()
+    batches = WorkerBatches(Mock(), 1)
+    batches.futures = {done: ["done.py"], waiting: ["waiting.py"]}
+    metrics = {}
+
+    finished = collect_worker_results(
+        batches, index, {}, metrics, deadline=time.monotonic()
+    )
+
+    assert not finished
+    assert list(metrics) == ["done.py"]
+    assert waiting.cancelled()
+
+
+def test_terminate_workers_stops_running_analyses():
+    executor = ProcessPoolExecutor(max_workers=2)
+    running = [executor.submit(time.sleep, 60) for _ in range(3)]
+    while not all(future.running() for future in running[:2]):
+        time.sleep(0.01)
+    started = time.monotonic()
+
+    terminate_workers(executor)
+    executor.shutdown(wait=True)
+
+    assert time.monotonic() - started < 10
+    assert all(future.done() for future in running)
+
+
+def test_unreadable_files_raise_the_library_error_from_workers(tmp_path):
+    missing = str(tmp_path / "missing.py")
+    with pytest.raises(GitOutlierError, match="Cannot read"):
+        analyze_file(missing)
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(analyze_files_in_worker, [missing])
+        with pytest.raises(GitOutlierError, match="Cannot read"):
+            future.result()
+
+
+def test_worker_batches_grow_once_every_worker_is_busy():
+    executor = Mock()
+    executor.submit.side_effect = lambda *args: Future()
+    batches = WorkerBatches(executor, 2)
+    for number in range(20):
+        batches.add(f"file{number}.py")
+    assert [len(names) for names in batches.futures.values()] == [
+        1,
+        1,
+        2,
+        2,
+        3,
+        3,
+        4,
+        4,
+    ]
+
+    batches = WorkerBatches(executor, 1, NLOC_ENGINE)
+    for number in range(1000):
+        batches.add(f"file{number}.py")
+    batches.submit()
+    assert max(map(len, batches.futures.values())) == NlocPlugin.batch_size
+    assert sum(map(len, batches.futures.values())) == 1000
+
+
+def test_analyzer_plugins():
+    assert get_analyzer_names()[:3] == ["lizard", "whitespace", "nloc"]
+    assert ".yaml" in get_analyzer_endings("whitespace", ["WHITESPACE"])
+    assert ".yaml" not in get_analyzer_endings("lizard", ["CCN", "NLOC"])
+    with pytest.raises(InvalidArgumentError):
+        get_analyzer_endings("nloc", ["CCN"])
+    with pytest.raises(InvalidArgumentError):
+        get_analyzer_plugin_class("does-not-exist")
+    assert get_engine_for_metrics(["NLOC", "WHITESPACE_MEAN"]) == NLOC_ENGINE
+
+    files = [("a.py", b"x = 1\n"), ("b.c", b"int f() { return 0; }\n")]
+    assert [record.nloc for record in analyze_files(files)] == [1, 1]
+    assert analyze_files([]) == []
+    with patch.object(NlocPlugin, "analyze_batch", return_value=[]):
+        with pytest.raises(GitOutlierError):
+            analyze_files(files, NLOC_ENGINE)
+    with pytest.raises(TypeError):
+        AnalyzerPlugin()
+
+
+def test_plugin_results_are_cached_by_plugin_and_version():
+    class VersionedPlugin(AnalyzerPlugin):
+        version = "2.1"
+
+        def analyze_batch(self, files):
+            return []
+
+    blob_id = "1" * 40
+    cache = {get_blob_cache_key("a.py", blob_id): FileMetrics(1, 2, 3, 4, 5, 6.0)}
+    with patch(
+        "git_outlier.git_outlier.get_analyzer_plugin_class",
+        return_value=VersionedPlugin,
+    ):
+        get_analyzer_plugin_version.cache_clear()
+        key = get_blob_cache_key("a.py", blob_id, "tool")
+        # Lizard's results are not the plugin's
+        assert get_cached_metrics(cache, "a.py", blob_id, "tool") is None
+    get_analyzer_plugin_version.cache_clear()
+    assert key == blob_id + ".py:tool@2.1"
+
+
+def test_outlier_candidates_contain_every_outlier():
+    rng = random.Random(7)
+    churn = {f"file{number}.py": rng.randrange(1, 50) for number in range(200)}
+    complexity = {file_name: rng.randrange(0, 300) for file_name in churn}
+    index = {file_name: IndexEntry("0" * 40, 10, True) for file_name in churn}
+    for threshold in ["half-max", "percentile:80", "iqr", "mad:1"]:
+        candidates, _ = get_outlier_candidates(churn, list(churn), index, threshold)
+        outliers = find_churn_and_complexity_outliers(
+            complexity, churn, list(churn), threshold
+        )
+        assert outliers <= set(candidates)
+
+
+def test_stream_without_separator_is_one_chunk():
+    """A log that cannot be split comes back whole, joined from every read"""
+    stream = io.BytesIO(b"bcdefg")
+    with patch("git_outlier.git_outlier.LOG_FILE_CHUNK_SIZE", 2):
+        assert list(iterate_stream_chunks(stream, b"a", None)) == [b"abcdefg"]
+        assert list(iterate_stream_chunks(io.BytesIO(), b"", None)) == []
+
+
+def test_outliers_only_finds_the_outliers_of_a_full_run():
+    """Pruned runs match the full run, for the only policy they accept"""
+    churn = {f"f{number}.py": number for number in range(1, 101)}
+    complexity = {file_name: 3 * count for file_name, count in churn.items()}
+    index = {file_name: IndexEntry("0" * 40, 10, True) for file_name in churn}
+    # A quantile of the complexity of all files cannot be taken over the candidates
+    for threshold in ["percentile:90", "iqr", "mad:1"]:
+        with pytest.raises(SystemExit):
+            parse_arguments(["--outliers-only", f"--threshold={threshold}", "."])
+
+    assert parse_arguments(["--outliers-only", "."]).threshold == "half-max"
+    candidates, _ = get_outlier_candidates(churn, list(churn), index)
+    pruned = {file_name: complexity[file_name] for file_name in candidates}
+    outliers = find_churn_and_complexity_outliers(complexity, churn, list(churn))
+    assert find_churn_and_complexity_outliers(pruned, churn, list(churn)) == outliers
+    assert len(outliers) == 49
@@ -3,7 +3,13 @@ Test plot and diagram generation functions for git-outlier.
 """
 
 import pytest
-from git_outlier.git_outlier import convert_analysis_to_plot_data, get_diagram_output
+from git_outlier.git_outlier import (
+    convert_analysis_to_plot_data,
+    get_diagram_output,
+    get_axis_threshold,
+    get_thresholds,
+    parse_threshold_policy,
+)
 
 
 class TestDiagramGeneration:
@@ -96,3 +102,72 @@ class TestDiagramGeneration:
         assert "xAxis" in result
         assert "o" in result  # outlier marker
         assert "." in result  # point marker
+
+
+class TestThresholdPolicies:
+    """Test quantile based outlier thresholds"""
+
+    def test_parse_threshold_policy(self):
+        """Policies parse with and without a parameter"""
+        assert parse_threshold_policy("half-max") == ("half-max", 0.0)
+        assert parse_threshold_policy("percentile") == ("percentile", 90.0)
+        assert parse_threshold_policy("percentile:75") == ("percentile", 75.0)
+        assert parse_threshold_policy("mad:3") == ("mad", 3.0)
+        for invalid in ["bogus", "percentile:100", "iqr:x"]:
+            with pytest.raises(ValueError):
+                parse_threshold_policy(invalid)
+
+    def test_axis_thresholds(self):
+        """Each policy computes its threshold from the distribution"""
+        values = list(range(1, 101))
+        assert get_axis_threshold(values, "half-max") is None
+        assert get_axis_threshold(values, "percentile:90") == 90
+        assert get_axis_threshold(values, "iqr") == 75 + 1.5 * 50
+        assert get_axis_threshold([1, 2, 3, 4, 100], "mad:3.5") == pytest.approx(
+            3 + 3.5 / 0.6745
+        )
+
+    def test_mad_of_zero_falls_back_to_mean_deviation(self):
+        """A majority of equal values does not make every other value an outlier"""
+        values = [1] * 90 + list(range(2, 12))
+        threshold = get_axis_threshold(values, "mad:3")
+        assert threshold == pytest.approx(1 + 3 * 1.253314 * 0.55)
+        assert [value for value in values if value > threshold] == list(range(4, 12))
+        assert get_axis_threshold([5] * 10, "mad") == 5
+
+    def test_giant_file_does_not_hide_other_outliers(self):
+        """A percentile threshold is not dominated by the maximum"""
+        data = {
+            f"file{index}.py": {"Churn": index, "Complexity": index}
+            for index in range(1, 21)
+        }
+        data["giant.py"] = {"Churn": 1000, "Complexity": 1000}
+
+        _, _, half_max_outliers = convert_analysis_to_plot_data(
+            data, "Churn", "Complexity", 70, 30
+        )
+        x_threshold, y_threshold = get_thresholds(
+            data, "Churn", "Complexity", "percentile:80"
+        )
+        _, _, percentile_outliers = convert_analysis_to_plot_data(
+            data, "Churn", "Complexity", 70, 30, x_threshold, y_threshold
+        )
+
+        assert list(half_max_outliers) == ["giant.py"]
+        assert set(percentile_outliers) == {
+            "file18.py",
+            "file19.py",
+            "file20.py",
+            "giant.py",
+        }
+
+    def test_get_diagram_output_with_threshold_lines(self):
+        """Threshold lines are drawn around the points"""
+        points_to_plot = {0: [0], 1: None, 2: None}
+        outliers_to_plot = {0: None, 1: None, 2: [2]}
+
+        result = get_diagram_output(
+            points_to_plot, outliers_to_plot, 2, 2, "xAxis", "yAxis", 1, 1
+        )
+
+        assert result == "yAxis\n| :o\n|-+-\n|.: \n---xAxis"
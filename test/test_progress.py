@@ -0,0 +1,76 @@
+"""
+Tests for the progress reporter.
+"""
+
+import io
+
+from git_outlier.progress import (
+    ProgressReporter,
+    format_duration,
+    format_size,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProgressReporter:
+    """Test throttling and the content of the progress lines"""
+
+    def test_disabled_reporter_writes_nothing(self):
+        """A disabled reporter ignores every call"""
+        stream = io.StringIO()
+        progress = ProgressReporter(False, stream)
+        progress.start("complexity", "files", 10)
+        progress.update(5)
+        progress.finish()
+
+        assert stream.getvalue() == ""
+        assert list(progress.track_chunks([b"a", b"b"])) == [b"a", b"b"]
+
+    def test_reports_are_throttled(self):
+        """At most one line per interval, and a final line per stage"""
+        stream = io.StringIO()
+        clock = FakeClock()
+        progress = ProgressReporter(True, stream, interval=2.0, clock=clock)
+        progress.start("complexity", "files", 4, 400)
+        progress.update(1, 100)
+        clock.now = 1.0
+        progress.update(1, 100)
+        assert stream.getvalue() == ""
+
+        clock.now = 2.0
+        progress.update(0, 0)
+        clock.now = 3.0
+        progress.update(1, 100)
+        progress.finish()
+
+        lines = stream.getvalue().splitlines()
+        assert lines == [
+            "complexity: 2/4 files, 1 files/s, 100 B/s, ETA 2s",
+            "complexity: 3/4 files, 1 files/s, 100 B/s, done in 3s",
+        ]
+
+    def test_track_chunks_counts_markers_and_bytes(self):
+        """Commits are counted from their marker bytes"""
+        stream = io.StringIO()
+        clock = FakeClock()
+        progress = ProgressReporter(True, stream, interval=1.0, clock=clock)
+        progress.start("git log", "commits", 3)
+        chunks = [b"\x01a\0b\0", b"\x01c\0\x01d\0"]
+
+        assert list(progress.track_chunks(chunks, b"\x01")) == chunks
+        assert progress.done == 3
+        assert progress.size == 11
+
+
+def test_format_size_and_duration():
+    assert format_size(512) == "512 B"
+    assert format_size(3 * 1024 * 1024) == "3.0 MiB"
+    assert format_duration(75) == "1m15s"
+    assert format_duration(7300) == "2h01m"
@@ -0,0 +1,103 @@
+"""
+Tests for combining per-file values up the directory tree.
+"""
+
+import operator
+
+from git_outlier.rollup import (
+    build_directory_tree,
+    choose_rollup_depth,
+    find_directory,
+    get_rollup_units,
+    get_tree_depth,
+)
+
+FILES = {
+    "setup.py": 1,
+    "services/api/app.py": 2,
+    "services/api/routes/users.py": 4,
+    "services/web/main.py": 8,
+    "libs/core/util.py": 16,
+    "libs/README.py": 32,
+}
+
+
+class TestDirectoryTree:
+    """Test building and summing the directory tree"""
+
+    def test_totals_include_every_subdirectory(self):
+        """A directory total combines all files below it"""
+        root = build_directory_tree(FILES, operator.add)
+
+        assert root.total == 63
+        assert root.files == 6
+        assert root.own == 1
+        assert root.own_files == 1
+        services = find_directory(root, "services")
+        assert services.total == 14
+        assert services.own is None
+        assert find_directory(root, "services/api/").total == 6
+
+    def test_find_missing_directory(self):
+        """Paths that are not in the tree are not found"""
+        root = build_directory_tree(FILES, operator.add)
+
+        assert find_directory(root, "docs") is None
+        assert find_directory(root, "services/api/app.py/x") is None
+        assert find_directory(root, ".") is root
+
+    def test_deep_paths_do_not_recurse(self):
+        """Paths deeper than the recursion limit are summed"""
+        deep_path = "/".join(["d"] * 5000) + "/file.py"
+        root = build_directory_tree({deep_path: 1, "top.py": 1}, operator.add)
+
+        assert root.total == 2
+        assert get_tree_depth(root) == 5000
+
+
+class TestRollupUnits:
+    """Test cutting the tree at a depth"""
+
+    def test_first_level(self):
+        """Each top level directory and the files at the root are one unit each"""
+        root = build_directory_tree(FILES, operator.add)
+
+        units = {
+            unit.label: (unit.value, unit.files) for unit in get_rollup_units(root, 1)
+        }
+
+        assert units == {"./*": (1, 1), "services/": (14, 3), "libs/": (48, 2)}
+
+    def test_files_above_the_depth_keep_their_directory(self):
+        """Every file is counted exactly once, whatever the depth"""
+        root = build_directory_tree(FILES, operator.add)
+
+        units = {unit.label: unit.value for unit in get_rollup_units(root, 2)}
+
+        assert units == {
+            "./*": 1,
+            "services/api/": 6,
+            "services/web/": 8,
+            "libs/*": 32,
+            "libs/core/": 16,
+        }
+        assert sum(units.values()) == root.total
+
+    def test_drill_into_subtree(self):
+        """The depth counts from the chosen directory"""
+        root = build_directory_tree(FILES, operator.add)
+
+        units = get_rollup_units(find_directory(root, "services/api"), 1)
+
+        assert sorted(unit.label for unit in units) == [
+            "services/api/*",
+            "services/api/routes/",
+        ]
+
+    def test_choose_depth(self):
+        """Auto depth is the shallowest one with enough units"""
+        root = build_directory_tree(FILES, operator.add)
+
+        assert choose_rollup_depth(root, 3) == 1
+        assert choose_rollup_depth(root, 4) == 2
+        assert choose_rollup_depth(root, 100) == 3
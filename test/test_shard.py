@@ -0,0 +1,126 @@
+"""
+Tests for the partial-result shards of a distributed analysis.
+"""
+
+import itertools
+
+import pytest
+
+from git_outlier.shard import (
+    ChurnRecord,
+    Shard,
+    SliceCoverage,
+    get_path_part,
+    load_shard,
+    merge_shards,
+    parse_slice,
+    save_shard,
+)
+
+
+def make_shard(commit_part, file_part, churn, metrics, parts=3):
+    return Shard(
+        head="abc",
+        since="2024-01-01",
+        until=None,
+        endings=(".py",),
+        commits=SliceCoverage(parts, (commit_part,)),
+        files=SliceCoverage(parts, (file_part,)),
+        churn={name: ChurnRecord(*record) for name, record in churn.items()},
+        metrics=metrics,
+    )
+
+
+SHARDS = [
+    make_shard(0, 0, {"a.py": (2, 0, 1), "b.py": (1, 3, 0)}, {"a.py": (5, 10)}),
+    make_shard(1, 1, {"a.py": (1, 1, 0), "c.py": (4, 1, 1)}, {"c.py": (1, 2)}),
+    make_shard(2, 2, {"b.py": (3, 2, 0)}, {"b.py": (7, 8)}),
+]
+
+
+class TestSlices:
+    """Test slice parsing and assignment"""
+
+    def test_parse_slice(self):
+        """A slice is the i-th of n parts"""
+        assert parse_slice("1/4") == SliceCoverage(4, (1,))
+        assert parse_slice("0/1").complete
+        for text in ["4/4", "-1/4", "1", "a/b"]:
+            with pytest.raises(ValueError):
+                parse_slice(text)
+
+    def test_path_part_is_stable(self):
+        """Every file is in exactly one part, the same on every run"""
+        assert get_path_part("src/main.py", 4) == get_path_part("src/main.py", 4)
+        assert 0 <= get_path_part("src/\udcff.py", 4) < 4
+
+
+class TestMerge:
+    """Test merging shards"""
+
+    def test_merge_sums_churn_and_keeps_first_appearance(self):
+        """Counts add up, a file comes first where its newest commit is"""
+        merged = merge_shards(SHARDS)
+
+        assert merged.commits.complete and merged.files.complete
+        churn, file_names = merged.get_ordered_churn()
+        assert churn == {"a.py": 3, "c.py": 4, "b.py": 4}
+        assert file_names == ["a.py", "c.py", "b.py"]
+        assert merged.metrics == {"a.py": (5, 10), "c.py": (1, 2), "b.py": (7, 8)}
+
+    def test_merge_is_associative_and_commutative(self):
+        """Any grouping and order of the shards gives the same result"""
+        expected = merge_shards(SHARDS)
+        for first, second, third in itertools.permutations(SHARDS):
+            assert merge_shards([merge_shards([first, second]), third]) == expected
+            assert merge_shards([first, merge_shards([second, third])]) == expected
+
+    def test_overlapping_commit_slices_are_rejected(self):
+        """A commit slice counted twice would double its churn"""
+        with pytest.raises(ValueError, match="More than one shard"):
+            merge_shards([SHARDS[0], SHARDS[0]._replace(files=SHARDS[1].files)])
+
+    def test_overlapping_file_slices_are_allowed(self):
+        """Metrics are the same in every shard that analyzed a file"""
+        merged = merge_shards([SHARDS[0], SHARDS[1]._replace(files=SHARDS[0].files)])
+
+        assert merged.files == SliceCoverage(3, (0,))
+
+    def test_different_analyses_are_rejected(self):
+        """Shards of another HEAD, window or slicing do not merge"""
+        with pytest.raises(ValueError, match="head"):
+            merge_shards([SHARDS[0], SHARDS[1]._replace(head="def")])
+        with pytest.raises(ValueError, match="parts"):
+            merge_shards([SHARDS[0], make_shard(1, 1, {}, {}, parts=4)])
+        with pytest.raises(ValueError):
+            merge_shards([])
+
+
+class TestShardFile:
+    """Test writing and reading shard files"""
+
+    def test_round_trip(self, tmp_path):
+        """A saved shard reads back unchanged, odd paths included"""
+        shard = SHARDS[0]._replace(
+            churn={"é/\udcff.py": ChurnRecord(1, 0, 0)},
+            metrics={"é/\udcff.py": (1, 2, 3, 1, 1, 1.0, 2.0, 2)},
+        )
+        path = str(tmp_path / "shard.json")
+
+        save_shard(path, shard)
+
+        assert load_shard(path) == shard
+
+    def test_unknown_version_is_rejected(self, tmp_path):
+        """Shards of another format version are not read"""
+        path = tmp_path / "shard.json"
+        path.write_text('{"format": "git-outlier-shard", "version": 99}')
+
+        with pytest.raises(ValueError, match="version 99"):
+            load_shard(str(path))
+        # Written before the whitespace fields, the metrics would be short
+        path.write_text('{"format": "git-outlier-shard", "version": 1}')
+        with pytest.raises(ValueError, match="version 1 "):
+            load_shard(str(path))
+        with pytest.raises(ValueError, match="Cannot read shard"):
+            load_shard(str(tmp_path / "missing.json"))
@@ -0,0 +1,61 @@
+"""
+Tests for the fixed-memory streaming summaries.
+"""
+
+import random
+from collections import Counter
+
+import pytest
+
+from git_outlier.sketches import SpaceSaving
+
+
+class TestSpaceSaving:
+    """Test the Space-Saving heavy-hitter counter"""
+
+    def test_exact_when_capacity_is_not_exceeded(self):
+        """Counts are exact while every item fits"""
+        counter = SpaceSaving(10)
+        for item in ["a", "b", "a", "c", "a", "b"]:
+            counter.add(item)
+
+        assert counter.top(3) == [("a", 3, 0), ("b", 2, 0), ("c", 1, 0)]
+
+    def test_memory_is_bounded_by_capacity(self):
+        """Never monitors more items than its capacity"""
+        counter = SpaceSaving(5)
+        for value in range(1000):
+            counter.add(f"file{value}.py")
+
+        assert len(counter) == 5
+        assert counter.total == 1000
+
+    def test_error_bounds_hold(self):
+        """True count lies between count - error and count"""
+        rng = random.Random(42)
+        stream = [f"file{int(rng.paretovariate(1.2))}.py" for _ in range(20000)]
+        exact = Counter(stream)
+        counter = SpaceSaving(50)
+        for item in stream:
+            counter.add(item)
+
+        for item, count, error in counter.top(50):
+            assert count - error <= exact[item] <= count
+
+    def test_finds_heavy_hitters(self):
+        """Every item above total / capacity is reported"""
+        rng = random.Random(7)
+        stream = ["hot.py"] * 500 + ["warm.py"] * 300
+        stream += [f"cold{rng.randrange(5000)}.py" for _ in range(5000)]
+        rng.shuffle(stream)
+        counter = SpaceSaving(100)
+        for item in stream:
+            counter.add(item)
+
+        top_items = [item for item, _, _ in counter.top(2)]
+        assert top_items == ["hot.py", "warm.py"]
+
+    def test_invalid_capacity(self):
+        """Capacity must be positive"""
+        with pytest.raises(ValueError):
+            SpaceSaving(0)
@@ -0,0 +1,64 @@
+"""
+Tests for counting paths in bounded memory with sorted run files.
+"""
+
+import os
+import random
+from collections import Counter
+
+from git_outlier.spill import ENTRY_OVERHEAD, SpillingCounter
+
+
+def count_paths(paths, memory_budget, directory=None):
+    with SpillingCounter(memory_budget, directory) as counter:
+        for path in paths:
+            counter.add(path)
+        runs = len(counter.runs)
+        merged = list(counter.merged())
+    return merged, runs
+
+
+class TestSpillingCounter:
+    """Test the spilling counter against plain in-memory counting"""
+
+    def test_in_memory_without_spilling(self):
+        """A large budget never writes a run"""
+        merged, runs = count_paths([b"b.py", b"a.py", b"b.py"], 1 << 20)
+
+        assert runs == 0
+        assert merged == [(b"a.py", 1, 1), (b"b.py", 0, 2)]
+
+    def test_spilled_counts_are_exact(self, tmp_path):
+        """Counts and first positions match in-memory counting, whatever the budget"""
+        rng = random.Random(3)
+        paths = [
+            f"src/file{int(rng.paretovariate(1.2))}.py".encode() for _ in range(5000)
+        ]
+        first_seen = list(dict.fromkeys(paths))
+
+        merged, runs = count_paths(paths, 20 * ENTRY_OVERHEAD, str(tmp_path))
+
+        assert runs > 10
+        assert [(path, count) for path, _, count in merged] == sorted(
+            Counter(paths).items()
+        )
+        by_first_position = sorted(merged, key=lambda record: record[1])
+        assert [path for path, _, _ in by_first_position] == first_seen
+
+    def test_run_files_are_removed(self, tmp_path):
+        """Closing the counter deletes its run files"""
+        with SpillingCounter(1, str(tmp_path)) as counter:
+            for path in [b"a.py", b"b.py", b"a.py"]:
+                counter.add(path, 2)
+            assert len(counter.runs) == 3
+            assert list(counter.merged()) == [(b"a.py", 0, 4), (b"b.py", 1, 2)]
+
+        assert os.listdir(tmp_path) == []
+
+    def test_paths_with_any_bytes(self, tmp_path):
+        """Paths are stored with their length, so separators in them survive"""
+        paths = [b"a\nb.py", b"c\x00d.py", "é.py".encode(), b"a\nb.py"]
+
+        merged, _ = count_paths(paths, 1, str(tmp_path))
+
+        assert {path: count for path, _, count in merged} == Counter(paths)
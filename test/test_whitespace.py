@@ -0,0 +1,50 @@
+"""
+Tests for the indentation based complexity of text files.
+"""
+
+from git_outlier.whitespace import IndentationComplexity
+from git_outlier.whitespace import get_indentation_complexity, is_binary
+
+
+class TestIndentationComplexity:
+    """Test indentation measured over the whole buffer"""
+
+    def test_levels_of_four_columns(self):
+        """Every line counts its leading columns, four to a level"""
+        content = b"def f(x):\n    if x:\n        return 1\n  y = 2\n"
+
+        complexity = get_indentation_complexity(content)
+
+        assert complexity == IndentationComplexity(4, 3.5)
+        assert complexity.mean == 0.875
+
+    def test_blank_lines_do_not_count(self):
+        """Lines holding only whitespace are neither lines nor indentation"""
+        content = b"a:\n\n    \n  b: 1\r\n\t\n"
+
+        assert get_indentation_complexity(content) == IndentationComplexity(2, 0.5)
+
+    def test_tabs_advance_to_the_next_tab_stop(self):
+        """A tab after two spaces reaches column four, not six"""
+        assert get_indentation_complexity(b"\tx\n  \ty\n \t\tz\n") == (
+            IndentationComplexity(3, 4.0)
+        )
+        assert get_indentation_complexity(b"\tx\n", tab_width=8).total == 2.0
+
+    def test_empty_and_binary_content(self):
+        """Binary content counts as empty, like a file without lines"""
+        assert get_indentation_complexity(b"") == IndentationComplexity(0, 0.0)
+        assert get_indentation_complexity(b"").mean == 0.0
+        assert is_binary(b"\x89PNG\r\n\x1a\n\0\0\0\rIHDR")
+        assert not is_binary("    naïve = 1\n".encode())
+        assert get_indentation_complexity(b"    x\0\n") == (0, 0.0)
+
+    def test_any_text_format(self):
+        """YAML, SQL and shell are measured the same way"""
+        yaml = b"jobs:\n  build:\n    steps:\n      - run: make\n"
+        sql = b"SELECT a\n  FROM t\n WHERE b IN (\n    SELECT c FROM u)\n"
+        shell = b'for f in *; do\n  if [ -f "$f" ]; then\n    echo "$f"\n  fi\ndone\n'
+
+        assert get_indentation_complexity(yaml) == IndentationComplexity(4, 3.0)
+        assert get_indentation_complexity(sql) == IndentationComplexity(4, 1.75)
+        assert get_indentation_complexity(shell) == IndentationComplexity(5, 2.0)